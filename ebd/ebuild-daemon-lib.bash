@@ -31,6 +31,13 @@ __ebd_read_size() {
 		die "coms error in ${PKGCORE_EBD_PID}, read_size $@ failed w/ ${ret}"
 }
 
+# Source a payload passed by reference through the transfer file; opening it
+# via /dev/fd starts reading from the beginning regardless of the fd offset on
+# linux, elsewhere python resets the offset after writing.
+__ebd_source_transfer() {
+	source /dev/fd/${PKGCORE_EBD_TRANSFER_FD}
+}
+
 __ebd_read_cat_size() {
 	dd bs=$1 count=1 <&${PKGCORE_EBD_READ_FD}
 }
@@ -31,7 +31,7 @@ die() {
 }
 
 declare -rf __set_perf_debug
-declare -r PKGCORE_EBD_WRITE_FD PKGCORE_EBD_READ_FD
+declare -r PKGCORE_EBD_WRITE_FD PKGCORE_EBD_READ_FD PKGCORE_EBD_TRANSFER_FD
 
 __ebd_sigint_handler() {
 	EBD_DISABLE_DIEFUNC="yes"
@@ -191,6 +191,12 @@ __ebd_process_ebuild_phases() {
 			start_receiving_env*)
 				line=${line#start_receiving_env }
 				case ${line} in
+					fd*)
+						__IFS_push $'\0'
+						__ebd_source_transfer
+						cont=$?
+						__IFS_pop
+						;;
 					file*)
 						line=${line#file }
 						source "${line}"
@@ -295,11 +301,17 @@ __ebd_process_metadata() {
 		unset -v __mode
 		local __data
 		local __ret
-		__ebd_read_size "$1" __data
-		local IFS=$'\0'
-		eval "$__data"
-		__ret=$?
-		unset -v __data
+		if [[ $1 == fd\ * ]]; then
+			local IFS=$'\0'
+			__ebd_source_transfer
+			__ret=$?
+		else
+			__ebd_read_size "$1" __data
+			local IFS=$'\0'
+			eval "$__data"
+			__ret=$?
+			unset -v __data
+		fi
 		[[ ${__ret} -ne 0 ]] && exit 1
 		unset -v __ret
 		local IFS=$' \t\n'
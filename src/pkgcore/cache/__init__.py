@@ -27,10 +27,13 @@ class base:
         or queues up updates.
     :ivar cleanse_keys: Boolean controlling whether the template should drop
         empty keys for storing.
+    :ivar backfill: Boolean controlling whether valid entries found in lower
+        priority caches of a repo are copied into this cache on misses.
     """
 
     autocommits = False
     cleanse_keys = False
+    backfill = False
     default_sync_rate = 1
     chf_type = 'mtime'
     eclass_chf_types = ('mtime',)
@@ -276,6 +279,44 @@ class base:
         cache_item['_eclasses_'] = update
         return True
 
+    def validate_entries(self, entries, eclass_db, inherited=None):
+        """Validate a batch of cache entries.
+
+        Functionally equivalent to calling :obj:`validate_entry` for each
+        entry, but checks each distinct set of inherited eclasses against the
+        eclass cache only once for the whole batch.
+
+        :param entries: iterable of (cpv, ebuild_hash_item) pairs
+        :param eclass_db: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+        :param inherited: if set, a dict updated with the tuple of inherited
+            eclass names for each existing entry, whether it's valid or not
+        :return: iterator of (cpv, cache_item) pairs for existing, valid entries
+        """
+        chf_type = self.chf_type
+        chf_key = self._chf_key
+        eclass_sets = {}
+        for cpv, ebuild_hash_item in entries:
+            try:
+                cache_item = self[cpv]
+            except KeyError:
+                continue
+            eclass_data = cache_item.get('_eclasses_')
+            if inherited is not None and eclass_data is not None:
+                inherited[cpv] = tuple(eclass for eclass, _chfs in eclass_data)
+            chf_hash = cache_item.get(chf_key)
+            if (chf_hash is None or
+                    chf_hash != getattr(ebuild_hash_item, chf_type, None)):
+                continue
+            if eclass_data is not None:
+                key = tuple(eclass_data)
+                update = eclass_sets.get(key, False)
+                if update is False:
+                    update = eclass_sets[key] = eclass_db.rebuild_cache_entry(key)
+                if update is None:
+                    continue
+                cache_item['_eclasses_'] = update
+            yield cpv, cache_item
+
 
 class bulk(base):
 
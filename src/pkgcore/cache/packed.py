@@ -0,0 +1,310 @@
+"""
+single file, memory-mapped backend
+
+All entries live in one file: a fixed header pointing at an index block that
+maps cpv strings to (offset, length) pairs within the file, with each entry
+stored as newline separated key=value pairs. Updates are appended to the file
+along with a fresh index and the header is only repointed after the new data
+hits disk so readers never see partial updates. Once more than half the file
+is dead space, the next commit rewrites the file from scratch.
+
+Updates not yet committed (e.g. entries backfilled during a pquery run) are
+flushed when the interpreter exits.
+"""
+
+__all__ = ("database", "md5_cache")
+
+import atexit
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import weakref
+
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.cache import errors, fs_template
+from pkgcore.config.hint import ConfigHint
+from pkgcore.log import logger
+
+
+_MAGIC = b'PKGCPACK'
+_VERSION = 1
+# magic, version, index offset, index size
+_header = struct.Struct('<8sIQQ')
+# entry count, length of the newline separated cpv blob
+_index_header = struct.Struct('<QQ')
+
+
+def _encode_index(index):
+    keys = sorted(index)
+    blob = '\n'.join(keys).encode()
+    offsets = []
+    for k in keys:
+        offsets.extend(index[k])
+    return (
+        _index_header.pack(len(keys), len(blob)) + blob +
+        struct.pack(f'<{len(offsets)}Q', *offsets))
+
+
+# writable databases with updates that may still need flushing
+_open_databases = weakref.WeakSet()
+
+
+@atexit.register
+def _commit_open_databases():
+    for db in list(_open_databases):
+        try:
+            db.commit()
+        except errors.CacheError as e:
+            logger.warning(f'failed flushing cache {db.location!r}: {e}')
+
+
+def _decode_index(data):
+    count, blob_len = _index_header.unpack_from(data)
+    if not count:
+        return {}
+    start = _index_header.size
+    keys = bytes(data[start:start + blob_len]).decode().split('\n')
+    offsets = struct.unpack_from(f'<{count * 2}Q', data, start + blob_len)
+    return dict(zip(keys, zip(offsets[::2], offsets[1::2])))
+
+
+class database(fs_template.FsBased):
+    """Stores all cache entries in a single indexed, memory-mapped file.
+
+    Updates are queued in memory and written out on commit or at exit.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    backfill = True
+    default_sync_rate = 100
+    eclass_chf_types = ('eclassdir', 'mtime')
+
+    def __init__(self, *args, **config):
+        super().__init__(*args, **config)
+        self._pending_updates = {}
+        self._lock = threading.Lock()
+        self._mapping = None
+        if not self.readonly:
+            _open_databases.add(self)
+
+    @property
+    def _mapped(self):
+        """Current (mmap, index) pair for the on-disk file."""
+        if self._mapping is None:
+            try:
+                with open(self.location, 'rb') as f:
+                    self._mapping = self._load(f)
+            except FileNotFoundError:
+                self._mapping = (None, {})
+            except EnvironmentError as e:
+                raise errors.InitializationError(self.__class__, e) from e
+        return self._mapping
+
+    def _load(self, f):
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return None, {}
+        data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            magic, version, offset, length = _header.unpack_from(data)
+        except struct.error:
+            magic = version = None
+        if magic != _MAGIC or version != _VERSION:
+            data.close()
+            raise errors.GeneralCacheCorruption(
+                f'{self.location!r}: unknown file format')
+        try:
+            index = _decode_index(data[offset:offset + length])
+        except (struct.error, UnicodeDecodeError) as e:
+            data.close()
+            raise errors.GeneralCacheCorruption(
+                f'{self.location!r}: invalid index: {e}') from e
+        return data, index
+
+    def _getitem(self, cpv):
+        payload = self._pending_updates.get(cpv, False)
+        if payload is None:
+            raise KeyError(cpv)
+        elif payload is False:
+            data, index = self._mapped
+            try:
+                offset, length = index[cpv]
+            except KeyError:
+                raise KeyError(cpv)
+            payload = data[offset:offset + length]
+        try:
+            return self._parse_data(payload.decode().split('\n'))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise errors.CacheCorruption(cpv, e) from e
+
+    def _parse_data(self, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        for x in data:
+            k, v = x.split('=', 1)
+            if k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+    def _setitem(self, cpv, values):
+        known = self._known_keys
+        self._pending_updates[cpv] = '\n'.join(
+            f'{k}={v}' for k, v in sorted(values.items()) if k in known).encode()
+
+    def _delitem(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._pending_updates[cpv] = None
+
+    def __contains__(self, cpv):
+        payload = self._pending_updates.get(cpv, False)
+        if payload is False:
+            return cpv in self._mapped[1]
+        return payload is not None
+
+    def keys(self):
+        pending = self._pending_updates.copy()
+        for k in self._mapped[1]:
+            if k not in pending:
+                yield k
+        for k, v in pending.items():
+            if v is not None:
+                yield k
+
+    def commit(self, force=False):
+        if self.readonly:
+            return
+        with self._lock:
+            pending = self._pending_updates.copy()
+            if not pending:
+                return
+            try:
+                self._write(pending)
+            except EnvironmentError as e:
+                raise errors.GeneralCacheCorruption(e) from e
+            # updates stay visible via the pending queue until they're on disk
+            for k, v in pending.items():
+                if self._pending_updates.get(k, False) is v:
+                    del self._pending_updates[k]
+
+    def _open_locked(self):
+        """Open and exclusively lock the current file, creating it if missing."""
+        if not ensure_dirs(os.path.dirname(self.location), mode=0o775, minimal=False):
+            raise errors.GeneralCacheCorruption(
+                f'error creating directory for {self.location!r}')
+        while True:
+            fd = os.open(self.location, os.O_RDWR | os.O_CREAT, self._perms)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # a concurrent compaction may have replaced the file while we
+                # were waiting on the lock
+                if os.fstat(fd).st_ino == os.stat(self.location).st_ino:
+                    return os.fdopen(fd, 'r+b')
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def _write(self, pending):
+        with self._open_locked() as f:
+            # reload from disk in case other writers committed since our load
+            try:
+                data, index = self._load(f)
+            except errors.GeneralCacheCorruption:
+                # start over, the existing file is unusable
+                data, index = None, {}
+            try:
+                kept = sum(v[1] for k, v in index.items() if k not in pending)
+                live = kept + sum(len(v) for v in pending.values() if v is not None)
+                if data is None:
+                    self._compact(data, index, pending)
+                else:
+                    size = data.size()
+                    # space used by neither retained entries nor the current index
+                    dead = size - _header.size - _header.unpack_from(data)[3] - kept
+                    if dead > live:
+                        self._compact(data, index, pending)
+                    else:
+                        self._append(f, size, index, pending)
+            finally:
+                if data is not None:
+                    data.close()
+            self._ensure_access(self.location)
+
+        # drop the current mapping so the next access picks up the new file;
+        # it's left for gc to unmap since other threads may still be reading
+        self._mapping = None
+
+    def _append(self, f, offset, index, pending):
+        f.seek(offset)
+        for k, v in pending.items():
+            if v is None:
+                index.pop(k, None)
+            else:
+                f.write(v)
+                index[k] = (offset, len(v))
+                offset += len(v)
+        index_data = _encode_index(index)
+        f.write(index_data)
+        f.flush()
+        os.fsync(f.fileno())
+        # only repoint the header once the new data is on disk
+        f.seek(0)
+        f.write(_header.pack(_MAGIC, _VERSION, offset, len(index_data)))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _compact(self, data, index, pending):
+        tmp = f'{self.location}.update.{os.getpid()}'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(b'\0' * _header.size)
+                new_index = {}
+                offset = _header.size
+                for k in sorted(set(index).union(pending)):
+                    v = pending.get(k, False)
+                    if v is None:
+                        continue
+                    elif v is False:
+                        start, length = index[k]
+                        v = data[start:start + length]
+                    f.write(v)
+                    new_index[k] = (offset, len(v))
+                    offset += len(v)
+                index_data = _encode_index(new_index)
+                f.write(index_data)
+                f.seek(0)
+                f.write(_header.pack(_MAGIC, _VERSION, offset, len(index_data)))
+                f.flush()
+                os.fsync(f.fileno())
+            self._ensure_access(tmp)
+            os.rename(tmp, self.location)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            raise
+
+
+class md5_cache(database):
+    """Packed cache using md5 based validation, as used by md5-dict caches."""
+
+    chf_type = 'md5'
+    eclass_chf_types = ('md5',)
+    chf_base = 16
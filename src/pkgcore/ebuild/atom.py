@@ -255,7 +255,8 @@ class atom(boolean.AndRestriction, metaclass=klass.generic_equality):
                 orig_atom,
                 "slot restriction must proceed use")
         try:
-            sf(self, "_cpv", cpv.CPV(self.cpvstr, versioned=bool(self.op)))
+            cpv_kls = cpv.VersionedCPV if self.op else cpv.UnversionedCPV
+            sf(self, "_cpv", cpv_kls(self.cpvstr))
         except errors.InvalidCPV as e:
             raise errors.MalformedAtom(orig_atom) from e
 
@@ -4,7 +4,9 @@ Turns a DepSet (depend, rdepend, SRC_URI, license, etc) into
 appropriate conditionals.
 """
 
-__all__ = ("DepSet", "stringify_boolean")
+__all__ = ("DepSet", "DepSetParseCache", "parse_cache", "stringify_boolean")
+
+from collections import OrderedDict
 
 from snakeoil.compatibility import IGNORED_EXCEPTIONS
 from snakeoil.iterables import expandable_chain
@@ -23,10 +25,14 @@ except ImportError:
 class DepSet(boolean.AndRestriction):
     """Gentoo DepSet syntax parser"""
 
-    __slots__ = ('element_class', '_node_conds', '_known_conditionals')
+    __slots__ = ('element_class', '_node_conds', '_known_conditionals',
+                 '_eval_flags', '_eval_cache')
 
     _evaluate_collapse = True
 
+    # number of evaluated results kept per DepSet
+    eval_cache_size = 64
+
     # do not enable instance caching w/out adjust evaluate_depset!
     __inst_caching__ = False
     # stored for tests primarily
@@ -43,6 +49,15 @@ class DepSet(boolean.AndRestriction):
         sf(self, '_node_conds', node_conds)
         sf(self, 'type', restriction.package_type)
         sf(self, 'negate', False)
+        sf(self, '_eval_flags', None)
+        sf(self, '_eval_cache', None)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # evaluated results are regenerated on demand
+        if '_eval_cache' in state:
+            state['_eval_cache'] = None
+        return state
 
     @classmethod
     def parse(cls, dep_str, element_class,
@@ -206,6 +221,37 @@ class DepSet(boolean.AndRestriction):
         if not self.has_conditionals:
             return self
 
+        flags = self.eval_flags
+        if flags is None:
+            return self._evaluate_depset(cond_dict, tristate_filter)
+
+        # the result only depends on the states of the flags used by the
+        # conditionals so it's cached by them
+        key = tuple(flag in cond_dict for flag in flags)
+        if tristate_filter is not None:
+            key = (key, tuple(flag in tristate_filter for flag in flags))
+        cache = self._eval_cache
+        if cache is None:
+            cache = OrderedDict()
+            object.__setattr__(self, '_eval_cache', cache)
+        result = cache.get(key)
+        if result is not None:
+            try:
+                cache.move_to_end(key)
+            except KeyError:
+                # evicted by another thread
+                pass
+            return result
+
+        result = cache[key] = self._evaluate_depset(cond_dict, tristate_filter)
+        if len(cache) > self.eval_cache_size:
+            try:
+                cache.popitem(last=False)
+            except KeyError:
+                pass
+        return result
+
+    def _evaluate_depset(self, cond_dict, tristate_filter):
         results = []
         self.evaluate_conditionals(
             self.__class__, results,
@@ -213,6 +259,48 @@ class DepSet(boolean.AndRestriction):
 
         return self.__class__(tuple(results), self.element_class, False)
 
+    @staticmethod
+    def _find_eval_flags(restriction_set):
+        """Return the flags conditionals depend on, None if unknown."""
+        flags = {}
+        new_set = expandable_chain(restriction_set)
+        for cur_node in new_set:
+            if isinstance(cur_node, packages.Conditional):
+                restrict = cur_node.restriction
+                if not isinstance(restrict, values.ContainmentMatch2):
+                    return None
+                flags.update(dict.fromkeys(restrict.vals))
+                new_set.appendleft(cur_node.payload)
+            elif isinstance(cur_node, transitive_use_atom):
+                for flag in cur_node.use:
+                    if flag[-1] in '?=':
+                        flag = flag.lstrip('!')[:-1]
+                        if flag[-1] == ')':
+                            flag = flag[:-3]
+                        flags[flag] = None
+            elif isinstance(cur_node, atom):
+                continue
+            elif isinstance(cur_node, boolean.base):
+                new_set.appendleft(cur_node.restrictions)
+            elif hasattr(cur_node, 'evaluate_conditionals'):
+                # unknown conditional node
+                return None
+        return tuple(flags)
+
+    @property
+    def eval_flags(self):
+        """Tuple of the flags the evaluated DepSet depends on.
+
+        None if the DepSet contains conditionals of an unknown form.
+        """
+        flags = self._eval_flags
+        if flags is None:
+            flags = self._find_eval_flags(self.restrictions)
+            object.__setattr__(self, '_eval_flags', False if flags is None else flags)
+        elif flags is False:
+            return None
+        return flags
+
     @staticmethod
     def find_cond_nodes(restriction_set, yield_non_conditionals=False):
         conditions_stack = []
@@ -296,6 +384,66 @@ class DepSet(boolean.AndRestriction):
         return self.restrictions[key]
 
 
+class DepSetParseCache:
+    """Bounded cache of parsed DepSets shared between packages.
+
+    Identical dependency strings are common across packages (e.g. eclass
+    generated deps or copies between package versions) so parsing results
+    are shared instead of regenerating equivalent atom trees for each. Note
+    that the returned DepSets must be treated as immutable.
+
+    :param maxsize: number of parsed DepSets to keep
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def parse(self, dep_str, element_class, element_func=None,
+              transitive_use_atoms=False, attr=None):
+        """Return the DepSet for a string, see :obj:`DepSet.parse`.
+
+        The element class and function (e.g. an EAPI specific atom class)
+        are part of the cache key so they must be hashable and should be
+        reused between calls.
+        """
+        key = (dep_str, element_class, element_func, transitive_use_atoms)
+        cache = self._cache
+        depset = cache.get(key)
+        if depset is not None:
+            self.hits += 1
+            try:
+                cache.move_to_end(key)
+            except KeyError:
+                # evicted by another thread
+                pass
+            return depset
+
+        self.misses += 1
+        depset = DepSet.parse(
+            dep_str, element_class, attr=attr, element_func=element_func,
+            transitive_use_atoms=transitive_use_atoms)
+        cache[key] = depset
+        if len(cache) > self.maxsize:
+            try:
+                cache.popitem(last=False)
+            except KeyError:
+                pass
+        return depset
+
+
+# process-wide cache used for package metadata
+parse_cache = DepSetParseCache()
+
+
 def stringify_boolean(node, func=str, domain=None):
     """func is used to stringify the actual content. Useful for fetchables."""
     l = []
@@ -1,6 +1,6 @@
 """gentoo ebuild specific base package class"""
 
-from collections import UserString
+from weakref import WeakValueDictionary
 
 from snakeoil.compatibility import cmp
 from snakeoil.demandload import demand_compile_regexp
@@ -46,19 +46,14 @@ def isvalid_rev(s):
     return s and s[0] == 'r' and s[1:].isdigit()
 
 
-class _Revision(UserString):
+class _Revision:
     """Internal revision class storing revisions as strings and comparing as integers."""
 
-    # parent __hash__() isn't inherited when __eq__() is defined in the child class
-    # https://docs.python.org/3/reference/datamodel.html#object.__hash__
-    __hash__ = UserString.__hash__
+    __slots__ = ('data', '_revint')
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if self.data:
-            self._revint = int(self.data)
-        else:
-            self._revint = 0
+    def __init__(self, data=''):
+        self.data = data
+        self._revint = int(data) if data else 0
 
     def __str__(self):
         if not self.data:
@@ -66,6 +61,24 @@ class _Revision(UserString):
         else:
             return self.data
 
+    def __repr__(self):
+        return repr(self.data)
+
+    def __hash__(self):
+        return hash(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __int__(self):
+        return self._revint
+
+    def __reduce__(self):
+        return (self.__class__, (self.data,))
+
     def __eq__(self, other):
         if isinstance(other, _Revision):
             return self._revint == other._revint
@@ -112,6 +125,30 @@ class _Revision(UserString):
         return self.data >= other
 
 
+def ver_key(version, revision):
+    """Return a sort key for a version and revision ordering like :obj:`ver_cmp`.
+
+    Dotted components become (1, int) pairs, or (0, str) pairs for components
+    with leading zeroes which compare as stripped strings; suffixes become
+    (value, int) pairs terminated by a (0,) entry that sorts between negative
+    and positive suffix values.
+    """
+    parts = version.split("_")
+    ver_parts = parts[0].split(".")
+    letter = -1
+    if ver_parts[-1][-1].isalpha():
+        letter = ord(ver_parts[-1][-1])
+        ver_parts[-1] = ver_parts[-1][:-1]
+    suffixes = []
+    for suffix in parts[1:]:
+        match = suffix_regexp.match(suffix)
+        suffixes.append((suffix_value[match.group(1)], int("0" + match.group(2))))
+    suffixes.append((0,))
+    return (
+        tuple((0, x.rstrip("0")) if x[0] == "0" else (1, int(x)) for x in ver_parts),
+        letter, tuple(suffixes), int(revision) if revision else 0)
+
+
 def ver_cmp(ver1, rev1, ver2, rev2):
     # If the versions are the same, comparing revisions will suffice.
     if ver1 == ver2:
@@ -232,7 +269,28 @@ def ver_cmp(ver1, rev1, ver2, rev2):
     return cmp(rev1, rev2)
 
 
-class CPV(base.base):
+# parsed cpvs keyed by the string they were parsed from; new instances for a
+# known string copy their attributes from here instead of reparsing, sharing
+# the underlying storage
+_parsed_cpvs = WeakValueDictionary()
+
+
+class _InternedCPV(type):
+    """Metaclass returning existing instances for already parsed cpv strings.
+
+    Only applies to classes setting ``_interned = True`` and constructed from
+    a single cpv string.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        if len(args) == 1 and not kwargs and cls.__dict__.get('_interned', False):
+            inst = _parsed_cpvs.get(args[0])
+            if inst is not None and inst.__class__ is cls:
+                return inst
+        return super().__call__(*args, **kwargs)
+
+
+class CPV(base.base, metaclass=_InternedCPV):
     """base ebuild package class
 
     :ivar category: str category
@@ -240,12 +298,15 @@ class CPV(base.base):
     :ivar key: strkey (cat/pkg)
     :ivar version: str version
     :ivar revision: str revision
+    :ivar version_key: sort key for the version and revision, see :obj:`ver_key`
     :ivar versioned_atom: atom matching this exact version
     :ivar unversioned_atom: atom matching all versions of this package
     :cvar _get_attr: mapping of attr:callable to generate attributes on the fly
     """
 
-    __slots__ = ("cpvstr", "key", "category", "package", "version", "revision", "fullver")
+    __slots__ = (
+        "cpvstr", "key", "category", "package", "version", "revision", "fullver",
+        "_version_key")
     inject_richcmp_methods_from_cmp(locals())
 
     def __init__(self, *args, versioned=None):
@@ -278,6 +339,13 @@ class CPV(base.base):
             raise TypeError(
                 f"CPV takes 1 arg (cpvstr), 2 (cat, pkg), or 3 (cat, pkg, ver): got {args!r}")
 
+        sf = object.__setattr__
+        parsed = _parsed_cpvs.get(cpvstr)
+        if parsed is not None and (parsed.version is not None) == bool(versioned):
+            for attr in CPV.__slots__:
+                sf(self, attr, getattr(parsed, attr))
+            return
+
         try:
             category, pkgver = cpvstr.rsplit("/", 1)
         except ValueError:
@@ -285,7 +353,6 @@ class CPV(base.base):
             raise InvalidCPV(cpvstr, 'no package or version components')
         if not isvalid_cat_re.match(category):
             raise InvalidCPV(cpvstr, 'invalid category name')
-        sf = object.__setattr__
         sf(self, 'category', category)
         sf(self, 'cpvstr', cpvstr)
         pkg_chunks = pkgver.split("-")
@@ -329,6 +396,16 @@ class CPV(base.base):
             sf(self, 'version', None)
             sf(self, 'key', cpvstr)
             sf(self, 'package', '-'.join(pkg_chunks))
+        sf(self, '_version_key', None)
+        _parsed_cpvs[cpvstr] = self
+
+    @property
+    def version_key(self):
+        key = self._version_key
+        if key is None and self.version is not None:
+            key = ver_key(self.version, self.revision)
+            object.__setattr__(self, '_version_key', key)
+        return key
 
     def __hash__(self):
         return hash(self.cpvstr)
@@ -356,6 +433,10 @@ class CPV(base.base):
             # ~harring
             # fails in doing comparison of unversioned atoms against
             # versioned atoms
+            key = self.version_key
+            other_key = getattr(other, 'version_key', None)
+            if key is not None and other_key is not None:
+                return cmp(key, other_key)
             return ver_cmp(
                 self.version, self.revision, other.version, other.revision)
         except AttributeError:
@@ -383,6 +464,7 @@ class CPV(base.base):
 class VersionedCPV(CPV):
 
     __slots__ = ()
+    _interned = True
 
     def __init__(self, *args):
         super().__init__(*args, versioned=True)
@@ -391,6 +473,7 @@ class VersionedCPV(CPV):
 class UnversionedCPV(CPV):
 
     __slots__ = ()
+    _interned = True
 
     def __init__(self, *args):
         super().__init__(*args, versioned=False)
@@ -35,9 +35,9 @@ from pkgcore.config.hint import ConfigHint
 from pkgcore.ebuild import const, repository as ebuild_repo
 from pkgcore.ebuild.atom import atom as _atom
 from pkgcore.ebuild.misc import (
-    ChunkedDataDict, chunked_data, collapsed_restrict_to_data,
-    incremental_expansion, incremental_expansion_license,
-    non_incremental_collapsed_restrict_to_data, optimize_incrementals)
+    ChunkedDataDict, chunked_data, collapse_license_tokens, collapsed_restrict_to_data,
+    incremental_expansion, non_incremental_collapsed_restrict_to_data,
+    optimize_incrementals)
 from pkgcore.ebuild.portage_conf import PortageConfig
 from pkgcore.ebuild.repo_objs import RepoConfig, OverlayedLicenses
 from pkgcore.ebuild.triggers import GenerateTriggers
@@ -119,6 +119,53 @@ def generate_filter(masks, unmasks, *extra):
     return packages.AndRestriction(disable_inst_caching=True, finalize=True, *(r + extra))
 
 
+class _restrict_data_index:
+    """(restriction, data) pairs with atom restrictions indexed by package key."""
+
+    __slots__ = ('globs', 'atoms', 'memoizable')
+
+    def __init__(self, pairs):
+        self.globs = []
+        self.atoms = defaultdict(list)
+        # matches depending on USE deps can't be memoized per package
+        self.memoizable = True
+        for i, (restrict, data) in enumerate(pairs):
+            if isinstance(restrict, _atom):
+                self.atoms[restrict.key].append((i, restrict, data))
+                if restrict.use:
+                    self.memoizable = False
+            else:
+                self.globs.append((i, restrict, data))
+
+    def pull_data(self, pkg):
+        """Return the data of the pairs matching a package in their original order."""
+        matches = [x for x in self.globs if x[1].match(pkg)]
+        atoms = [x for x in self.atoms.get(pkg.key, ()) if x[1].match(pkg)]
+        if matches and atoms:
+            matches.extend(atoms)
+            matches.sort(key=itemgetter(0))
+        else:
+            matches = matches or atoms
+        return [x[2] for x in matches]
+
+
+def _memoized_filter(func):
+    """Memoize the verdicts of a visibility filter function per package.
+
+    The verdicts must only depend on the package's repo and CPV, e.g. not on
+    USE deps of package.* atoms.
+    """
+    verdicts = {}
+
+    def f(pkg, mode):
+        key = (pkg.repo, pkg.cpvstr)
+        verdict = verdicts.get(key)
+        if verdict is None:
+            verdict = verdicts[key] = func(pkg, mode)
+        return verdict
+    return f
+
+
 def _read_config_file(path):
     """Read all the data files under a given path."""
     try:
@@ -416,8 +463,11 @@ class domain(config_domain):
         master_license.extend(self.settings.get('ACCEPT_LICENSE', ()))
         if master_license or self.pkg_licenses:
             # restrict that matches iff the licenses are allowed
-            restrict = delegate(partial(self._apply_license_filter, master_license))
-            vfilters.append(restrict)
+            pkg_licenses = _restrict_data_index(self.pkg_licenses)
+            f = partial(self._apply_license_filter, master_license, pkg_licenses, {})
+            if pkg_licenses.memoizable:
+                f = _memoized_filter(f)
+            vfilters.append(delegate(f))
 
         return tuple(vfilters)
 
@@ -425,25 +475,31 @@ class domain(config_domain):
     def _default_licenses_manager(self):
         return OverlayedLicenses(*self.source_repos_raw)
 
-    def _apply_license_filter(self, master_licenses, pkg, mode):
+    def _apply_license_filter(self, master_licenses, pkg_licenses, expansions, pkg, mode):
         """Determine if a package's license is allowed."""
         # note we're not honoring mode; it's always match.
         # reason is that of not turning on use flags to get acceptable license
         # pairs, maybe change this down the line?
 
-        matched_pkg_licenses = []
-        for atom, licenses in self.pkg_licenses:
-            if atom.match(pkg):
-                matched_pkg_licenses += licenses
-
-        raw_accepted_licenses = master_licenses + matched_pkg_licenses
+        raw_accepted_licenses = tuple(chain(
+            master_licenses, chain.from_iterable(pkg_licenses.pull_data(pkg))))
         license_manager = getattr(pkg.repo, 'licenses', self._default_licenses_manager)
 
-        for and_pair in pkg.license.dnf_solutions():
-            accepted = incremental_expansion_license(
-                pkg, and_pair, license_manager.groups, raw_accepted_licenses,
+        # license groups are only expanded once for each set of accepted licenses
+        key = (license_manager, raw_accepted_licenses)
+        expanded = expansions.get(key)
+        if expanded is None:
+            expanded = expansions[key] = collapse_license_tokens(
+                pkg, license_manager.groups, raw_accepted_licenses,
                 msg_prefix=f"while checking ACCEPT_LICENSE ")
-            if accepted.issuperset(and_pair):
+        accepted, wildcard, rejected = expanded
+
+        for and_pair in pkg.license.dnf_solutions():
+            if wildcard:
+                # all licenses are accepted, except those rejected after the '*'
+                if rejected.isdisjoint(and_pair):
+                    return True
+            elif accepted.issuperset(and_pair):
                 return True
         return False
 
@@ -473,8 +529,11 @@ class domain(config_domain):
             raise NotImplementedError(self._incremental_apply_keywords_filter)
             #f = self._incremental_apply_keywords_filter
         else:
-            f = self._apply_keywords_filter
-        return delegate(partial(f, data))
+            profile_keywords = _restrict_data_index(self.profile.keywords)
+            f = partial(self._apply_keywords_filter, data, profile_keywords)
+            if profile_keywords.memoizable and _restrict_data_index(accept_keywords).memoizable:
+                f = _memoized_filter(f)
+        return delegate(f)
 
     @staticmethod
     def _incremental_apply_keywords_filter(data, pkg, mode):
@@ -483,13 +542,12 @@ class domain(config_domain):
         allowed = data.pull_data(pkg)
         return any(True for x in pkg.keywords if x in allowed)
 
-    def _apply_keywords_filter(self, data, pkg, mode):
+    def _apply_keywords_filter(self, data, profile_keywords, pkg, mode):
         # note we ignore mode; keywords aren't influenced by conditionals.
         # note also, we're not using a restriction here.  this is faster.
         pkg_keywords = pkg.keywords
-        for atom, keywords in self.profile.keywords:
-            if atom.match(pkg):
-                pkg_keywords += keywords
+        for keywords in profile_keywords.pull_data(pkg):
+            pkg_keywords += keywords
         allowed = data.pull_data(pkg)
         if '**' in allowed:
             return True
@@ -1119,5 +1119,5 @@ class FilterEnv(IpcCommand):
         src_path, dest_path = args.files
         with open(src_path) as src, open(dest_path, 'wb') as dest:
             filter_env.main_run(
-                dest, src.read(), args.vars, args.funcs,
+                dest, src, args.vars, args.funcs,
                 args.var_match, args.func_match)
@@ -4,6 +4,7 @@ package class for buildable ebuilds
 
 __all__ = ("base", "package", "package_factory")
 
+from collections import Counter, defaultdict
 from functools import partial
 from itertools import chain
 import os
@@ -11,6 +12,7 @@ from sys import intern
 
 from snakeoil import chksum, data_source, fileutils, klass
 from snakeoil.demandload import demand_compile_regexp
+from snakeoil.osutils import stat_mtime_long
 from snakeoil.sequences import iflatten_instance
 
 from pkgcore import fetch
@@ -32,19 +34,15 @@ demand_compile_regexp('_parse_inherit_regex', r'^\s*inherit\s(?P<eclasses>.*?)(#
 
 
 def generate_depset(kls, key, self):
-    return conditionals.DepSet.parse(
+    return conditionals.parse_cache.parse(
         self.data.pop(key, ""), kls,
         attr=key, element_func=self.eapi.atom_kls,
         transitive_use_atoms=self.eapi.options.transitive_use_atoms)
 
 
 def generate_licenses(self):
-    return conditionals.DepSet.parse(
-        self.data.pop('LICENSE', ''), str,
-        operators={
-            '||': boolean.OrRestriction,
-            '': boolean.AndRestriction},
-        attr='LICENSE', element_func=intern)
+    return conditionals.parse_cache.parse(
+        self.data.pop('LICENSE', ''), str, attr='LICENSE', element_func=intern)
 
 
 def _mk_required_use_node(data):
@@ -386,6 +384,8 @@ class package_factory(metadata.factory):
         super().__init__(parent, *args, **kwargs)
         self._cache = cachedb
         self._ecache = eclass_cache
+        # eclass inheritance counts seen while validating cache entries
+        self._eclass_usage = Counter()
 
         if mirrors:
             mirrors = {k: fetch.mirror(v, k) for k, v in mirrors.items()}
@@ -410,24 +410,101 @@ class package_factory(metadata.factory):
         if force_regen:
             caches = ()
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
+        missed = []
         for cache in caches:
             if cache is not None:
                 try:
                     data = cache[pkg.cpvstr]
                     if cache.validate_entry(data, ebuild_hash, self._ecache):
+                        if missed:
+                            self._backfill_caches(missed, pkg, cache, data, ebuild_hash)
                         return data
                     if not cache.readonly:
                         del cache[pkg.cpvstr]
                 except KeyError:
-                    continue
+                    pass
                 except cache_errors.CacheError as e:
                     logger.warning("caught cache error: %s", e)
                     del e
-                    continue
+                if not cache.readonly and getattr(cache, 'backfill', False):
+                    missed.append(cache)
 
         # no cache entries, regen
         return self._update_metadata(pkg, ebp=ebp)
 
+    def _backfill_caches(self, caches, pkg, source, data, ebuild_hash):
+        """Copy a valid entry into higher priority caches requesting backfills."""
+        data = dict(data)
+        data.pop(source._chf_key, None)
+        data['_chf_'] = ebuild_hash
+        for cache in caches:
+            try:
+                cache[pkg.cpvstr] = data
+            except cache_errors.CacheError as e:
+                logger.warning("caught cache error: %s", e)
+                del e
+
+    def _get_stale_pkgs(self, pkgs, force=False):
+        """Return the given packages lacking valid metadata cache entries.
+
+        Equivalent to checking each package individually via the caches, but
+        validates the whole batch at once so eclass checks are shared between
+        packages inheriting the same eclasses. Eclass usage is tracked from
+        all existing cache entries, including stale ones.
+
+        :param force: return all packages, only tracking eclass usage
+        """
+        # stat ebuilds a package dir at a time
+        pkg_dirs = defaultdict(list)
+        for pkg in pkgs:
+            pkg_dirs[os.path.dirname(pkg.path)].append(pkg)
+        stale = {}
+        for path, dir_pkgs in pkg_dirs.items():
+            try:
+                with os.scandir(path) as it:
+                    mtimes = {
+                        x.name: stat_mtime_long(None, x.stat())
+                        for x in it if x.name.endswith('.ebuild')}
+            except FileNotFoundError:
+                mtimes = {}
+            for pkg in dir_pkgs:
+                mtime = mtimes.get(os.path.basename(pkg.path))
+                ebuild_hash = chksum.LazilyHashedPath(pkg.path)
+                if mtime is not None:
+                    ebuild_hash = chksum.LazilyHashedPath(pkg.path, mtime=mtime)
+                stale[pkg.cpvstr] = (pkg, ebuild_hash)
+
+        # packages are only counted once if they're in multiple caches
+        inherited = {}
+        remaining = dict(stale)
+        for cache in self._cache:
+            if cache is None or not remaining:
+                continue
+            entries = ((cpv, ebuild_hash) for cpv, (pkg, ebuild_hash) in remaining.items())
+            valid = []
+            try:
+                for cpv, data in cache.validate_entries(entries, self._ecache, inherited):
+                    valid.append(cpv)
+            except cache_errors.CacheError as e:
+                logger.warning("caught cache error: %s", e)
+                del e
+                continue
+            for cpv in valid:
+                del remaining[cpv]
+        for eclasses in inherited.values():
+            self._eclass_usage.update(eclasses)
+
+        if force:
+            return [pkg for pkg, ebuild_hash in stale.values()]
+        return [pkg for pkg, ebuild_hash in remaining.values()]
+
+    def popular_eclasses(self, limit=None):
+        """Return the most commonly inherited eclass names, most used first.
+
+        Usage is tracked from the cache entries seen during batch validation.
+        """
+        return [eclass for eclass, count in self._eclass_usage.most_common(limit)]
+
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi
         if not parsed_eapi.is_supported:
@@ -24,6 +24,7 @@ class base:
 
     def __init__(self, location=None, eclassdir=None):
         self._eclass_data_inst_cache = WeakValCache()
+        self._eclass_validity_cache = {}
         # generate this.
         # self.eclasses = {} # {"Name": ("location", "_mtime_")}
         self.location = location
@@ -59,9 +60,25 @@ class base:
         Given a dict as returned by get_eclass_data, walk it comparing
         it to internal eclass view.
 
-        :return: a boolean representing whether that eclass data is still
-            up to date, or not
+        Results are memoized per eclass set since the eclasses are only
+        scanned once per instance, and a given set is often shared by
+        thousands of packages.
+
+        :return: None if the eclass data is out of date, otherwise a mapping
+            of eclass names to current eclass data
         """
+        try:
+            key = tuple(entry_eclasses)
+            return self._eclass_validity_cache[key]
+        except TypeError:
+            # unhashable chksum data, skip memoizing
+            return self._rebuild_cache_entry(entry_eclasses)
+        except KeyError:
+            pass
+        d = self._eclass_validity_cache[key] = self._rebuild_cache_entry(key)
+        return d
+
+    def _rebuild_cache_entry(self, entry_eclasses):
         ec = self.eclasses
         d = {}
 
@@ -71,16 +88,18 @@ class base:
                 return None
             d[eclass] = data
 
-        return d
+        return ImmutableDict(d)
 
     def __getstate__(self):
         d = self.__dict__.copy()
         del d['_eclass_data_inst_cache']
+        del d['_eclass_validity_cache']
         return d
 
     def __setstate__(self, state):
         self.__dict__ = state.copy()
         self.__dict__['_eclass_data_inst_cache'] = WeakValCache()
+        self.__dict__['_eclass_validity_cache'] = {}
 
 
 class cache(base):
@@ -2,6 +2,7 @@
 
 __all__ = ("run",)
 
+from functools import partial
 import io
 import re
 
@@ -27,12 +28,110 @@ def native_run(out, file_buff, var_match, func_match,
         global_envvar_callback, func_callback=func_callback)
 
 
+def stream_run(out, handle, var_match, func_match,
+               global_envvar_callback=None,
+               func_callback=None, chunk_size=65536):
+    """Print a filtered environment read incrementally from a file object.
+
+    Produces the same output as :obj:`native_run` for the file's contents, but
+    parses it one top-level statement at a time, writing output as it goes.
+    Memory usage is bounded by the largest top-level statement (usually a
+    function) instead of the size of the environment.
+
+    :param out: file-like object to write to.
+    :param handle: file-like object opened in text mode to read the
+        environment from.
+    :param var_match: result of build_regex_string or C{None}, for variables.
+    :param func_match: result of build_regex_string or C{None}, for functions.
+    :param chunk_size: number of characters to read at a time.
+    """
+    # Statements are parsed against the buffered data and reparsed with more
+    # data if they run up against the end of the buffer, with callbacks
+    # deferred until the statement is known to be complete.
+    callbacks = []
+    envvar_callback = None
+    if global_envvar_callback is not None:
+        envvar_callback = partial(_deferred_callback, callbacks, global_envvar_callback)
+    if func_callback is not None:
+        func_callback = partial(_deferred_callback, callbacks, func_callback)
+
+    buff = ''
+    eof = False
+    pos = window_start = 0
+    window_end = None
+    isspace = str.isspace
+    while True:
+        if not eof and pos >= len(buff) - _STREAM_MARGIN:
+            buff, eof = _stream_read(handle, buff, chunk_size)
+        if pos >= len(buff) or buff[pos] == '\0':
+            break
+        if window_end is not None:
+            out.write(buff[window_start:window_end].encode('utf-8'))
+            window_start = pos
+            window_end = None
+        com_start = pos
+        if isspace(buff[pos]):
+            pos += 1
+            continue
+
+        if pos > chunk_size:
+            # drop parsed data, retaining a char of context since comment
+            # detection looks behind the current statement
+            out.write(buff[window_start:pos].encode('utf-8'))
+            buff = buff[pos - 1:]
+            pos = window_start = com_start = 1
+
+        while True:
+            del callbacks[:]
+            try:
+                new_pos, filtered = walk_statement(
+                    buff, pos, var_match, func_match, '\0',
+                    envvar_callback, func_callback)
+                if eof or new_pos < len(buff) - _STREAM_MARGIN:
+                    break
+            except IndexError:
+                if eof:
+                    raise
+            buff, eof = _stream_read(handle, buff, max(chunk_size, len(buff)))
+
+        for callback, args in callbacks:
+            callback(*args)
+        pos = new_pos
+        if filtered:
+            window_end = com_start
+
+    if window_end is None:
+        window_end = pos
+    if window_end > len(buff):
+        window_end = len(buff)
+    out.write(buff[window_start:window_end].encode('utf-8'))
+
+
+# lookahead kept available past any statement parsed while streaming
+_STREAM_MARGIN = 8
+
+
+def _stream_read(handle, buff, size):
+    """Append the next chunk of data to the buffer, terminating it at EOF."""
+    data = handle.read(size)
+    if not data:
+        return buff + '\0', True
+    if data[-1] == '\0':
+        # non-terminal chunks must not look terminated, see is_function()
+        return _stream_read(handle, buff + data, 1)
+    return buff + data, False
+
+
+def _deferred_callback(callbacks, callback, *args):
+    callbacks.append((callback, args))
+
+
 cpy_run = None
 try:
     from pkgcore.ebuild._filter_env import run
     cpy_run = run
 except ImportError:
-    run = native_run
+    run = stream_run
 
 
 def build_regex_string(tokens, invert=False):
@@ -92,6 +191,9 @@ def is_function(buff, pos):
             return None, None, None
         return start, end, pos + 1
     except IndexError:
+        # partial buffers may be continued by more data
+        if buff[-1:] != '\0':
+            raise
         # can't be a function, ran off the end
         return None, None, None
 
@@ -111,6 +213,8 @@ def is_envvar(buff, pos):
                 return start, pos, pos + 1
             pos += 1
     except IndexError:
+        if buff[-1:] != '\0':
+            raise
         return None, None, None
 
 def process_scope(out, buff, pos, var_match, func_match, endchar,
@@ -128,74 +232,14 @@ def process_scope(out, buff, pos, var_match, func_match, endchar,
             window_start = pos
             window_end = None
         com_start = pos
-        ch = buff[pos]
-        if isspace(ch):
+        if isspace(buff[pos]):
             pos += 1
             continue
-
-        # Ignore comments.
-        if ch == '#':
-            pos = walk_statement_pound(buff, pos, endchar)
-            continue
-
-        new_start, new_end, new_p = is_function(buff, pos)
-        if new_p is not None:
-            func_name = buff[new_start:new_end]
-            logger.debug(f'matched func name {func_name!r}')
-            new_p = process_scope(None, buff, new_p, None, None, '}',
-                                  func_callback=func_callback,
-                                  func_level=func_level+1)
-            logger.debug(f'ended processing {func_name!r}')
-            if func_callback is not None:
-                func_callback(func_level, func_name, buff[new_start:new_p])
-            if func_match is not None and func_match(func_name):
-                logger.debug(f'filtering func {func_name!r}')
-                window_end = com_start
-            pos = new_p
-            pos += 1
-            continue
-        # Check for env assignment.
-        new_start, new_end, new_p = is_envvar(buff, pos)
-        if new_p is None:
-            # Non env assignment.
-            pos = walk_command_complex(buff, pos, endchar, COMMAND_PARSING)
-            # icky icky icky icky
-            if pos < end and buff[pos] != endchar:
-                pos += 1
-        else:
-            # Env assignment.
-            var_name = buff[new_start:new_end]
-            pos = new_p
-            if envvar_callback:
-                envvar_callback(var_name)
-            logger.debug(f'matched env assign {var_name!r}')
-
-            if var_match is not None and var_match(var_name):
-                # This would be filtered.
-                logger.info(f"filtering var {var_name!r}")
-                window_end = com_start
-
-            if pos >= end:
-                return pos
-
-            while (pos < end and not isspace(buff[pos])
-                   and buff[pos] != ';'):
-                if buff[pos] == "'":
-                    pos = walk_statement_no_parsing(buff, pos + 1, "'") + 1
-                elif buff[pos] in '"`':
-                    pos = walk_command_escaped_parsing(buff, pos + 1,
-                                                       buff[pos]) + 1
-                elif buff[pos] == '(':
-                    pos = walk_command_escaped_parsing(buff, pos + 1, ')') + 1
-                elif buff[pos] == '$':
-                    pos += 1
-                    if pos >= end:
-                        continue
-                    pos = walk_dollar_expansion(buff, pos, end, endchar)
-                    continue
-                else:
-                    # blah=cah ; single word
-                    pos = walk_command_complex(buff, pos, ' ', SPACE_PARSING)
+        pos, filtered = walk_statement(
+            buff, pos, var_match, func_match, endchar,
+            envvar_callback, func_callback, func_level)
+        if filtered:
+            window_end = com_start
 
     if out is not None:
         if window_end is None:
@@ -207,6 +251,76 @@ def process_scope(out, buff, pos, var_match, func_match, endchar,
     return pos
 
 
+def walk_statement(buff, pos, var_match, func_match, endchar,
+                   envvar_callback=None, func_callback=None,
+                   func_level=0):
+    """Walk a statement starting at a non-space character.
+
+    :return: position after the statement and whether it should be filtered
+    """
+    isspace = str.isspace
+    end = len(buff)
+    # Ignore comments.
+    if buff[pos] == '#':
+        return walk_statement_pound(buff, pos, endchar), False
+
+    new_start, new_end, new_p = is_function(buff, pos)
+    if new_p is not None:
+        func_name = buff[new_start:new_end]
+        logger.debug(f'matched func name {func_name!r}')
+        new_p = process_scope(None, buff, new_p, None, None, '}',
+                              func_callback=func_callback,
+                              func_level=func_level+1)
+        logger.debug(f'ended processing {func_name!r}')
+        if func_callback is not None:
+            func_callback(func_level, func_name, buff[new_start:new_p])
+        filtered = func_match is not None and func_match(func_name)
+        if filtered:
+            logger.debug(f'filtering func {func_name!r}')
+        return new_p + 1, filtered
+    # Check for env assignment.
+    new_start, new_end, new_p = is_envvar(buff, pos)
+    if new_p is None:
+        # Non env assignment.
+        pos = walk_command_complex(buff, pos, endchar, COMMAND_PARSING)
+        # icky icky icky icky
+        if pos < end and buff[pos] != endchar:
+            pos += 1
+        return pos, False
+
+    # Env assignment.
+    var_name = buff[new_start:new_end]
+    pos = new_p
+    if envvar_callback:
+        envvar_callback(var_name)
+    logger.debug(f'matched env assign {var_name!r}')
+
+    filtered = var_match is not None and var_match(var_name)
+    if filtered:
+        # This would be filtered.
+        logger.info(f"filtering var {var_name!r}")
+
+    while (pos < end and not isspace(buff[pos])
+           and buff[pos] != ';'):
+        if buff[pos] == "'":
+            pos = walk_statement_no_parsing(buff, pos + 1, "'") + 1
+        elif buff[pos] in '"`':
+            pos = walk_command_escaped_parsing(buff, pos + 1,
+                                               buff[pos]) + 1
+        elif buff[pos] == '(':
+            pos = walk_command_escaped_parsing(buff, pos + 1, ')') + 1
+        elif buff[pos] == '$':
+            pos += 1
+            if pos >= end:
+                continue
+            pos = walk_dollar_expansion(buff, pos, end, endchar)
+            continue
+        else:
+            # blah=cah ; single word
+            pos = walk_command_complex(buff, pos, ' ', SPACE_PARSING)
+    return pos, filtered
+
+
 def walk_statement_no_parsing(buff, pos, endchar):
     pos = buff.find(endchar, pos)
     if pos == -1:
@@ -278,12 +392,18 @@ def walk_statement_pound(buff, pos, endchar=None):
             if i2 != -1:
                 return min(i, i2)
             return i
-        return len(buff) - 1
+        return _walk_to_end(buff, pos)
 
-    pos = buff.find('\n', pos)
-    if pos == -1:
-        pos = len(buff) - 1
-    return pos
+    end = buff.find('\n', pos)
+    if end == -1:
+        return _walk_to_end(buff, pos)
+    return end
+
+
+def _walk_to_end(buff, pos):
+    # Terminated buffers always end past the comment, partial ones being
+    # streamed may not so make sure callers progress.
+    return max(len(buff) - 1, pos + 1)
 
 
 def walk_command_complex(buff, pos, endchar, interpret_level):
@@ -411,20 +531,28 @@ def main_run(out_handle, data, vars_to_filter=(), funcs_to_filter=(), vars_is_wh
             raise ValueError("funcs_str should not be a string; should be a sequence.")
         funcs = build_regex_string(funcs_to_filter, invert=funcs_is_whitelist).match
 
-    data = data + '\0'
-
     kwds = {'global_envvar_callback':global_envvar_callback}
 
     if func_callback:
-        if _parser not in (None, native_run):
-            raise ValueError("_parser must be native_run or None if func_callback is active")
-        _parser = native_run
+        if _parser not in (None, native_run, stream_run):
+            raise ValueError(
+                "_parser must be native_run, stream_run, or None if func_callback is active")
+        if _parser is None:
+            _parser = stream_run
         # Set this only if func_callback is enabled; extension can't yet
         # handle the arg.
         kwds['func_callback'] = func_callback
     if _parser is None:
         _parser = run
 
+    if _parser is stream_run:
+        if isinstance(data, str):
+            data = io.StringIO(data)
+    else:
+        if not isinstance(data, str):
+            data = data.read()
+        data = data + '\0'
+
     if out_handle is None:
         out_handle = io.BytesIO()
 
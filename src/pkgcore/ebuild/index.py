@@ -0,0 +1,276 @@
+"""
+secondary metadata indexes for ebuild repositories
+
+Inverted indexes mapping metadata values (dependency package keys, USE flags,
+licenses, maintainers, inherited eclasses, and EAPI) to the package versions
+using them are stored in a single file. They're generated from the metadata
+cache (e.g. via ``pmaint regen --secondary-index``) and only trusted while the
+repo and its caches are unmodified, allowing queries on those values to skip
+loading the metadata of every package in the repo.
+
+Lookups only narrow the packages that need to be matched, results are always
+supersets of the actual matches.
+"""
+
+__all__ = ("SecondaryIndex",)
+
+import json
+import os
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.ebuild import repo_objs
+from pkgcore.ebuild.atom import atom
+from pkgcore.log import logger
+from pkgcore.package.errors import MetadataException
+from pkgcore.restrictions import boolean, packages, values
+from pkgcore.util.cachefiles import dir_paths, fingerprint, path_signature, tree_paths
+
+_dep_attrs = ('bdepend', 'depend', 'rdepend', 'pdepend')
+
+# package attrs answerable by each index
+_index_attrs = {
+    'depend': frozenset(_dep_attrs),
+    'use': frozenset(['iuse_stripped']),
+    'license': frozenset(['license']),
+    'maintainer': frozenset(['maintainers']),
+    'eclass': frozenset(['inherited']),
+    'eapi': frozenset(['eapi']),
+}
+_attr_index = {attr: name for name, attrs in _index_attrs.items() for attr in attrs}
+
+# value restrictions matching strings the same way for indexed keys as for
+# the actual attribute values
+_str_restrictions = (values.StrExactMatch, values.StrGlobMatch, values.StrRegex)
+
+
+def _maintainer_key(maintainer):
+    return json.dumps([maintainer.email, maintainer.name, maintainer.description])
+
+
+def _pkg_values(pkg):
+    """Return the indexed values for a package, keyed by index name."""
+    return {
+        'depend': {
+            x.key for attr in _dep_attrs
+            for x in iflatten_instance(getattr(pkg, attr), atom)},
+        'use': set(pkg.iuse_stripped),
+        'license': set(iflatten_instance(pkg.license, str)),
+        'eclass': set(pkg.inherited),
+        'eapi': {str(pkg.eapi)},
+    }
+
+
+class SecondaryIndex:
+    """Secondary metadata indexes for an ebuild repo, stored as a JSON file.
+
+    :param path: file the index is stored in
+    :param repo: :obj:`pkgcore.ebuild.repository.UnconfiguredTree` instance
+    """
+
+    version = 2
+
+    def __init__(self, path, repo):
+        self.path = path
+        self.repo = repo
+        self._data = None
+        self._cpvs = None
+        self._packages = None
+        # itermatch() looks up the same restriction twice in a row
+        self._last = (None, None)
+
+    def _signature(self):
+        # Package dir and ebuild mtimes change when versions are added,
+        # removed, or edited and cache dir mtimes when entries are
+        # regenerated. Note that the repo root and metadata dirs are skipped
+        # since the index itself is written there.
+        repo = self.repo
+        paths = [pjoin(repo.location, 'eclass')]
+        paths.extend(tree_paths(repo.location, repo.categories))
+        for cache in repo.cache:
+            location = getattr(cache, 'location', None)
+            if location is not None:
+                paths.extend(dir_paths(location))
+        return fingerprint(repo.location, path_signature(paths))
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (EnvironmentError, ValueError) as e:
+            logger.debug(f'ignoring unusable secondary index {self.path!r}: {e}')
+            return {}
+        if (not isinstance(data, dict) or data.get('version') != self.version or
+                data.get('signature') != self._signature()):
+            return {}
+        data['cpvs'] = [tuple(x) for x in data['cpvs']]
+        data['skipped'] = [tuple(x) for x in data.get('skipped', ())]
+        return data
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    @property
+    def available(self):
+        """Check if a current index exists."""
+        return bool(self.data)
+
+    def build(self, pkgs):
+        """Generate the indexes from the given packages and write them out.
+
+        Packages with bad metadata are skipped.
+
+        :raises EnvironmentError: if writing the index fails
+        """
+        cpvs = []
+        skipped = []
+        indexes = {name: {} for name in _index_attrs}
+        maintainers = {}
+        for pkg in pkgs:
+            try:
+                pkg_values = _pkg_values(pkg)
+                key = (pkg.category, pkg.package)
+                if key not in maintainers:
+                    maintainers[key] = {_maintainer_key(m) for m in pkg.maintainers}
+                pkg_values['maintainer'] = maintainers[key]
+            except MetadataException:
+                skipped.append((pkg.category, pkg.package, pkg.fullver))
+                continue
+            i = len(cpvs)
+            cpvs.append((pkg.category, pkg.package, pkg.fullver))
+            for name, vals in pkg_values.items():
+                index = indexes[name]
+                for val in vals:
+                    index.setdefault(val, []).append(i)
+
+        data = {
+            'version': self.version,
+            'signature': self._signature(),
+            'cpvs': cpvs,
+            'skipped': skipped,
+            'indexes': indexes,
+        }
+        tmp = f'{self.path}.update.{os.getpid()}'
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0o755, minimal=True):
+                raise PermissionError(f'failed creating dir for {self.path!r}')
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.rename(tmp, self.path)
+        except EnvironmentError:
+            try:
+                os.unlink(tmp)
+            except EnvironmentError:
+                pass
+            raise
+        # reload so lists are converted the same as when loading from disk
+        self._data = None
+        self._cpvs = None
+        self._packages = None
+        self._last = (None, None)
+
+    def _keys(self, name, restrict):
+        """Return the index keys matching a value restriction, None if unknown."""
+        index = self.data['indexes'][name]
+        if name == 'eapi':
+            if isinstance(restrict, _str_restrictions):
+                return [k for k in index if restrict.match(k)]
+            return None
+
+        if restrict.negate:
+            return None
+        if name == 'depend':
+            # revdep style matching, see pquery --restrict-revdep
+            if isinstance(restrict, values.FlatteningRestriction):
+                restrict = restrict.restriction
+                if isinstance(restrict, values.AnyMatch) and not restrict.negate:
+                    func = getattr(restrict.restriction, 'func', None)
+                    target = getattr(func, '__self__', None)
+                    if isinstance(target, atom) and func.__name__ == 'intersects' and \
+                            not restrict.restriction.negate:
+                        return [target.key]
+            return None
+
+        if isinstance(restrict, values.ContainmentMatch2) and name != 'maintainer':
+            return list(restrict.vals)
+        elif isinstance(restrict, values.AnyMatch):
+            if name == 'maintainer':
+                return [
+                    k for k in index if restrict.restriction.match(
+                        repo_objs.Maintainer(*json.loads(k)))]
+            return [k for k in index if restrict.restriction.match(k)]
+        return None
+
+    def _match(self, restrict):
+        if isinstance(restrict, atom):
+            return None
+        elif isinstance(restrict, boolean.base):
+            if restrict.negate:
+                return None
+            results = [self._match(x) for x in restrict.restrictions]
+            if type(restrict).match is boolean.AndRestriction.match:
+                results = [x for x in results if x is not None]
+                if not results:
+                    return None
+                return set.intersection(*results)
+            elif type(restrict).match is boolean.OrRestriction.match:
+                if not results or None in results:
+                    return None
+                return set.union(*results)
+            return None
+        elif isinstance(restrict, packages.PackageRestriction):
+            name = _attr_index.get(restrict.attr)
+            if name is None or restrict.negate:
+                return None
+            keys = self._keys(name, restrict.restriction)
+            if keys is None:
+                return None
+            index = self.data['indexes'][name]
+            return {i for k in keys for i in index.get(k, ())}
+        return None
+
+    def match(self, restrict):
+        """Return the indexed package versions possibly matching a restriction.
+
+        :return: None if the restriction can't be answered via the index,
+            otherwise a set of (category, package, fullver) tuples
+        """
+        if isinstance(restrict, atom) or not self.available:
+            return None
+        last_restrict, result = self._last
+        if restrict is not last_restrict:
+            ids = self._match(restrict)
+            if ids is not None:
+                cpvs = self.data['cpvs']
+                result = frozenset(cpvs[i] for i in ids)
+            else:
+                result = None
+            self._last = (restrict, result)
+        return result
+
+    @property
+    def cpvs(self):
+        """All indexed package versions as (category, package, fullver) tuples."""
+        if self._cpvs is None:
+            self._cpvs = frozenset(self.data.get('cpvs', ()))
+        return self._cpvs
+
+    @property
+    def packages(self):
+        """Packages with all their versions indexed as (category, package) tuples.
+
+        Packages with versions skipped while building the index due to bad
+        metadata aren't included.
+        """
+        if self._packages is None:
+            skipped = {(cat, pkg) for cat, pkg, _ver in self.data.get('skipped', ())}
+            self._packages = frozenset(
+                (cat, pkg) for cat, pkg, _ver in self.cpvs
+                if (cat, pkg) not in skipped)
+        return self._packages
@@ -4,13 +4,13 @@ misc. stuff we've not found a spot for yet.
 
 __all__ = (
     "ChunkedDataDict", "IncrementalsDict", "PayloadDict",
-    "chunked_data", "collapsed_restrict_to_data", "incremental_chunked",
-    "incremental_expansion", "incremental_expansion_license",
+    "chunked_data", "collapse_license_tokens", "collapsed_restrict_to_data",
+    "incremental_chunked", "incremental_expansion", "incremental_expansion_license",
     "non_incremental_collapsed_restrict_to_data", "optimize_incrementals",
     "sort_keywords",
 )
 
-from collections import defaultdict, namedtuple
+from collections import OrderedDict, defaultdict, namedtuple
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from itertools import chain
@@ -98,7 +98,22 @@ except ImportError:
 
 
 def incremental_expansion_license(pkg, licenses, license_groups, iterable, msg_prefix=''):
+    seen, wildcard, rejected = collapse_license_tokens(
+        pkg, license_groups, iterable, msg_prefix=msg_prefix)
+    if wildcard:
+        seen.update(x for x in licenses if x not in rejected)
+    return seen
+
+
+def collapse_license_tokens(pkg, license_groups, iterable, msg_prefix=''):
+    """Incrementally expand accepted license tokens independent of a package's licenses.
+
+    :return: tuple of the accepted licenses, whether '*' is in effect, and
+        the licenses rejected after the last '*'
+    """
     seen = set()
+    rejected = set()
+    wildcard = False
     for token in iterable:
         if token[0] == '-':
             i = token[1:]
@@ -107,6 +122,8 @@ def incremental_expansion_license(pkg, licenses, license_groups, iterable, msg_p
                     f"{pkg}: {msg_prefix}encountered an incomplete negation, '-'")
             if i == '*':
                 seen.clear()
+                rejected.clear()
+                wildcard = False
             else:
                 if i[0] == '@':
                     i = i[1:]
@@ -114,20 +131,27 @@ def incremental_expansion_license(pkg, licenses, license_groups, iterable, msg_p
                         raise ValueError(
                             f"{pkg}: {msg_prefix}encountered an incomplete negation"
                             " of a license group, '-@'")
-                    seen.difference_update(license_groups.get(i, ()))
+                    i = license_groups.get(i, ())
                 else:
-                    seen.discard(i)
+                    i = (i,)
+                seen.difference_update(i)
+                if wildcard:
+                    rejected.update(i)
         elif token[0] == '@':
             i = token[1:]
             if not i:
                 raise ValueError(
                     f"{pkg}: {msg_prefix}encountered an incomplete license group, '@'")
-            seen.update(license_groups.get(i, ()))
+            i = license_groups.get(i, ())
+            seen.update(i)
+            rejected.difference_update(i)
         elif token == '*':
-            seen.update(licenses)
+            rejected.clear()
+            wildcard = True
         else:
             seen.add(token)
-    return seen
+            rejected.discard(token)
+    return seen, wildcard, rejected
 
 
 class IncrementalsDict(mappings.DictMixin):
@@ -362,10 +386,75 @@ def _build_cp_atom_payload(sequence, restrict, payload_form=False):
     return tuple(new_l)
 
 
+def _chunk_memo_attrs(restrict):
+    """Return the package attrs beyond its key and version a chunk restriction uses.
+
+    :return: tuple of attr names, or None if they aren't known
+    """
+    if isinstance(restrict, atom.atom):
+        if restrict.use:
+            return None
+        attrs = []
+        if restrict.slot is not None or restrict.subslot is not None:
+            attrs.extend(('slot', 'subslot'))
+        if restrict.repo_id is not None:
+            attrs.append('repo')
+        return tuple(attrs)
+    elif isinstance(restrict, packages.PackageRestriction) and \
+            restrict.attr in ('category', 'package', 'key'):
+        return ()
+    return None
+
+
+def _compile_chunks(items):
+    """Collapse a sequence of chunks for rendering.
+
+    Runs of unconditional chunks are collapsed into single chunks, chunks
+    that can never match are dropped.
+
+    :return: tuple of the leading collapsed disabled and enabled sets, the
+        remaining (restriction, neg, pos) tuples with None restrictions for
+        unconditional chunks, and the package attrs needed to memoize
+        renders (None if renders can't be memoized).
+    """
+    neg, pos = set(), set()
+    chunks = []
+    memo_attrs = set()
+    for item in items:
+        restrict = item.key
+        if isinstance(restrict, restriction.AlwaysBool):
+            if not restrict.negate:
+                continue
+            restrict = None
+        if restrict is None and not chunks:
+            cneg, cpos = neg, pos
+        elif restrict is None and chunks[-1][0] is None:
+            _, cneg, cpos = chunks[-1]
+        else:
+            cneg, cpos = set(), set()
+            chunks.append((restrict, cneg, cpos))
+            if restrict is not None and memo_attrs is not None:
+                attrs = _chunk_memo_attrs(restrict)
+                if attrs is None:
+                    memo_attrs = None
+                else:
+                    memo_attrs.update(attrs)
+        cneg.update(item.neg)
+        cpos.difference_update(item.neg)
+        cpos.update(item.pos)
+    chunks = tuple((r, frozenset(n), frozenset(p)) for r, n, p in chunks)
+    if memo_attrs is not None:
+        memo_attrs = tuple(sorted(memo_attrs))
+    return frozenset(neg), frozenset(pos), chunks, memo_attrs
+
+
 class ChunkedDataDict(metaclass=generic_equality):
 
     __attr_comparison__ = ('_global_settings', '_dict')
 
+    # number of package renders memoized for frozen instances
+    memo_size = 4096
+
     def __init__(self):
         self._global_settings = []
         self._dict = defaultdict(partial(list, self._global_settings))
@@ -379,6 +468,10 @@ class ChunkedDataDict(metaclass=generic_equality):
         if self.frozen and not unfreeze:
             obj._dict = self._dict
             obj._global_settings = self._global_settings
+            # the compiled data only depends on the shared, immutable settings
+            obj._compiled = self._compiled
+            obj._compiled_globals = self._compiled_globals
+            obj._memo = self._memo
             return obj
         obj._dict = defaultdict(partial(list, self._global_settings))
         for key, values in self._dict.items():
@@ -466,6 +559,24 @@ class ChunkedDataDict(metaclass=generic_equality):
                 (k, tuple(v))
                 for k, v in self._dict.items())
             self._global_settings = tuple(self._global_settings)
+            self._reset_compiled()
+
+    def _reset_compiled(self):
+        # per key compiled chunks and memoized renders for frozen instances
+        self._compiled = {}
+        self._compiled_globals = None
+        self._memo = OrderedDict()
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        for attr in ('_compiled', '_compiled_globals', '_memo'):
+            d.pop(attr, None)
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.frozen:
+            self._reset_compiled()
 
     def optimize(self, cache=None):
         if cache is None:
@@ -486,6 +597,7 @@ class ChunkedDataDict(metaclass=generic_equality):
         if self.frozen:
             self._dict = mappings.ImmutableDict(d_stream)
             self._global_settings = tuple(g_stream)
+            self._reset_compiled()
         else:
             self._dict.update(d_stream)
             self._global_settings[:] = list(g_stream)
@@ -514,15 +626,70 @@ class ChunkedDataDict(metaclass=generic_equality):
         return str(self.render_to_dict())
 
     def render_pkg(self, pkg, pre_defaults=()):
+        s = set(pre_defaults)
+        if self.frozen:
+            neg, pos = self._render_compiled(pkg)
+            s.difference_update(neg)
+            s.update(pos)
+            return s
         items = self._dict.get(pkg.key)
         if items is None:
             items = self._global_settings
-        s = set(pre_defaults)
         incremental_chunked(s, (cinst for cinst in items if cinst.key.match(pkg)))
         return s
 
     pull_data = render_pkg
 
+    def _render_compiled(self, pkg):
+        """Return the collapsed disabled and enabled sets for a package."""
+        compiled = self._compiled.get(pkg.key)
+        if compiled is None:
+            items = self._dict.get(pkg.key)
+            if items is not None:
+                compiled = self._compiled[pkg.key] = _compile_chunks(items)
+            else:
+                compiled = self._compiled_globals
+                if compiled is None:
+                    compiled = self._compiled_globals = _compile_chunks(
+                        self._global_settings)
+        neg, pos, chunks, memo_attrs = compiled
+        if not chunks:
+            return neg, pos
+
+        if memo_attrs is not None:
+            key = (pkg.key, pkg.fullver)
+            for attr in memo_attrs:
+                if attr == 'repo':
+                    key += (pkg.repo.repo_id,)
+                else:
+                    key += (getattr(pkg, attr),)
+            memo = self._memo
+            result = memo.get(key)
+            if result is not None:
+                try:
+                    memo.move_to_end(key)
+                except KeyError:
+                    # evicted by another thread
+                    pass
+                return result
+
+        neg, pos = set(neg), set(pos)
+        for restrict, cneg, cpos in chunks:
+            if restrict is None or restrict.match(pkg):
+                neg.update(cneg)
+                pos.difference_update(cneg)
+                pos.update(cpos)
+        result = (frozenset(neg), frozenset(pos))
+
+        if memo_attrs is not None:
+            memo[key] = result
+            if len(memo) > self.memo_size:
+                try:
+                    memo.popitem(last=False)
+                except KeyError:
+                    pass
+        return result
+
 
 class PayloadDict(ChunkedDataDict):
 
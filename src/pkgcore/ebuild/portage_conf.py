@@ -27,6 +27,7 @@ from pkgcore.ebuild.repository import errors as repo_errors
 from pkgcore.fs.livefs import sorted_scan
 from pkgcore.log import logger
 from pkgcore.pkgsets.glsa import SecurityUpgrades
+from pkgcore.util import cachefiles
 
 
 def my_convert_hybrid(manager, val, arg_type):
@@ -474,18 +475,21 @@ class PortageConfig(DictMixin):
                 (pjoin(self.dir, 'make.profile'), profile))
 
         user_profile_path = pjoin(self.dir, 'profile')
+        cache_dir = cachefiles.cache_dir('profiles')
         if os.path.isdir(user_profile_path):
             self["profile"] = basics.AutoConfigSection({
                 "class": "pkgcore.ebuild.profiles.UserProfile",
                 "parent_path": paths[0],
                 "parent_profile": paths[1],
                 "user_path": user_profile_path,
+                "cache_dir": cache_dir,
             })
         else:
             self["profile"] = basics.AutoConfigSection({
                 "class": "pkgcore.ebuild.profiles.OnDiskProfile",
                 "basepath": paths[0],
                 "profile": paths[1],
+                "cache_dir": cache_dir,
             })
 
     def _add_fetcher(self, make_conf):
@@ -538,6 +542,12 @@ class PortageConfig(DictMixin):
 
         return base
 
+    @staticmethod
+    def _cache_readonly(cache_parent_dir):
+        while not os.path.exists(cache_parent_dir):
+            cache_parent_dir = os.path.dirname(cache_parent_dir)
+        return not access(cache_parent_dir, os.W_OK | os.X_OK)
+
     def _make_cache(self, cache_format, repo_path):
         """Configure repo cache."""
         # Use md5 cache if it exists or the option is selected, otherwise default
@@ -551,14 +561,25 @@ class PortageConfig(DictMixin):
             repo_path = pjoin('/var/cache/edb/dep', repo_path.lstrip('/'))
             cache_parent_dir = repo_path
 
-        while not os.path.exists(cache_parent_dir):
-            cache_parent_dir = os.path.dirname(cache_parent_dir)
-        readonly = (not access(cache_parent_dir, os.W_OK | os.X_OK))
-
         return basics.AutoConfigSection({
             'class': kls,
             'location': repo_path,
-            'readonly': readonly
+            'readonly': self._cache_readonly(cache_parent_dir),
+        })
+
+    def _make_packed_cache(self, cache_format, repo_path):
+        """Configure single file repo cache layered over the regular cache."""
+        if (os.path.exists(pjoin(repo_path, 'metadata', 'md5-cache')) or
+                cache_format == 'md5-dict'):
+            kls = 'pkgcore.cache.packed.md5_cache'
+        else:
+            kls = 'pkgcore.cache.packed.database'
+        location = pjoin('/var/cache/edb/dep', repo_path.lstrip('/')) + '.pack'
+
+        return basics.AutoConfigSection({
+            'class': kls,
+            'location': location,
+            'readonly': self._cache_readonly(os.path.dirname(location)),
         })
 
     def _register_repo_type(supported_repo_types):
@@ -604,6 +625,19 @@ class PortageConfig(DictMixin):
             self[cache_name] = self._make_cache(repo_obj.cache_format, repo_path)
             repo['cache'] = cache_name
 
+            # optional single file cache, checked before the regular cache and
+            # backfilled from it on misses
+            cache_backend = repo_opts.get('cache-backend', 'default')
+            if cache_backend == 'packed':
+                packed_name = 'cache:packed:' + repo_name
+                self[packed_name] = self._make_packed_cache(
+                    repo_obj.cache_format, repo_path)
+                repo['cache'] = f'{packed_name} {cache_name}'
+            elif cache_backend != 'default':
+                logger.warning(
+                    f'repos.conf: {repo_name!r} repo has unsupported '
+                    f'cache-backend {cache_backend!r}, ignoring')
+
         if repo_name == defaults['main-repo']:
             repo_conf['default'] = True
             repo['default'] = True
@@ -15,7 +15,8 @@ design) reduces regen time by over 40% compared to portage-2.1
 # originally, but it still isn't what I would define as 'right'
 
 __all__ = (
-    "request_ebuild_processor", "release_ebuild_processor", "EbuildProcessor",
+    "request_ebuild_processor", "release_ebuild_processor",
+    "prespawn_ebuild_processors", "configure_processor_pool", "EbuildProcessor",
     "UnhandledCommand", "expected_ebuild_env")
 
 import contextlib
@@ -26,6 +27,7 @@ from itertools import chain
 import os
 import signal
 import sys
+import tempfile
 import threading
 import traceback
 
@@ -42,6 +44,8 @@ from pkgcore.log import logger
 _global_ebp_lock = threading.Lock()
 inactive_ebp_list = []
 active_ebp_list = []
+# limits for idle processors kept around for reuse, see configure_processor_pool()
+_pool_limits = {'size': None, 'max_requests': None}
 
 
 def _single_thread_allowed(functor):
@@ -53,8 +57,16 @@ def _single_thread_allowed(functor):
     return _inner
 
 
+# processors forgotten in forked children; their pipes are shared with the
+# parent so references are kept to avoid __del__ shutting them down
+_forgotten_ebp_list = []
+
+
 @_single_thread_allowed
 def forget_all_processors():
+    """Drop known processors, for use in forked children."""
+    _forgotten_ebp_list.extend(active_ebp_list)
+    _forgotten_ebp_list.extend(inactive_ebp_list)
     active_ebp_list[:] = []
     inactive_ebp_list[:] = []
 
@@ -97,7 +109,7 @@ def request_ebuild_processor(userpriv=False, sandbox=None, fd_pipes=None):
     if sandbox is None:
         sandbox = spawn.is_sandbox_capable()
 
-    for ebp in inactive_ebp_list:
+    for ebp in inactive_ebp_list[:]:
         if ebp.userprived() == userpriv and (ebp.sandboxed() or not sandbox):
             if not ebp.is_alive:
                 inactive_ebp_list.remove(ebp)
@@ -109,6 +121,7 @@ def request_ebuild_processor(userpriv=False, sandbox=None, fd_pipes=None):
         ebp = EbuildProcessor(userpriv, sandbox, fd_pipes=fd_pipes)
         active_ebp_list.append(ebp)
 
+    ebp.requests += 1
     return ebp
 
 
@@ -133,14 +146,70 @@ def release_ebuild_processor(ebp):
 
     assert ebp not in inactive_ebp_list
     # We can't reuse processors that use custom fd mappings or are locked on
-    # release for one reason or another.
-    if ebp.locked or ebp._fd_pipes:
+    # release for one reason or another. Processors are also recycled once
+    # they've served their allotted requests or if enough are idling already.
+    size, max_requests = _pool_limits['size'], _pool_limits['max_requests']
+    if (ebp.locked or ebp._fd_pipes or
+            (max_requests is not None and ebp.requests >= max_requests) or
+            (size is not None and len(inactive_ebp_list) >= size)):
         ebp.shutdown_processor()
     else:
         inactive_ebp_list.append(ebp)
     return True
 
 
+@_single_thread_allowed
+def configure_processor_pool(size=None, max_requests=None):
+    """Configure reuse of released processors.
+
+    :param size: maximum number of idle processors kept around for reuse,
+        None for no limit
+    :param max_requests: number of times a processor is handed out via
+        request_ebuild_processor() before it's shut down on release instead
+        of being reused, None for no limit
+    """
+    _pool_limits['size'] = size
+    _pool_limits['max_requests'] = max_requests
+    if size is not None:
+        while len(inactive_ebp_list) > size:
+            inactive_ebp_list.pop(0).shutdown_processor()
+
+
+def prespawn_ebuild_processors(count, userpriv=False, sandbox=None,
+                               eclass_cache=None, eclasses=()):
+    """Make sure a number of idle processors are ready for use.
+
+    Idle processors are health checked with dead ones being dropped, and new
+    ones spawned to make up the count. All of them get the given eclasses
+    preloaded, in parallel, so subsequent metadata requests avoid both the
+    spawning overhead and parsing commonly inherited eclasses.
+
+    :param count: number of idle processors to have available
+    :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance the
+        eclasses are pulled from
+    :param eclasses: names of eclasses to preload
+    """
+    ebps = [request_ebuild_processor(userpriv=userpriv, sandbox=sandbox)
+            for _ in range(count)]
+    try:
+        if eclass_cache is not None and eclasses:
+            known = eclass_cache.eclasses
+            eclasses = [x for x in eclasses if x in known]
+            # queue up preloads for all processors before waiting on any
+            for ebp in ebps:
+                ebp.preload_eclasses(eclass_cache, async_req=True, limited_to=eclasses)
+            for ebp in ebps:
+                if not ebp._consume_async_expects():
+                    logger.warning('failed preloading eclasses, dropping processor')
+                    drop_ebuild_processor(ebp)
+                    ebp.shutdown_processor(force=True)
+    finally:
+        for ebp in ebps:
+            # warming up doesn't count towards recycling
+            ebp.requests -= 1
+            release_ebuild_processor(ebp)
+
+
 @_single_thread_allowed
 def drop_ebuild_processor(ebp):
     """Force a given processor to be dropped from active/inactive lists.
@@ -291,6 +360,25 @@ def chuck_StoppingCommand(val, ebp, *args):
     raise FinishedProcessing(val)
 
 
+def _transfer_file():
+    """Create an anonymous file used to pass payloads to a daemon by reference.
+
+    :return: file descriptor or None if no file could be created
+    """
+    try:
+        return os.memfd_create('pkgcore-ebd-transfer')
+    except (AttributeError, OSError):
+        pass
+    try:
+        fd, path = tempfile.mkstemp(prefix='pkgcore-ebd-transfer-')
+    except EnvironmentError:
+        return None
+    os.unlink(path)
+    # userpriv'd daemons reopen the file via /dev/fd
+    os.fchmod(fd, 0o644)
+    return fd
+
+
 class EbuildProcessor:
     """Abstraction of a running ebd instance.
 
@@ -308,7 +396,9 @@ class EbuildProcessor:
         spawn_opts = {'umask': 0o002}
 
         self._preloaded_eclasses = {}
+        self._preloaded_eclass_cache = None
         self._eclass_caching = False
+        self.requests = 0
         self._outstanding_expects = []
         self._metadata_paths = None
 
@@ -330,6 +420,8 @@ class EbuildProcessor:
         # open the pipes to be used for chatting with the new daemon
         cread, cwrite = os.pipe()
         dread, dwrite = os.pipe()
+        # large payloads skip the pipes, bash reads those byte by byte
+        self._transfer_fd = _transfer_file()
         self.__sandbox = False
 
         self._fd_pipes = fd_pipes if fd_pipes is not None else {}
@@ -379,6 +471,9 @@ class EbuildProcessor:
         ebd_pipes = {0: 0, 1: 1, 2: 2}
         ebd_pipes.update(self._fd_pipes)
         ebd_pipes.update({max_fd-4: cread, max_fd-3: dwrite})
+        if self._transfer_fd is not None:
+            env["PKGCORE_EBD_TRANSFER_FD"] = str(max_fd-5)
+            ebd_pipes[max_fd-5] = self._transfer_fd
 
         # pgid=0: Each processor is the process group leader for all its
         # spawned children so everything can be terminated easily if necessary.
@@ -425,6 +520,10 @@ class EbuildProcessor:
         :return: True for success, False for everything else
         """
 
+        # preloaded eclasses are tied to the eclass cache they were loaded from
+        # which isn't known here, so don't let them leak into builds
+        if self._preloaded_eclasses and not self.clear_preloaded_eclasses():
+            return False
         self.write(f"process_ebuild {phase}")
         if not self.send_env(env, tmpdir=tmpdir):
             return False
@@ -571,12 +670,30 @@ class EbuildProcessor:
     def clear_preloaded_eclasses(self):
         if self.is_alive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
+        self._preloaded_eclass_cache = None
         return True
 
+    def _verify_preloaded_eclasses(self, eclass_cache):
+        """Drop preloaded eclasses not matching the given eclass cache.
+
+        Preloaded eclasses are looked up by name on the bash side, so reusing
+        a processor with a different eclass cache (e.g. for an overlay
+        overriding eclasses) requires checking they still apply.
+        """
+        if eclass_cache is self._preloaded_eclass_cache:
+            return
+        ec = eclass_cache.eclasses
+        for eclass, path in self._preloaded_eclasses.items():
+            data = ec.get(eclass)
+            if data is None or data.path != path:
+                self.clear_preloaded_eclasses()
+                break
+        self._preloaded_eclass_cache = eclass_cache
+
     def preload_eclasses(self, cache, async_req=False, limited_to=None):
         """Preload an eclass stack's eclasses into bash functions.
 
@@ -587,6 +704,9 @@ class EbuildProcessor:
         :param ec_file: filepath of eclass to preload
         :return: boolean, True for success
         """
+        if self._preloaded_eclasses:
+            self._verify_preloaded_eclasses(cache)
+        self._preloaded_eclass_cache = cache
         ec = cache.eclasses
         if limited_to:
             i = ((eclass, ec[eclass]) for eclass in limited_to)
@@ -687,6 +807,9 @@ class EbuildProcessor:
         # currently, this assumes all went well.
         # which isn't always true.
         self.pid = None
+        if self._transfer_fd is not None:
+            os.close(self._transfer_fd)
+            self._transfer_fd = None
 
     def _generate_env_str(self, env_dict):
         data = []
@@ -714,6 +837,36 @@ class EbuildProcessor:
         # currently using pkgcore-ebuild-helper.
         return f"export {' '.join(data)}"
 
+    def _write_transfer(self, data):
+        """Replace the contents of the transfer file with the given string.
+
+        :return: size of the payload in bytes
+        """
+        data = data.encode()
+        fd = self._transfer_fd
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        # on systems where /dev/fd dups instead of reopening, the offset is shared
+        os.lseek(fd, 0, os.SEEK_SET)
+        return len(data)
+
+    def _write_payload(self, command, data):
+        """Send a command followed by a sized payload.
+
+        If possible, the payload is passed by reference via the transfer file
+        as "<command> fd <size>" so the daemon can source it in one go,
+        otherwise it's sent inline as "<command> <size>" followed by the data.
+        Since the transfer file is reused, the daemon must be done with the
+        payload before the next one is sent.
+        """
+        if self._transfer_fd is None:
+            self.write(f"{command} {len(data)}\n{data}", append_newline=False)
+        else:
+            self.write(f"{command} fd {self._write_transfer(data)}")
+
     def send_env(self, env_dict, async_req=False, tmpdir=None):
         """Transfer the ebuild's desired env (env_dict) to the running daemon.
 
@@ -722,7 +875,9 @@ class EbuildProcessor:
         """
         data = self._generate_env_str(env_dict)
         old_umask = os.umask(0o002)
-        if tmpdir:
+        if not async_req and self._transfer_fd is not None:
+            self._write_payload("start_receiving_env", data)
+        elif tmpdir:
             path = pjoin(tmpdir, 'ebd-env-transfer')
             fileutils.write_file(path, 'wb', data.encode())
             self.write(f"start_receiving_env file {path}")
@@ -770,10 +925,11 @@ class EbuildProcessor:
         # ebuild is not allowed to run any external programs during
         # depend phases; use /dev/null since "" == "."
         self._ensure_metadata_paths(("/dev/null",))
+        if self._preloaded_eclasses:
+            self._verify_preloaded_eclasses(eclass_cache)
 
         env = expected_ebuild_env(package_inst, env, depends=True)
-        data = self._generate_env_str(env)
-        self.write(f"{command} {len(data)}\n{data}", append_newline=False)
+        self._write_payload(command, self._generate_env_str(env))
 
         updates = None
         if self._eclass_caching:
@@ -5,8 +5,10 @@ __all__ = (
 
 from collections import defaultdict, namedtuple
 from functools import partial
+from io import BytesIO
 from itertools import chain
 import os
+import pickle
 
 from snakeoil import caching, klass
 from snakeoil.bash import iter_read_bash, read_bash_dict
@@ -17,6 +19,7 @@ from snakeoil.mappings import ImmutableDict
 from snakeoil.osutils import abspath, pjoin
 from snakeoil.sequences import split_negations, stable_unique
 
+from pkgcore import __version__
 from pkgcore.config import errors
 from pkgcore.config.hint import ConfigHint
 from pkgcore.ebuild import const, ebuild_src, misc, cpv, repo_objs, errors as ebuild_errors
@@ -24,6 +27,8 @@ from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.eapi import get_eapi
 from pkgcore.fs.livefs import sorted_scan
 from pkgcore.log import logger
+from pkgcore.util.cachefiles import (
+    fingerprint, open_private, path_signature, write_private)
 
 
 def package_keywords_splitter(iterable):
@@ -61,6 +66,10 @@ def _read_profile_files(files, allow_line_cont=False):
             yield line, lineno, path
 
 
+# files within a profile node dir that are parsed, see load_property()
+_profile_files = {'profile.bashrc'}
+
+
 def load_property(filename, *, read_func=_read_profile_files, fallback=(),
                   parse_func=lambda x: x, allow_line_cont=False, allow_recurse=False,
                   eapi_optional=None):
@@ -79,6 +88,8 @@ def load_property(filename, *, read_func=_read_profile_files, fallback=(),
         the fallback is returned and no ondisk activity occurs.
     :return: A :py:`klass.jit.attr_named` property instance.
     """
+    _profile_files.add(filename)
+
     def f(func):
         f2 = klass.jit_attr_named(f'_{func.__name__}')
         return f2(partial(
@@ -123,6 +134,32 @@ def _load_and_invoke(func, filename, read_func, fallback, allow_recurse,
             "to enable directory support") from e
 
 
+# attributes stored in the profile cache
+_cached_attrs = set()
+
+# bump when the cached attribute layout changes
+_CACHE_FORMAT = 1
+
+
+def _cached_attr(func):
+    """Decorator for profile stack attributes stored in the profile cache.
+
+    Works like :py:func:`klass.jit_attr`, except the profile cache is loaded
+    first so the attribute can be pulled from it instead of being regenerated.
+    """
+    attr_name = f'_{func.__name__}'
+    _cached_attrs.add(func.__name__)
+
+    def _load(self):
+        self._load_cache()
+        try:
+            return object.__getattribute__(self, attr_name)
+        except AttributeError:
+            return func(self)
+    _load.__doc__ = func.__doc__
+    return klass.jit_attr_named(attr_name)(_load)
+
+
 _make_incrementals_dict = partial(misc.IncrementalsDict, const.incrementals)
 _Packages = namedtuple("_Packages", ("system", "profile"))
 
@@ -509,6 +546,9 @@ class EmptyRootNode(ProfileNode):
 class ProfileStack:
 
     _node_kls = ProfileNode
+    # directory the collapsed profile settings are cached in
+    cache_dir = None
+    _cache_loaded = False
 
     def __init__(self, profile):
         self.profile = profile
@@ -560,23 +600,23 @@ class ProfileStack:
         d.freeze()
         return d
 
-    @klass.jit_attr
+    @_cached_attr
     def forced_use(self):
         return self._collapse_use_dict("forced_use")
 
-    @klass.jit_attr
+    @_cached_attr
     def masked_use(self):
         return self._collapse_use_dict("masked_use")
 
-    @klass.jit_attr
+    @_cached_attr
     def stable_forced_use(self):
         return self._collapse_use_dict("stable_forced_use")
 
-    @klass.jit_attr
+    @_cached_attr
     def stable_masked_use(self):
         return self._collapse_use_dict("stable_masked_use")
 
-    @klass.jit_attr
+    @_cached_attr
     def pkg_use(self):
         return self._collapse_use_dict("pkg_use")
 
@@ -590,7 +630,7 @@ class ProfileStack:
             s.update(val[1])
         return s
 
-    @klass.jit_attr
+    @_cached_attr
     def default_env(self):
         d = dict(self.node.default_env.items())
         for incremental in const.incrementals:
@@ -662,7 +702,7 @@ class ProfileStack:
             return frozenset(self.default_env.get("USE_EXPAND_UNPREFIXED", ()))
         return frozenset(self.default_env.get("USE_EXPAND_UNPREFIXED", "").split())
 
-    @klass.jit_attr
+    @_cached_attr
     def iuse_effective(self):
         iuse_effective = []
 
@@ -682,29 +722,102 @@ class ProfileStack:
 
         return frozenset(iuse_effective)
 
+    @klass.jit_attr
+    def _cache_path(self):
+        key = fingerprint(
+            self.__class__.__module__, self.__class__.__name__, self.profile,
+            self.node.path, getattr(self, 'load_profile_base', None))
+        return pjoin(self.cache_dir, key)
+
+    def _cache_paths(self):
+        """Return the paths the collapsed profile settings depend on."""
+        paths = []
+        for path in stable_unique(node.path for node in self.stack):
+            # missing files are recorded as well, so only the files that are
+            # parsed need to be checked rather than the node dirs themselves
+            for filename in sorted(_profile_files):
+                base = pjoin(path, filename)
+                paths.append(base)
+                # files can be split up into directories
+                if os.path.isdir(base):
+                    for root, dirs, files in os.walk(base):
+                        dirs.sort()
+                        paths.append(root)
+                        paths.extend(pjoin(root, x) for x in sorted(files))
+        repos = {node.repoconfig.location for node in self.stack
+                 if node.repoconfig is not None}
+        for repo in sorted(repos):
+            paths.append(pjoin(repo, repo_objs.RepoConfig.layout_offset))
+            paths.append(pjoin(repo, 'profiles', 'arch.list'))
+        return paths
+
+    def _load_cache(self):
+        """Pull the collapsed profile settings from the profile cache.
+
+        If the cache is missing or stale, all the settings are generated and
+        the cache is updated.
+        """
+        if self.cache_dir is None or self._cache_loaded:
+            return
+        self._cache_loaded = True
+
+        try:
+            with open_private(self._cache_path) as f:
+                header = pickle.load(f)
+                if header[:2] == (_CACHE_FORMAT, __version__) and \
+                        path_signature(header[2]) == header[3]:
+                    for attr, val in pickle.load(f).items():
+                        object.__setattr__(self, attr, val)
+                    return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f'ignoring unusable profile cache {self._cache_path!r}: {e}')
+
+        data = {}
+        for attr in sorted(_cached_attrs):
+            try:
+                data[f'_{attr}'] = getattr(self, attr)
+            except Exception as e:
+                # errors are raised again when the attribute is accessed
+                logger.debug(f'not caching profile {self.path!r} attribute {attr!r}: {e}')
+        try:
+            paths = self._cache_paths()
+            with BytesIO() as f:
+                pickle.dump((_CACHE_FORMAT, __version__, paths, path_signature(paths)), f)
+                pickle.dump(data, f)
+                data = f.getvalue()
+        except Exception as e:
+            logger.debug(f'failed pickling profile {self.path!r}: {e}')
+            return
+        try:
+            write_private(self._cache_path, data)
+        except OSError as e:
+            logger.warning(f'failed writing profile cache {self._cache_path!r}: {e}')
+
     @klass.jit_attr
     def provides_repo(self):
         # delay importing to avoid circular imports
         from pkgcore.ebuild.repository import ProvidesRepo
         return ProvidesRepo(pkgs=self._collapse_generic("pkg_provided"))
 
-    @klass.jit_attr
+    @_cached_attr
     def masks(self):
         return frozenset(chain(self._collapse_generic("masks")))
 
-    @klass.jit_attr
+    @_cached_attr
     def unmasks(self):
         return frozenset(self._collapse_generic('unmasks'))
 
-    @klass.jit_attr
+    @_cached_attr
     def pkg_deprecated(self):
         return frozenset(chain(self._collapse_generic("pkg_deprecated")))
 
-    @klass.jit_attr
+    @_cached_attr
     def keywords(self):
         return tuple(chain.from_iterable(x.keywords for x in self.stack))
 
-    @klass.jit_attr
+    @_cached_attr
     def accept_keywords(self):
         return tuple(chain.from_iterable(x.accept_keywords for x in self.stack))
 
@@ -725,11 +838,11 @@ class ProfileStack:
     bashrc = klass.alias_attr("bashrcs")
     path = klass.alias_attr("node.path")
 
-    @klass.jit_attr
+    @_cached_attr
     def system(self):
         return frozenset(self._collapse_generic('system', clear=True))
 
-    @klass.jit_attr
+    @_cached_attr
     def profile_set(self):
         return frozenset(self._collapse_generic('profile_set', clear=True))
 
@@ -737,15 +850,16 @@ class ProfileStack:
 class OnDiskProfile(ProfileStack):
 
     pkgcore_config_type = ConfigHint(
-        {'basepath': 'str', 'profile': 'str'},
+        {'basepath': 'str', 'profile': 'str', 'cache_dir': 'str'},
         required=('basepath', 'profile'),
         typename='profile',
     )
 
-    def __init__(self, basepath, profile, load_profile_base=True):
+    def __init__(self, basepath, profile, load_profile_base=True, cache_dir=None):
         super().__init__(pjoin(basepath, profile))
         self.basepath = basepath
         self.load_profile_base = load_profile_base
+        self.cache_dir = cache_dir
 
     @staticmethod
     def split_abspath(path):
@@ -775,14 +889,14 @@ class OnDiskProfile(ProfileStack):
             l = (EmptyRootNode._autodetect_and_create(self.basepath),) + l
         return l
 
-    @klass.jit_attr
+    @_cached_attr
     def _incremental_masks(self):
         stack = self.stack
         if self.load_profile_base:
             stack = stack[1:]
         return ProfileStack._incremental_masks(self, stack_override=stack)
 
-    @klass.jit_attr
+    @_cached_attr
     def _incremental_unmasks(self):
         stack = self.stack
         if self.load_profile_base:
@@ -810,11 +924,13 @@ class UserProfileNode(ProfileNode):
 class UserProfile(OnDiskProfile):
 
     pkgcore_config_type = ConfigHint(
-        {'user_path': 'str', 'parent_path': 'str', 'parent_profile': 'str'},
+        {'user_path': 'str', 'parent_path': 'str', 'parent_profile': 'str',
+         'cache_dir': 'str'},
         required=('user_path', 'parent_path', 'parent_profile'),
         typename='profile',
     )
 
-    def __init__(self, user_path, parent_path, parent_profile, load_profile_base=True):
-        super().__init__(parent_path, parent_profile, load_profile_base)
+    def __init__(self, user_path, parent_path, parent_profile, load_profile_base=True,
+                 cache_dir=None):
+        super().__init__(parent_path, parent_profile, load_profile_base, cache_dir)
         self.node = UserProfileNode(user_path, pjoin(parent_path, parent_profile))
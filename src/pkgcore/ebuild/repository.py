@@ -30,6 +30,7 @@ from pkgcore.config.hint import ConfigHint, configurable
 from pkgcore.ebuild import (
     cpv, digest, ebd, repo_objs, atom, restricts, processor,
     ebuild_src, eclass_cache as eclass_cache_mod, errors as ebuild_errors,
+    index as index_mod,
 )
 from pkgcore.ebuild.eapi import get_eapi
 from pkgcore.fs.livefs import sorted_scan
@@ -308,6 +309,8 @@ class UnconfiguredTree(prototype.tree):
     package_factory = staticmethod(ebuild_src.generate_new_factory)
     enable_gpg = False
     extension = '.ebuild'
+    # number of commonly inherited eclasses preloaded into regen processors
+    _preload_eclasses_limit = 30
 
     operations_kls = repo_operations
 
@@ -570,8 +573,43 @@ class UnconfiguredTree(prototype.tree):
         raw = 'raw_pkg_cls' in kwargs or not kwargs.get('versioned', True)
         error_callback = kwargs.pop('error_callback', None)
         kwargs.setdefault('pkg_filter', partial(self._pkg_filter, raw, error_callback))
+        if not raw:
+            restrict = args[0] if args else kwargs.get('restrict')
+            matched = self.secondary_index.match(restrict)
+            if matched is not None:
+                # drop indexed versions that can't match before any metadata is loaded
+                pkg_filter = kwargs['pkg_filter'] or iter
+                kwargs['pkg_filter'] = lambda pkgs: pkg_filter(
+                    self._index_filter(matched, pkgs))
         return super().itermatch(*args, **kwargs)
 
+    def _index_filter(self, matched, pkgs):
+        indexed = self.secondary_index.cpvs
+        for pkg in pkgs:
+            cpv = (pkg.category, pkg.package, pkg.fullver)
+            if cpv in matched or cpv not in indexed:
+                yield pkg
+
+    def _identify_candidates(self, restrict, sorter):
+        index = self.secondary_index
+        matched = index.match(restrict)
+        if matched is None:
+            return super()._identify_candidates(restrict, sorter)
+        candidates = {(cat, pkg) for cat, pkg, _ver in matched}
+        # packages the index doesn't fully cover (e.g. ones with versions
+        # skipped due to bad metadata) are matched normally
+        indexed = index.packages
+        candidates.update(
+            (cat, pkg) for cat in self.categories
+            for pkg in self.packages.get(cat, ()) if (cat, pkg) not in indexed)
+        return sorter(candidates)
+
+    @klass.jit_attr
+    def secondary_index(self):
+        """Secondary metadata indexes, see :obj:`pkgcore.ebuild.index.SecondaryIndex`."""
+        return index_mod.SecondaryIndex(
+            pjoin(self.location, 'metadata', 'pkgcore_index'), self)
+
     def _get_ebuild_path(self, pkg):
         return pjoin(
             self.base, pkg.category, pkg.package,
@@ -621,6 +659,22 @@ class UnconfiguredTree(prototype.tree):
         """Base deprecated packages restriction from profiles/package.deprecated."""
         return packages.OrRestriction(*self.config.pkg_deprecated)
 
+    def _regen_stale_pkgs(self, pkgs, force=False):
+        """Filter packages down to those needing metadata regeneration.
+
+        Forced regens keep all packages, the cache entries are still scanned
+        for eclass usage.
+        """
+        return self.package_class._get_stale_pkgs(pkgs, force=force)
+
+    def _regen_warmup(self, count, eclass_caching=True, **kwds):
+        """Spawn ebuild processors for regen with popular eclasses preloaded."""
+        eclasses = ()
+        if eclass_caching:
+            eclasses = self.package_class.popular_eclasses(self._preload_eclasses_limit)
+        processor.prespawn_ebuild_processors(
+            count, eclass_cache=self.eclass_cache, eclasses=eclasses)
+
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self, force=bool(kwds.get('force', False)),
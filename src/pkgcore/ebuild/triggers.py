@@ -443,14 +443,20 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
         collisions = {}
-
-        # TODO: worth parallelizing this vdb scanning?
-        for pkg in real_pkgs:
-            pkg_file_collisions = pkg.contents.intersection(colliding)
-            if pkg_file_collisions:
-                collisions[pkg.cpvstr] = pkg_file_collisions
+        for repo in self.vdb:
+            if hasattr(repo, 'file_owners'):
+                # use the reverse file ownership index instead of scanning
+                for obj in colliding:
+                    for cpvstr in repo.file_owners(obj.location):
+                        collisions.setdefault(cpvstr, set()).add(obj)
+                continue
+            for pkg in repo:
+                if not pkg.package_is_real:
+                    continue
+                pkg_file_collisions = pkg.contents.intersection(colliding)
+                if pkg_file_collisions:
+                    collisions[pkg.cpvstr] = pkg_file_collisions
 
         if collisions:
             pkg_collisions = [
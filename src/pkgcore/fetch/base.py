@@ -4,15 +4,22 @@ prototype fetcher class, all fetchers should derive from this
 
 __all__ = ("fetcher",)
 
+from contextlib import contextmanager
+import fcntl
 import os
 
 from snakeoil.chksum import get_handlers, get_chksums, MissingChksumHandler
+from snakeoil.osutils import ensure_dirs, pjoin
 
 from pkgcore.fetch import errors
+from pkgcore.log import logger
 
 
 class fetcher:
 
+    # set while a pkgcore.fetch.prefetch.prefetcher has pending fetches
+    prefetcher = None
+
     def _verify(self, file_location, target, all_chksums=True, handlers=None):
         """Internal function for derivatives.
 
@@ -88,6 +95,41 @@ class fetcher:
         """
         raise NotImplementedError(self.get_path)
 
+    @contextmanager
+    def _lock(self, target):
+        """Hold an exclusive lock on a target's file while it's fetched.
+
+        Lock files are kept in the .locks subdirectory of the storage path;
+        if they can't be created fetching continues unlocked.
+        """
+        fd = None
+        path = self.get_storage_path()
+        if path is not None:
+            lockdir = pjoin(path, '.locks')
+            try:
+                st = os.stat(path)
+                if ensure_dirs(lockdir, uid=st.st_uid, gid=st.st_gid, mode=0o775, minimal=True):
+                    fd = os.open(pjoin(lockdir, target.filename), os.O_RDWR | os.O_CREAT, 0o664)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+            except OSError as e:
+                logger.debug('failed locking %s: %s', target.filename, e)
+                if fd is not None:
+                    os.close(fd)
+                    fd = None
+        try:
+            yield
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def abort(self):
+        """Abort fetches running in other threads.
+
+        :return: True if running fetches were aborted, False if the fetcher
+            doesn't support it
+        """
+        return False
+
     def get_storage_path(self):
         """return the directory files are stored in
         returns None if not applicable
@@ -5,15 +5,21 @@ fetcher class that pulls files via executing another program to do the fetching
 __all__ = ("MalformedCommand", "fetcher",)
 
 import os
+import signal
+import threading
 
 from snakeoil.osutils import ensure_dirs, pjoin
-from snakeoil.process.spawn import spawn_bash, is_userpriv_capable
+from snakeoil.process.spawn import cleanup_pids, spawn_bash, is_userpriv_capable
 
 from pkgcore.config.hint import ConfigHint
 from pkgcore.fetch import errors, base, fetchable
 from pkgcore.os_data import portage_uid, portage_gid
 
 
+# guards the fetch commands tracked for aborting
+_spawn_lock = threading.Lock()
+
+
 class MalformedCommand(errors.FetchError):
 
     def __init__(self, command):
@@ -47,6 +53,9 @@ class fetcher(base.fetcher):
         """
         super().__init__()
         self.distdir = distdir
+        # running fetch command pids and the number of aborts requested
+        self._spawned = set()
+        self._aborts = 0
         if required_chksums is not None:
             required_chksums = [x.lower() for x in required_chksums]
         else:
@@ -92,6 +101,7 @@ class fetcher(base.fetcher):
         if not isinstance(target, fetchable):
             raise TypeError(
                 f"target must be fetchable instance/derivative: {target}")
+        aborts = self._aborts
 
         kw = {"mode": 0o775}
         if self.readonly:
@@ -112,37 +122,70 @@ class fetcher(base.fetcher):
         if self.userpriv and is_userpriv_capable():
             spawn_opts.update({"uid": portage_uid, "gid": portage_gid})
 
-        for _attempt in range(self.attempts):
-            try:
-                self._verify(path, target)
-                return path
-            except errors.MissingDistfile as e:
-                command = self.command
-                last_exc = e
-            except errors.ChksumFailure:
-                raise
-            except errors.FetchFailed as e:
-                last_exc = e
-                if not e.resumable:
-                    try:
-                        os.unlink(path)
-                        command = self.command
-                    except OSError as e:
-                        raise errors.UnmodifiableFile(path, e) from e
-                else:
-                    command = self.resume_command
-            # Note we're not even checking the results, the verify portion of
-            # the loop handles this. In other words, don't trust the external
-            # fetcher's exit code, trust our chksums instead.
-            try:
-                spawn_bash(
-                    command % {"URI": next(uris), "FILE": target.filename},
-                    **spawn_opts)
-            except StopIteration:
-                raise errors.FetchFailed(
-                    target.filename, "ran out of urls to fetch from")
-        else:
-            raise last_exc
+        # concurrent fetches of the same file would clobber each other
+        with self._lock(target):
+            for _attempt in range(self.attempts):
+                if self._aborts != aborts:
+                    raise errors.FetchFailed(target.filename, 'fetching aborted')
+                try:
+                    self._verify(path, target)
+                    return path
+                except errors.MissingDistfile as e:
+                    command = self.command
+                    last_exc = e
+                except errors.ChksumFailure:
+                    raise
+                except errors.FetchFailed as e:
+                    last_exc = e
+                    if not e.resumable:
+                        try:
+                            os.unlink(path)
+                            command = self.command
+                        except OSError as e:
+                            raise errors.UnmodifiableFile(path, e) from e
+                    else:
+                        command = self.resume_command
+                # Note we're not even checking the results, the verify portion of
+                # the loop handles this. In other words, don't trust the external
+                # fetcher's exit code, trust our chksums instead.
+                try:
+                    self._spawn(
+                        command % {"URI": next(uris), "FILE": target.filename},
+                        aborts, **spawn_opts)
+                except StopIteration:
+                    raise errors.FetchFailed(
+                        target.filename, "ran out of urls to fetch from")
+            else:
+                raise last_exc
+
+    def _spawn(self, command, aborts, **spawn_opts):
+        """Run a fetch command, tracking it so it can be aborted."""
+        pids = spawn_bash(command, returnpid=True, **spawn_opts)
+        with _spawn_lock:
+            self._spawned.update(pids)
+            aborted = self._aborts != aborts
+        try:
+            for pid in pids:
+                if aborted:
+                    os.kill(pid, signal.SIGTERM)
+                # wait without reaping so aborts can't signal a reused pid
+                os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+                with _spawn_lock:
+                    self._spawned.discard(pid)
+        finally:
+            with _spawn_lock:
+                self._spawned.difference_update(pids)
+            cleanup_pids(pids)
+
+    def abort(self):
+        with _spawn_lock:
+            self._aborts += 1
+            for pid in self._spawned:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        return True
 
     def get_path(self, fetchable):
         path = pjoin(self.distdir, fetchable.filename)
@@ -0,0 +1,139 @@
+"""Background fetching of distfiles.
+
+A :obj:`prefetcher` pulls files ahead of time via a bounded pool of
+concurrent fetches so downloads can overlap with building. Fetchers with
+pending prefetches are flagged so that :obj:`pkgcore.operations.format.fetch_base`
+only blocks on files that haven't finished fetching yet, reusing the
+already verified files otherwise.
+"""
+
+__all__ = ("prefetcher",)
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+
+from pkgcore.fetch import errors
+from pkgcore.log import logger
+
+
+class prefetcher:
+    """Fetch files in the background.
+
+    :param jobs: maximum number of concurrent fetches
+    """
+
+    def __init__(self, jobs=4):
+        self.jobs = jobs
+        self._pool = None
+        self._pending = {}
+        self._fetchers = set()
+        self._lock = threading.Lock()
+        # threads don't survive fork, only the creating process may wait
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _key(fetcher, fetchable):
+        return (getattr(fetcher, 'distdir', None), fetchable.filename)
+
+    def _fetch(self, fetcher, fetchable):
+        try:
+            return fetcher.fetch(fetchable)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except errors.FetchError as e:
+            # left for the regular fetch to handle and report
+            logger.debug('prefetching %s failed: %s', fetchable.filename, e)
+        except Exception as e:
+            logger.warning('prefetching %s failed: %s', fetchable.filename, e)
+        return None
+
+    def add(self, fetcher, fetchables):
+        """Queue fetchables to be fetched in the background.
+
+        Fetchables without URIs or already queued are skipped.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.jobs)
+            for fetchable in fetchables:
+                if not fetchable.uri:
+                    continue
+                key = self._key(fetcher, fetchable)
+                if key in self._pending:
+                    continue
+                self._pending[key] = (
+                    fetcher, self._pool.submit(self._fetch, fetcher, fetchable))
+                if fetcher not in self._fetchers:
+                    self._fetchers.add(fetcher)
+                    fetcher.prefetcher = self
+
+    def add_pkgs(self, domain, pkgs):
+        """Queue the fetchables of the given packages."""
+        for pkg in pkgs:
+            fetch_op = domain.pkg_operations(pkg)._fetch_op
+            if fetch_op.fetcher is not None:
+                self.add(fetch_op.fetcher, fetch_op.fetchables)
+
+    def wait(self, fetcher, fetchable):
+        """Wait for a queued fetchable to finish fetching.
+
+        :return: path to the verified file, or None if the fetchable wasn't
+            queued or prefetching it failed
+        """
+        if os.getpid() != self._pid:
+            return None
+        pending = self._pending.get(self._key(fetcher, fetchable))
+        if pending is None:
+            return None
+        return pending[1].result()
+
+    def done(self, fetcher, fetchables):
+        """Check if all queued fetchables in the given sequence are finished."""
+        for fetchable in fetchables:
+            pending = self._pending.get(self._key(fetcher, fetchable))
+            if pending is not None and not pending[1].done():
+                return False
+        return True
+
+    def wait_all(self, fetcher, fetchables):
+        """Wait for all queued fetchables in the given sequence."""
+        for fetchable in fetchables:
+            self.wait(fetcher, fetchable)
+
+    def shutdown(self, wait=True):
+        """Stop fetching, cancelling anything not yet started.
+
+        :param wait: wait for running fetches to finish, otherwise they're
+            aborted if their fetchers support it
+        """
+        with self._lock:
+            running = defaultdict(list)
+            for (_distdir, filename), (fetcher, future) in self._pending.items():
+                if not future.cancel() and not future.done():
+                    running[fetcher].append(filename)
+            if not wait:
+                for fetcher, filenames in running.items():
+                    if fetcher.abort():
+                        logger.debug('aborted fetching %s', ', '.join(sorted(filenames)))
+                    else:
+                        # threads are still joined when exiting
+                        for filename in sorted(filenames):
+                            logger.warning('waiting for %s to finish fetching', filename)
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+            for fetcher in self._fetchers:
+                if fetcher.prefetcher is self:
+                    fetcher.prefetcher = None
+            self._fetchers.clear()
+            self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -46,7 +46,13 @@ class fetch_base:
         # fetching files without uri won't fly
         # XXX hack atm, could use better logic but works for now
         try:
-            fp = self.fetcher(fetchable)
+            fp = None
+            prefetcher = getattr(self.fetcher, 'prefetcher', None)
+            if prefetcher is not None and not retry:
+                # only block on the file if it's still being fetched
+                fp = prefetcher.wait(self.fetcher, fetchable)
+            if fp is None:
+                fp = self.fetcher(fetchable)
         except fetch_errors.ChksumFailure as e:
             # checksum failed, rename file and try refetching
             path = pjoin(self.fetcher.distdir, fetchable.filename)
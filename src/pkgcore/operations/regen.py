@@ -1,5 +1,10 @@
+import multiprocessing
+from multiprocessing.util import Finalize
+import pickle
+
 from snakeoil.compatibility import IGNORED_EXCEPTIONS
 
+from pkgcore.ebuild import processor
 from pkgcore.package.errors import MetadataException
 from pkgcore.util.thread_pool import map_async
 
@@ -20,19 +25,127 @@ def regen_iter(iterable, regen_func, observer):
             yield pkg, e
 
 
-def regen_repository(repo, pkgs, observer, threads=1, pkg_attr='keywords', **kwargs):
-    helpers = []
+# Per-worker state for process based regen; populated in the parent before
+# the pool forks so workers inherit the repo and package list for free
+# instead of having them pickled across.
+_worker_state = {}
 
-    def _get_repo_helper():
-        if not hasattr(repo, '_regen_operation_helper'):
-            return lambda pkg: getattr(pkg, 'keywords')
-        # for an actual helper, track it and invoke .finish if it exists.
-        helper = repo._regen_operation_helper(**kwargs)
+
+def _get_repo_helper(repo, helpers=None, **kwargs):
+    if not hasattr(repo, '_regen_operation_helper'):
+        return lambda pkg: getattr(pkg, 'keywords')
+    # for an actual helper, track it and invoke .finish if it exists.
+    helper = repo._regen_operation_helper(**kwargs)
+    if helpers is not None:
         helpers.append(helper)
-        return helper
+    return helper
+
+
+def _process_worker_init():
+    # Processors inherited from the parent share its pipes; drop them so each
+    # worker spawns and owns its own ebd instance.
+    processor.forget_all_processors()
+    state = _worker_state
+    if hasattr(state['repo'], '_regen_warmup'):
+        state['repo']._regen_warmup(1, **state['kwargs'])
+    state['helper'] = _get_repo_helper(state['repo'], **state['kwargs'])
+    # pool workers exit via os._exit(), so atexit hooks never fire
+    Finalize(None, _process_worker_finish, exitpriority=10)
+
+
+def _process_worker_finish():
+    _worker_state.pop('helper', None)
+    processor.shutdown_all_processors()
+
+
+def _picklable_error(e):
+    try:
+        pickle.dumps(e)
+    except Exception:
+        return RuntimeError(str(e))
+    return e
+
+
+def _process_worker(indices):
+    pkgs = _worker_state['pkgs']
+    errors = regen_iter(
+        (pkgs[i] for i in indices), _worker_state['helper'], None)
+    return [(pkg.cpvstr, _picklable_error(e)) for pkg, e in errors]
+
+
+def _regen_processes(repo, pkgs, processes, **kwargs):
+    """Regenerate metadata using a pool of forked worker processes.
+
+    Each worker owns its own ebuild processor and writes to the repo's caches
+    directly, so the python side of regen (cache validation, metadata
+    post-processing, and cache writes) isn't serialized behind the GIL.
+    """
+    processes = max(min(len(pkgs), processes), 1)
+    # keep chunks small enough to balance load across workers while
+    # retaining some locality for eclass caching
+    chunksize = max(min(len(pkgs) // (processes * 4), 64), 1)
+    chunks = [
+        range(i, min(i + chunksize, len(pkgs)))
+        for i in range(0, len(pkgs), chunksize)]
+
+    pkg_map = {pkg.cpvstr: pkg for pkg in pkgs}
+    _worker_state.update(repo=repo, pkgs=pkgs, kwargs=kwargs)
+    try:
+        pool = multiprocessing.get_context('fork').Pool(
+            processes, initializer=_process_worker_init)
+        try:
+            for errors in pool.imap_unordered(_process_worker, chunks):
+                for cpvstr, e in errors:
+                    yield pkg_map[cpvstr], e
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    finally:
+        _worker_state.clear()
+
+
+def _caches_shareable(repo):
+    """Determine if all writable repo caches commit each update immediately.
+
+    Process based regen relies on workers writing cache entries out directly,
+    caches queuing updates in memory would lose them on worker exit.
+    """
+    caches = getattr(repo, 'cache', None) or ()
+    if hasattr(caches, 'commit'):
+        caches = [caches]
+    return all(c.autocommits for c in caches if not c.readonly)
+
+
+def regen_repository(repo, pkgs, observer, threads=1, pkg_attr='keywords',
+                     processes=None, **kwargs):
+    """Regenerate metadata for the given packages.
+
+    :param threads: number of threads to use when regenerating in-process
+    :param processes: if set, number of worker processes to use instead of
+        threads; falls back to threads if the repo's caches don't support
+        concurrent writers
+    :return: iterable of (pkg, exception) pairs for failed packages
+    """
+    if hasattr(repo, '_regen_stale_pkgs'):
+        # drop packages with valid cache entries up front in a single pass,
+        # gathering eclass usage for processor warm-up
+        pkgs = repo._regen_stale_pkgs(pkgs, force=bool(kwargs.get('force', False)))
+
+    if processes and _caches_shareable(repo):
+        yield from _regen_processes(repo, pkgs, processes, **kwargs)
+        return
+
+    if pkgs and hasattr(repo, '_regen_warmup'):
+        # spawn processors up front so their eclass preloads run in parallel
+        repo._regen_warmup(threads, **kwargs)
+
+    helpers = []
 
     def get_args():
-        return (_get_repo_helper(), observer)
+        return (_get_repo_helper(repo, helpers, **kwargs), observer)
 
     errors = map_async(pkgs, regen_iter, threads=threads, per_thread_args=get_args)
 
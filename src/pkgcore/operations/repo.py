@@ -227,7 +227,7 @@ class operations(sync_operations):
                 del cache[p]
 
     @_operations_mod.is_standalone
-    def _cmd_api_regen_cache(self, observer=None, threads=1, **kwargs):
+    def _cmd_api_regen_cache(self, observer=None, threads=1, processes=None, **kwargs):
         cache = getattr(self.repo, 'cache', None)
         if not cache and not kwargs.get('force', False):
             return
@@ -244,7 +244,8 @@ class operations(sync_operations):
 
             observer = self._get_observer(observer)
             for pkg, e in regen.regen_repository(
-                    self.repo, pkgs, observer=observer, threads=threads, **kwargs):
+                    self.repo, pkgs, observer=observer, threads=threads,
+                    processes=processes, **kwargs):
                 observer.error(f'caught exception {e} while processing {pkg.cpvstr}')
                 ret = 1
 
@@ -0,0 +1,219 @@
+"""Parallel scheduling of resolver plan operations.
+
+Builds of independent packages are run concurrently in forked worker
+processes while merges to the livefs are serialized in the parent, in an
+order respecting the dependencies between the operations.
+"""
+
+__all__ = ("op_graph", "build_scheduler")
+
+from collections import defaultdict
+import heapq
+import os
+import pickle
+import select
+import sys
+
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.sequences import iflatten_instance
+
+from pkgcore.ebuild import processor
+from pkgcore.ebuild.atom import atom
+from pkgcore.log import logger
+
+
+def op_graph(ops):
+    """Determine ordering constraints between resolver plan operations.
+
+    Since the resolver already orders the plan so dependencies come first,
+    only earlier ops are considered; an op depends on every earlier op for a
+    package matching any of its build or runtime dependencies (including
+    unselected alternatives and blockers), and on earlier ops for the same
+    package key. Removals act as barriers.
+
+    :param ops: sequence of resolver plan ops
+    :return: list of sets of indices each op depends on
+    """
+    deps = []
+    by_key = defaultdict(list)
+    barrier = None
+    for i, op in enumerate(ops):
+        l = set(by_key[op.pkg.key])
+        if barrier is not None:
+            l.add(barrier)
+        if op.desc == 'remove':
+            l.update(range(i))
+            barrier = i
+        else:
+            for attr in ('bdepend', 'depend', 'rdepend'):
+                for x in iflatten_instance(getattr(op.pkg, attr, ()), atom):
+                    l.update(j for j in by_key.get(x.key, ()) if x.match(ops[j].pkg))
+        by_key[op.pkg.key].append(i)
+        deps.append(l)
+    return deps
+
+
+class build_scheduler:
+    """Run resolver plan operations with concurrent builds.
+
+    :param ops: sequence of resolver plan ops
+    :param build: callable run in a forked child for each op that isn't a
+        removal, returning picklable data passed on to the merge, or None on
+        failure
+    :param merge: callable run in the parent with an op and the data from
+        its build (None for removals), returning True on success
+    :param jobs: maximum number of concurrent builds
+    :param load_average: don't start new builds while other builds are
+        running and the system load average is at or above this limit
+    :param prepare: optional callable run in the parent with an op right
+        before its build is forked, returning False to defer the build since
+        it can't be started yet (e.g. its distfiles are still being fetched);
+        it must not block
+    """
+
+    # seconds between load average checks when builds are being held back
+    poll_interval = 1.0
+
+    def __init__(self, ops, build, merge, jobs=1, load_average=None, prepare=None):
+        self.ops = list(ops)
+        self.build = build
+        self.merge = merge
+        self.jobs = max(jobs, 1)
+        self.load_average = load_average
+        self.prepare = prepare
+        self.deps = op_graph(self.ops)
+
+    def _load_allows(self, running):
+        if not running or self.load_average is None:
+            return True
+        try:
+            return os.getloadavg()[0] < self.load_average
+        except OSError:
+            return True
+
+    def _fork_build(self, op):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(wfd)
+            return pid, rfd
+
+        # child; never return into the caller's stack
+        code = 1
+        try:
+            os.close(rfd)
+            # processors inherited from the parent share its pipes
+            processor.forget_all_processors()
+            result = None
+            try:
+                result = self.build(op)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                logger.error('failed building %s: %s', op.pkg.cpvstr, e)
+            data = pickle.dumps(result)
+            with os.fdopen(wfd, 'wb') as f:
+                f.write(data)
+            code = 0
+        finally:
+            try:
+                processor.shutdown_all_processors()
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    @staticmethod
+    def _reap_build(pid, fd):
+        with os.fdopen(fd, 'rb') as f:
+            data = f.read()
+        _, status = os.waitpid(pid, 0)
+        if status or not data:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def run(self, ignore_failures=False):
+        """Run all ops.
+
+        :param ignore_failures: if False, no new builds are started and
+            nothing else is merged after the first failure
+        :return: list of ops that weren't completed, either due to failing
+            or due to depending on failed ops
+        """
+        waiting = [set(x) for x in self.deps]
+        rdeps = defaultdict(list)
+        for i, deps in enumerate(self.deps):
+            for j in deps:
+                rdeps[j].append(i)
+        ready = [i for i, deps in enumerate(waiting) if not deps]
+        heapq.heapify(ready)
+        # fd -> (pid, op index)
+        running = {}
+        built = []
+        failed = set()
+        done = set()
+
+        def fail(i):
+            stack = [i]
+            while stack:
+                i = stack.pop()
+                if i not in failed:
+                    failed.add(i)
+                    stack.extend(rdeps[i])
+
+        try:
+            while True:
+                if failed and not ignore_failures:
+                    ready = []
+                    built = []
+
+                deferred = []
+                while ready and len(running) < self.jobs and self._load_allows(running):
+                    i = heapq.heappop(ready)
+                    if i in failed:
+                        continue
+                    if self.ops[i].desc == 'remove':
+                        heapq.heappush(built, (i, None))
+                    elif self.prepare is not None and not self.prepare(self.ops[i]):
+                        deferred.append(i)
+                    else:
+                        pid, fd = self._fork_build(self.ops[i])
+                        running[fd] = (pid, i)
+                for i in deferred:
+                    heapq.heappush(ready, i)
+
+                if built:
+                    # merges are serialized, builds continue in the background
+                    i, result = heapq.heappop(built)
+                    if not self.merge(self.ops[i], result):
+                        fail(i)
+                        continue
+                    done.add(i)
+                    for j in rdeps[i]:
+                        waiting[j].discard(i)
+                        if not waiting[j] and j not in failed:
+                            heapq.heappush(ready, j)
+                elif running or ready:
+                    # builds are held back by the load average or deferred if
+                    # any are ready
+                    timeout = self.poll_interval if ready else None
+                    fds, _, _ = select.select(list(running), [], [], timeout)
+                    for fd in fds:
+                        pid, i = running.pop(fd)
+                        result = self._reap_build(pid, fd)
+                        if result is None:
+                            fail(i)
+                        else:
+                            heapq.heappush(built, (i, result))
+                else:
+                    break
+        finally:
+            for fd, (pid, i) in running.items():
+                self._reap_build(pid, fd)
+
+        return [op for i, op in enumerate(self.ops) if i not in done]
@@ -11,6 +11,7 @@ from snakeoil.klass import GetAttrProxy, DirProxy
 from pkgcore.operations.repo import operations_proxy
 from pkgcore.repository import prototype, errors
 from pkgcore.restrictions import restriction
+from pkgcore.restrictions.compiler import compile_restriction
 
 
 class tree(prototype.tree):
@@ -27,6 +28,7 @@ class tree(prototype.tree):
         if not isinstance(restrict, restriction.base):
             raise errors.InitializationError(f"{restrict} is not a restriction")
         self.restrict = restrict
+        self._match = compile_restriction(restrict)
         self.raw_repo = repo
         if sentinel_val:
             self._filterfunc = filter
@@ -40,7 +42,7 @@ class tree(prototype.tree):
         # (determined by repo's attributes) versus what does cost
         # (metadata pull for example).
         return self._filterfunc(
-            self.restrict.match, self.raw_repo.itermatch(restrict, **kwds))
+            self._match, self.raw_repo.itermatch(restrict, **kwds))
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
@@ -56,7 +58,7 @@ class tree(prototype.tree):
 
     def __getitem__(self, key):
         v = self.raw_repo[key]
-        if self.restrict.match(v) != self.sentinel_val:
+        if self._match(v) != self.sentinel_val:
             raise KeyError(key)
         return v
 
@@ -5,6 +5,7 @@ repository that combines multiple repos together
 __all__ = ("tree", "operations")
 
 from functools import partial
+import heapq
 from itertools import chain
 from operator import itemgetter
 import os
@@ -164,6 +165,15 @@ class tree(prototype.tree):
             return (match for repo in self.trees
                     for match in repo.itermatch(restrict, **kwds))
 
+        iters = [repo.itermatch(restrict, **kwds) for repo in self.trees]
+        if sorter is sorted:
+            return heapq.merge(*iters)
+        elif isinstance(sorter, partial) and sorter.func is sorted and not sorter.args:
+            # key based sorters can merge the presorted streams directly
+            return heapq.merge(
+                *iters, key=sorter.keywords.get('key'),
+                reverse=sorter.keywords.get('reverse', False))
+
         # ugly, and a bit slow, but works.
         def f(x, y):
             l = sorter([x, y])
@@ -171,8 +181,7 @@ class tree(prototype.tree):
                 return 1
             return -1
         f = post_curry(sorted_cmp, f, key=itemgetter(0))
-        return iter_sort(
-            f, *[repo.itermatch(restrict, **kwds) for repo in self.trees])
+        return iter_sort(f, *iters)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
@@ -16,6 +16,7 @@ from snakeoil.sequences import iflatten_instance
 from pkgcore.ebuild.atom import atom
 from pkgcore.operations import repo
 from pkgcore.restrictions import values, boolean, restriction, packages
+from pkgcore.restrictions.compiler import compile_restriction
 from pkgcore.restrictions.util import collect_package_restrictions
 
 
@@ -271,7 +272,11 @@ class tree:
             candidates = self._identify_candidates(restrict, sorter)
 
         if force is None:
-            match = restrict.match
+            if isinstance(restrict, atom):
+                # atoms only match a single package's versions; not worth compiling
+                match = restrict.match
+            else:
+                match = compile_restriction(restrict)
         elif force:
             match = restrict.force_True
         else:
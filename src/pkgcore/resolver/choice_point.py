@@ -133,6 +133,27 @@ class choice_point:
             return False
         return self.reduce_atoms([])
 
+    def pending_pkgs(self):
+        """Return the current package followed by all remaining matches.
+
+        The remaining matches are loaded in the process.
+        """
+        if not self:
+            return []
+        remaining = list(self.matches)
+        self.matches = iter(remaining)
+        return [self.matches_cur] + remaining
+
+    def restrict_pkgs(self, pkgs):
+        """Limit the choice point to a subset of its pending packages.
+
+        :param pkgs: sequence of packages, the first becoming the current
+            package unless removed by existing solution filters
+        """
+        self.matches = iter(pkgs)
+        self.matches_cur = None
+        self.reduce_atoms([])
+
     @property
     def bdepend(self):
         """Build time dependencies for CBUILD."""
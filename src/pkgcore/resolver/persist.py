@@ -0,0 +1,193 @@
+"""Persistent resolver plans.
+
+A resolved :obj:`pkgcore.resolver.state.plan_state` can be saved together
+with a fingerprint of the inputs that produced it. When the fingerprint
+matches on a later run, the recorded operations are replayed into a fresh
+resolver instead of redoing the resolution; any targets that weren't part of
+the saved plan are then resolved on top of it.
+
+Packages aren't serialized directly, they're stored as references that are
+looked up again from the resolver's repos when the plan is loaded.
+"""
+
+__all__ = ("plan_cache", "repo_signature", "domain_signature")
+
+from io import BytesIO
+import os
+import pickle
+
+from snakeoil.osutils import listdir_files, pjoin
+
+from pkgcore.ebuild import const
+from pkgcore.ebuild.atom import atom
+from pkgcore.log import logger
+from pkgcore.package.base import base as package_base
+from pkgcore.resolver import state
+from pkgcore.resolver.choice_point import choice_point
+from pkgcore.util.cachefiles import (
+    dir_paths, open_private, path_signature, tree_paths, write_private)
+
+# bump when the pickled op layout changes
+_FORMAT = 1
+
+
+def repo_signature(repo):
+    """Return the modification state of a repo and its caches.
+
+    Metadata cache entries are written via renames so the mtimes of the
+    cache directories (and their immediate subdirectories) change when they
+    are regenerated.
+    """
+    paths = []
+    location = getattr(repo, 'location', None)
+    if location is not None:
+        paths.extend(tree_paths(location))
+        paths.append(pjoin(location, 'metadata', 'timestamp.chk'))
+    for cache in getattr(repo, 'cache', ()):
+        cache_location = getattr(cache, 'location', None)
+        if cache_location is not None:
+            paths.extend(dir_paths(cache_location))
+    return (getattr(repo, 'repo_id', None), location, path_signature(paths))
+
+
+def domain_signature(domain):
+    """Return the state of a domain's settings, configuration, and profile."""
+    paths = []
+    for root, dirs, files in os.walk(domain.config_dir):
+        dirs.sort()
+        paths.append(root)
+        paths.extend(pjoin(root, x) for x in sorted(files))
+    for node in domain.profile.stack:
+        paths.append(node.path)
+        try:
+            paths.extend(pjoin(node.path, x) for x in sorted(listdir_files(node.path)))
+        except OSError:
+            pass
+    settings = dict(domain.settings)
+    # expanded incrementals are stored in arbitrary order
+    for key in const.incrementals:
+        if key not in ('USE', 'ACCEPT_LICENSE') and isinstance(settings.get(key), tuple):
+            settings[key] = frozenset(settings[key])
+    return (domain.name, settings, path_signature(paths))
+
+
+def _dump_op(op):
+    if isinstance(op, state.add_hardref_op):
+        return op.__class__, (op.restriction,), {}
+    elif isinstance(op, state.blocker_base_op):
+        return op.__class__, (op.choices, op.blocker, op.key), {}
+    return op.__class__, (op.choices, op.pkg), {'force': op.force}
+
+
+class _plan_pickler(pickle.Pickler):
+
+    def persistent_id(self, obj):
+        if isinstance(obj, choice_point):
+            obj = obj.matches_cur
+            if obj is None:
+                raise pickle.PicklingError('exhausted choice point in plan')
+            return ('choices', obj.repo.repo_id, obj.cpvstr)
+        elif isinstance(obj, package_base):
+            return ('pkg', obj.repo.repo_id, obj.cpvstr)
+        return None
+
+
+class _plan_unpickler(pickle.Unpickler):
+
+    def __init__(self, f, repos):
+        super().__init__(f)
+        self._repos = repos
+        self._pkgs = {}
+        self._choices = {}
+
+    def _find_pkg(self, repo_id, cpvstr):
+        key = (repo_id, cpvstr)
+        pkg = self._pkgs.get(key)
+        if pkg is None:
+            restrict = atom(f'={cpvstr}')
+            for repo in self._repos:
+                for pkg in repo.match(restrict):
+                    if pkg.repo.repo_id == repo_id:
+                        break
+                else:
+                    continue
+                break
+            else:
+                raise pickle.UnpicklingError(f'{cpvstr}::{repo_id} no longer exists')
+            self._pkgs[key] = pkg
+        return pkg
+
+    def persistent_load(self, pid):
+        kind, repo_id, cpvstr = pid
+        pkg = self._find_pkg(repo_id, cpvstr)
+        if kind == 'pkg':
+            return pkg
+        choices = self._choices.get(pkg)
+        if choices is None:
+            choices = self._choices[pkg] = choice_point(pkg.versioned_atom, [pkg])
+            choices.current_pkg
+        return choices
+
+
+class plan_cache:
+    """Resolver plan persisted to a file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, resolver, fingerprint, targets):
+        """Replay a saved plan into a fresh resolver.
+
+        :param resolver: :obj:`pkgcore.resolver.plan.merge_plan` instance that
+            hasn't resolved anything yet, it's reset if replaying fails
+        :param fingerprint: fingerprint of the inputs, excluding the targets
+        :param targets: requested target restrictions
+        :return: None if the saved plan isn't usable, else the list of targets
+            that still need to be resolved
+        """
+        try:
+            with open_private(self.path) as f:
+                header = pickle.load(f)
+                if header != (_FORMAT, fingerprint):
+                    return None
+                saved_targets = pickle.load(f)
+                requested = {str(x) for x in targets}
+                if not requested.issuperset(saved_targets):
+                    return None
+                ops = [kls(*args, **kwargs) for kls, args, kwargs in
+                       _plan_unpickler(f, resolver.all_raw_dbs).load()]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug('failed loading resolver plan %r: %s', self.path, e)
+            return None
+
+        plan = resolver.state
+        for op in ops:
+            op.apply(plan)
+            # ops that don't apply cleanly aren't added to the plan
+            if not plan.plan or plan.plan[-1] is not op:
+                logger.debug('failed replaying resolver plan %r: %s', self.path, op)
+                resolver.reset()
+                return None
+        return [x for x in targets if str(x) not in saved_targets]
+
+    def save(self, resolver, fingerprint, targets):
+        """Save a resolver's plan, returning True if it was written."""
+        try:
+            data = pickle.dumps((_FORMAT, fingerprint))
+            data += pickle.dumps(frozenset(str(x) for x in targets))
+            with BytesIO() as f:
+                _plan_pickler(f).dump([_dump_op(x) for x in resolver.state.plan])
+                data += f.getvalue()
+        except Exception as e:
+            logger.debug('failed pickling resolver plan: %s', e)
+            return False
+
+        try:
+            write_private(self.path, data)
+        except OSError as e:
+            logger.warning('failed writing resolver plan %r: %s', self.path, e)
+            return False
+        return True
+
@@ -1,5 +1,7 @@
 __all__ = ("PigeonHoledSlots",)
 
+from itertools import chain
+
 from pkgcore.restrictions import restriction
 
 # lil too getter/setter like for my tastes...
@@ -9,12 +11,21 @@ class PigeonHoledSlots:
     """class for tracking slotting to a specific atom/obj key
     no atoms present, just prevents conflicts of obj.key; atom present, assumes
     it's a blocker and ensures no obj matches the atom for that key
+
+    Both objs and limiters are indexed by key and slot so conflicts only need
+    to be checked against the relevant slot.
     """
 
     def __init__(self):
+        # key -> slot -> objs
         self.slot_dict = {}
+        # key -> slot -> limiters; limiters not bound to a slot use None
         self.limiters = {}
 
+    @staticmethod
+    def _slot(atom):
+        return getattr(atom, 'slot', None)
+
     def fill_slotting(self, obj, force=False):
         """Try to insert obj in.
 
@@ -23,24 +34,34 @@ class PigeonHoledSlots:
 
         l = self.check_limiters(obj)
 
-        key = obj.key
-        dslot = obj.slot
-        l.extend(x for x in self.slot_dict.get(key, ()) if x.slot == dslot)
+        slots = self.slot_dict.get(obj.key)
+        if slots is not None:
+            l.extend(slots.get(obj.slot, ()))
 
         if not l or force:
-            self.slot_dict.setdefault(key, []).append(obj)
+            if slots is None:
+                slots = self.slot_dict[obj.key] = {}
+            slots.setdefault(obj.slot, []).append(obj)
         return l
 
     def get_conflicting_slot(self, pkg):
-        for x in self.slot_dict.get(pkg.key, ()):
-            if pkg.slot == x.slot:
-                return x
+        l = self.slot_dict.get(pkg.key, {}).get(pkg.slot)
+        if l:
+            return l[0]
         return None
 
     def find_atom_matches(self, atom, key=None):
         if key is None:
             key = atom.key
-        return list(filter(atom.match, self.slot_dict.get(key, ())))
+        slots = self.slot_dict.get(key)
+        if not slots:
+            return []
+        slot = self._slot(atom)
+        if slot is None:
+            objs = chain.from_iterable(slots.values())
+        else:
+            objs = slots.get(slot, ())
+        return list(filter(atom.match, objs))
 
     def add_limiter(self, atom, key=None):
         """add a limiter, returning any conflicting objs"""
@@ -51,38 +72,45 @@ class PigeonHoledSlots:
 
         if key is None:
             key = atom.key
-        self.limiters.setdefault(key, []).append(atom)
+        self.limiters.setdefault(key, {}).setdefault(
+            self._slot(atom), []).append(atom)
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the passed in obj"""
-        key = obj.key
-        return [x for x in self.limiters.get(key, ()) if x.match(obj)]
+        limiters = self.limiters.get(obj.key)
+        if not limiters:
+            return []
+        l = [x for x in limiters.get(None, ()) if x.match(obj)]
+        if obj.slot is not None:
+            l.extend(x for x in limiters.get(obj.slot, ()) if x.match(obj))
+        return l
 
-    def remove_slotting(self, obj):
-        key = obj.key
+    @staticmethod
+    def _remove(d, key, slot, obj):
         # let the key error be thrown if they screwed up.
-        slots = self.slot_dict.get(key, ())
-        l = [x for x in slots if x is not obj]
-        if len(l) == len(slots):
+        slots = d.get(key, {})
+        objs = slots.get(slot, ())
+        l = [x for x in objs if x is not obj]
+        if len(l) == len(objs):
             raise KeyError(f"obj {obj} isn't slotted")
         if l:
-            self.slot_dict[key] = l
+            slots[slot] = l
         else:
-            del self.slot_dict[key]
+            del slots[slot]
+            if not slots:
+                del d[key]
+
+    def remove_slotting(self, obj):
+        self._remove(self.slot_dict, obj.key, self._slot(obj), obj)
 
     def remove_limiter(self, atom, key=None):
         if key is None:
             key = atom.key
-        l = [x for x in self.limiters[key] if x is not atom]
-        if len(l) == len(self.limiters[key]):
-            raise KeyError(f"obj {atom} isn't slotted")
-        if not l:
-            del self.limiters[key]
-        else:
-            self.limiters[key] = l
+        self._remove(self.limiters, key, self._slot(atom), atom)
 
     def __contains__(self, obj):
         if isinstance(obj, restriction.base):
-            return obj in self.limiters.get(obj.key, ())
-        return obj in self.slot_dict.get(obj.key, ())
+            return obj in self.limiters.get(obj.key, {}).get(
+                self._slot(obj), ())
+        return obj in self.slot_dict.get(obj.key, {}).get(obj.slot, ())
@@ -4,17 +4,22 @@ from collections import deque
 from functools import partial
 import operator
 from itertools import chain, islice, filterfalse
+import os
+import pickle
+import signal
 import sys
 
-from snakeoil.compatibility import cmp, sort_cmp
 from snakeoil.iterables import caching_iter
 
 # XXX: hack; see insert_blockers
 from pkgcore.ebuild import atom as _atom
+from pkgcore.ebuild import processor
+from pkgcore.log import logger
 from pkgcore.repository import misc, multiplex, filtered, util
 from pkgcore.resolver import state
 from pkgcore.resolver.choice_point import choice_point
 from pkgcore.restrictions import packages, values, restriction
+from pkgcore.util.packages import sort_key
 
 limiters = set(["cycle"])
 
@@ -28,8 +33,8 @@ def dprint(handle, fmt, args=None, label=None):
 
 
 # iter/pkg sorting functions for selection strategy
-pkg_sort_highest = partial(sorted, reverse=True)
-pkg_sort_lowest = sorted
+pkg_sort_highest = partial(sorted, key=sort_key, reverse=True)
+pkg_sort_lowest = partial(sorted, key=sort_key)
 
 pkg_grabber = operator.itemgetter(0)
 
@@ -41,44 +46,29 @@ def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return sort_key(pkg), getattr(pkg.repo, 'livefs', False)
+    l.sort(key=f, reverse=True)
     return l
 
 
 def downgrade_iter_sort(restrict, l, pkg_grabber=pkg_grabber):
     """Sort a list of packages from highest to lowest and prefer nonlivefs.
 
+    Nonlivefs packages not matching the given restriction are preferred over
+    those that do.
+
     :param l: list of packages
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if x.repo.livefs:
-            if y.repo.livefs:
-                return c
-            return -1
-        elif y.repo.livefs:
-            return 1
-        elif restrict.match(x):
-            if restrict.match(y):
-                return 1
-            return -1
-        elif restrict.match(y):
-            return 1
-        return c
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    def f(x):
+        pkg = pkg_grabber(x)
+        if getattr(pkg.repo, 'livefs', False):
+            return False, False, sort_key(pkg)
+        return True, not restrict.match(pkg), sort_key(pkg)
+    l.sort(key=f, reverse=True)
     return l
 
 
@@ -89,18 +79,10 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return sort_key(pkg), not getattr(pkg.repo, 'livefs', False)
+    l.sort(key=f)
     return l
 
 
@@ -251,7 +233,8 @@ class merge_plan:
 
     def __init__(self, dbs, per_repo_strategy, global_strategy=None,
                  depset_reorder_strategy=None, process_built_depends=False,
-                 drop_cycles=False, debug=False, debug_handle=None):
+                 drop_cycles=False, debug=False, debug_handle=None,
+                 speculative_jobs=1, speculative_depth=2, profiler=None):
         if debug:
             if debug_handle is None:
                 debug_handle = sys.stdout
@@ -281,22 +264,76 @@ class merge_plan:
                 for x in self.all_raw_dbs if x.livefs])
 
         self.insoluble = set()
+        # candidate matches keyed by (atom, dbs); lookups against the livefs
+        # dbs also depend on the current vdb filter and forced restrictions
+        self._candidates_cache = {}
+        self._candidates_token = (None, None)
+        self.candidates_hits = self.candidates_misses = 0
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = \
             self._ensure_livefs_is_loaded_nonpreloaded
         self.drop_cycles = drop_cycles
         self.process_built_depends = process_built_depends
         self._debugging = debug
+        # speculative evaluation of choice points in forked children; disabled
+        # for debugging since the output of the children is discarded
+        self.speculative_jobs = 1 if debug else speculative_jobs
+        self.speculative_depth = speculative_depth
         if debug:
             self._rec_add_atom = partial(self._stack_debugging_rec_add_atom,
                 self._rec_add_atom)
             self._debugging_depth = 0
             self._debugging_drop_cycles = False
+        # optional pkgcore.resolver.profile.resolver_profiler instance
+        self.profiler = profiler
+        if profiler is not None:
+            self._rec_add_atom = partial(self._profiling_rec_add_atom,
+                self._rec_add_atom)
 
     @property
     def forced_restrictions(self):
         return frozenset(self.state.forced_restrictions)
 
+    @property
+    def candidates_stats(self):
+        """Return hit/miss statistics for the candidate cache."""
+        return {
+            'hits': self.candidates_hits,
+            'misses': self.candidates_misses,
+            'size': len(self._candidates_cache),
+        }
+
+    def _filter_token(self):
+        generation, token = self._candidates_token
+        if generation != self.state.filter_generation:
+            token = (frozenset(self.state.vdb_filter),
+                     frozenset(self.state.forced_restrictions))
+            self._candidates_token = (self.state.filter_generation, token)
+        return token
+
+    def candidates(self, atom, dbs):
+        """Return the sorted and filtered matches for an atom from the given dbs.
+
+        Results are cached for the lifetime of the resolver (or until
+        :obj:`free_caches` is called) since the same atoms get queried
+        repeatedly, especially across backtracking.
+
+        :return: :obj:`caching_iter` of matching packages
+        """
+        if dbs is self.livefs_dbs:
+            key = (atom, dbs, self._filter_token())
+        else:
+            key = (atom, dbs)
+        matches = self._candidates_cache.get(key)
+        if matches is None:
+            self.candidates_misses += 1
+            if self.profiler is not None:
+                self.profiler.itermatch(atom)
+            matches = self._candidates_cache[key] = caching_iter(dbs.itermatch(atom))
+        else:
+            self.candidates_hits += 1
+        return matches
+
     def reset(self, point=0):
         self.state.backtrack(point)
 
@@ -332,6 +369,19 @@ class merge_plan:
             "choice for %s%s, %s succeeded%s",
             (stack.depth * 2 * ' ', atom, choices.current_pkg, msg))
 
+    def notify_backtrack(self, stack):
+        """Roll back the plan to the start of the current frame."""
+        frame = stack.current_frame
+        if self.profiler is not None:
+            self.profiler.backtrack(
+                frame.atom, stack.depth,
+                self.state.current_state - frame.start_point)
+        self.state.backtrack(frame.start_point)
+
+    def notify_cycle(self, stack, atom, msg):
+        if self.profiler is not None:
+            self.profiler.cycle(atom, stack.depth, msg)
+
     def notify_viable(self, stack, atom, viable, msg='', pre_solved=False):
         t_viable = viable and "processing" or "not viable"
         if pre_solved and viable:
@@ -411,6 +461,15 @@ class merge_plan:
             self._debugging_drop_cycles = False
         return ret
 
+    def _profiling_rec_add_atom(self, func, atom, stack, dbs, **kwds):
+        self.profiler.enter(atom)
+        ret = None
+        try:
+            ret = func(atom, stack, dbs, **kwds)
+        finally:
+            self.profiler.exit(atom, failed=bool(ret))
+        return ret
+
     def _rec_add_atom(self, atom, stack, dbs, mode="none", drop_cycles=False):
         """Add an atom.
 
@@ -448,6 +507,42 @@ class merge_plan:
             stack.pop_frame(ret is None)
             return ret
 
+        if (self.speculative_jobs > 1 and depth <= self.speculative_depth and
+                hasattr(os, 'fork')):
+            solved, failures = self._speculate(atom, stack, choices, depth)
+        else:
+            solved, failures = self._try_choices(atom, stack, choices, depth)
+        if solved:
+            stack.pop_frame(True)
+            return None
+
+        self._dprint("no solution  %s%s", (depth*2*" ", atom))
+        stack.add_event(("debug", "ran out of choices",))
+        self.notify_backtrack(stack)
+        # saving roll.  if we're allowed to drop cycles, try it again.
+        # this needs to be *far* more fine grained also. it'll try
+        # regardless of if it's a cycle issue
+        if not drop_cycles and self.drop_cycles:
+            stack.add_event(("cycle", stack.current_frame, "trying to drop any cycles"),)
+            self.notify_cycle(stack, atom, "trying to drop any cycles")
+            self._dprint(
+                "trying saving throw for %s ignoring cycles",
+                atom, "cycle")
+            # note everything is retored to a pristine state prior also.
+            stack[-1].ignored = True
+            l = self._rec_add_atom(atom, stack, dbs,
+                mode=mode, drop_cycles=True)
+            if not l:
+                stack.pop_frame(True)
+                return None
+        stack.pop_frame(False)
+        return [atom] + failures
+
+    def _try_choices(self, atom, stack, choices, depth):
+        """Walk the choice point's packages until one can be inserted.
+
+        :return: tuple of whether a package was inserted and the last failures
+        """
         failures = []
 
         debugging = self._debugging
@@ -495,14 +590,13 @@ class merge_plan:
                 self.notify_choice_succeeded(
                     stack, atom, choices,
                     "already exists in the state plan")
-                stack.pop_frame(True)
-                return None
+                return True, None
             elif l is not None:
                 # failure.
                 self.notify_choice_failed(
                     stack, atom, choices,
                     "failed inserting: %s", l)
-                self.state.backtrack(stack.current_frame.start_point)
+                self.notify_backtrack(stack)
                 choices.force_next_pkg()
                 continue
 
@@ -513,29 +607,127 @@ class merge_plan:
             additions += new_additions
 
             self.notify_choice_succeeded(stack, atom, choices)
-            stack.pop_frame(True)
-            return None
+            return True, None
 
-        self._dprint("no solution  %s%s", (depth*2*" ", atom))
-        stack.add_event(("debug", "ran out of choices",))
-        self.state.backtrack(stack.current_frame.start_point)
-        # saving roll.  if we're allowed to drop cycles, try it again.
-        # this needs to be *far* more fine grained also. it'll try
-        # regardless of if it's a cycle issue
-        if not drop_cycles and self.drop_cycles:
-            stack.add_event(("cycle", stack.current_frame, "trying to drop any cycles"),)
-            self._dprint(
-                "trying saving throw for %s ignoring cycles",
-                atom, "cycle")
-            # note everything is retored to a pristine state prior also.
-            stack[-1].ignored = True
-            l = self._rec_add_atom(atom, stack, dbs,
-                mode=mode, drop_cycles=True)
-            if not l:
-                stack.pop_frame(True)
-                return None
-        stack.pop_frame(False)
-        return [atom] + failures
+        return False, failures
+
+
+    def _speculate(self, atom, stack, choices, depth):
+        """Walk a choice point, evaluating its fallbacks in parallel.
+
+        The first package is tried directly since it usually works out. If
+        it fails, each remaining package is tried against a copy of the
+        current plan in a forked child. The choice point is then restricted
+        to start at the first package that didn't fail so the parent only
+        replays the branch that is known to be viable, retaining the normal
+        selection order.
+
+        :return: tuple of whether a package was inserted and the last failures
+        """
+        pkgs = choices.pending_pkgs()
+        if len(pkgs) < 3:
+            # nothing to run in parallel once the first package fails
+            return self._try_choices(atom, stack, choices, depth)
+        choices.restrict_pkgs(pkgs[:1])
+        solved, failures = self._try_choices(atom, stack, choices, depth)
+        if solved:
+            return solved, failures
+
+        pkgs = pkgs[1:]
+        results = []
+        for start in range(0, len(pkgs), self.speculative_jobs):
+            batch = pkgs[start:start + self.speculative_jobs]
+            children = []
+            for pkg in batch:
+                try:
+                    children.append(self._fork_choice(atom, stack, choices, depth, pkg))
+                except OSError as e:
+                    logger.warning('speculative resolution disabled: %s', e)
+                    self.speculative_jobs = 1
+                    children.append(None)
+            viable = False
+            for child in children:
+                if viable:
+                    # later packages can't be selected, don't wait on them
+                    if child is not None:
+                        self._kill_choice(*child)
+                    continue
+                result = None
+                if child is not None:
+                    result = self._reap_choice(*child)
+                if result is None:
+                    results.append(None)
+                else:
+                    solved, insoluble = result
+                    results.append(solved)
+                    self.insoluble.update(insoluble)
+                viable = results[-1] is not False
+            if viable:
+                break
+
+        for idx, result in enumerate(results):
+            if result is not False:
+                break
+        else:
+            # everything failed; let the last choice run to collect failures
+            idx = len(pkgs) - 1
+        if idx:
+            stack.add_event(("debug", "speculation skipped %i choices" % idx))
+        choices.restrict_pkgs(pkgs[idx:])
+        solved, new_failures = self._try_choices(atom, stack, choices, depth)
+        return solved, new_failures or failures
+
+    def _fork_choice(self, atom, stack, choices, depth, pkg):
+        rfd, wfd = os.pipe()
+        try:
+            pid = os.fork()
+        except OSError:
+            os.close(rfd)
+            os.close(wfd)
+            raise
+        if pid:
+            os.close(wfd)
+            return pid, rfd
+
+        # child; never return into the caller's stack
+        code = 1
+        try:
+            os.close(rfd)
+            processor.forget_all_processors()
+            self.speculative_jobs = 1
+            self._dprint = lambda *args, **kwargs: None
+            insoluble = frozenset(self.insoluble)
+            choices.restrict_pkgs([pkg])
+            solved, _failures = self._try_choices(atom, stack, choices, depth)
+            data = pickle.dumps((solved, self.insoluble.difference(insoluble)))
+            with os.fdopen(wfd, 'wb') as f:
+                f.write(data)
+            code = 0
+        finally:
+            os._exit(code)
+
+    @staticmethod
+    def _kill_choice(pid, fd):
+        """Terminate a speculative child whose result isn't needed."""
+        os.close(fd)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+
+    @staticmethod
+    def _reap_choice(pid, fd):
+        """Collect a speculative child's result, None if it didn't finish."""
+        with os.fdopen(fd, 'rb') as f:
+            data = f.read()
+        _, status = os.waitpid(pid, 0)
+        if status or not data:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
 
     def _viable(self, stack, mode, atom, dbs, drop_cycles, limit_to_vdb):
         """
@@ -564,7 +756,7 @@ class merge_plan:
                 ret = ((True,), {"pre_solved":True})
             else:
                 # not in the plan thus far.
-                matches = caching_iter(dbs.itermatch(atom))
+                matches = self.candidates(atom, dbs)
                 if matches:
                     choices = choice_point(atom, matches)
                     # ignore what dropped out, at this juncture we don't care.
@@ -636,6 +828,7 @@ class merge_plan:
         # we already know the current pkg isn't livefs; force livefs to
         # sidestep this.
         cur_frame.parent.events.append(("cycle", cur_frame, "limiting to vdb"))
+        self.notify_cycle(stack, cur_frame.atom, "limiting to vdb")
         cur_frame.ignored = True
         return self._rec_add_atom(cur_frame.atom, stack,
             self.livefs_dbs, mode=cur_frame.mode,
@@ -653,7 +846,7 @@ class merge_plan:
             self._dprint(
                 "resetting for %s%s because of %s: %s",
                 (depth*2*" ", atom, attr, l[0]))
-            self.state.backtrack(stack.current_frame.start_point)
+            self.notify_backtrack(stack)
             return [], l[0]
 
         additions = l[0]
@@ -687,6 +880,7 @@ class merge_plan:
                             "dropping cycle for %s from %s",
                             (mode, cur_frame.atom, or_node, cur_frame.current_pkg),
                             "cycle")
+                        self.notify_cycle(stack, or_node, f"dropping {mode} cycle")
                         failure = None
                         break
 
@@ -719,7 +913,7 @@ class merge_plan:
         if not l:
             # hmm. ok... no conflicts, so we insert in vdb matches
             # to trigger a replace instead of an install
-            for pkg in self.livefs_dbs.itermatch(restrict):
+            for pkg in self.candidates(restrict, self.livefs_dbs):
                 self._dprint("inserting vdb node for %s %s", (restrict, pkg))
                 c = choice_point(restrict, [pkg])
                 state.add_op(c, c.current_pkg, force=True).apply(self.state)
@@ -833,6 +1027,7 @@ class merge_plan:
     def free_caches(self):
         for repo in self.all_raw_dbs:
             repo.clear()
+        self._candidates_cache.clear()
 
     # selection strategies for atom matches
 
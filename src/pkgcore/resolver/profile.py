@@ -0,0 +1,126 @@
+"""Resolver instrumentation.
+
+A :obj:`resolver_profiler` instance can be passed to
+:obj:`pkgcore.resolver.plan.merge_plan` to collect timing and event data
+during resolution, which can then be exported as JSON or as collapsed stacks
+suitable for flamegraph tooling.
+"""
+
+__all__ = ("resolver_profiler",)
+
+from collections import defaultdict
+import json
+from time import perf_counter
+
+
+class atom_stats:
+    """Resolution statistics for a single atom."""
+
+    __slots__ = ("calls", "failures", "time", "self_time", "itermatch", "backtracks")
+
+    def __init__(self):
+        self.calls = self.failures = self.itermatch = self.backtracks = 0
+        self.time = self.self_time = 0.0
+
+    def to_dict(self):
+        return {x: getattr(self, x) for x in self.__slots__}
+
+
+class resolver_profiler:
+    """Collect resolver statistics.
+
+    Times are inclusive of nested dependency resolution while self times
+    exclude it; the collapsed stacks are keyed by the chain of atoms being
+    resolved and record self time.
+    """
+
+    def __init__(self, clock=perf_counter):
+        self.clock = clock
+        self.atoms = defaultdict(atom_stats)
+        self.stacks = defaultdict(float)
+        self.backtrack_depths = defaultdict(int)
+        self.reverted_ops = 0
+        self.cycles = []
+        self.caches = {}
+        self.total_time = 0.0
+        self._path = []
+        self._timers = []
+
+    def enter(self, atom):
+        """Start timing resolution of an atom."""
+        self._path.append(str(atom))
+        self._timers.append([self.clock(), 0.0])
+
+    def exit(self, atom, failed=False):
+        """Stop timing resolution of an atom entered via :obj:`enter`."""
+        start, nested = self._timers.pop()
+        elapsed = self.clock() - start
+        stats = self.atoms[str(atom)]
+        stats.calls += 1
+        stats.time += elapsed
+        stats.self_time += elapsed - nested
+        if failed:
+            stats.failures += 1
+        self.stacks[';'.join(self._path)] += elapsed - nested
+        self._path.pop()
+        if self._timers:
+            self._timers[-1][1] += elapsed
+        else:
+            self.total_time += elapsed
+
+    def itermatch(self, atom):
+        """Record a repository query for an atom."""
+        self.atoms[str(atom)].itermatch += 1
+
+    def backtrack(self, atom, depth, reverted):
+        """Record the plan being rolled back while resolving an atom.
+
+        :param depth: depth of the resolver stack
+        :param reverted: number of plan operations reverted
+        """
+        self.atoms[str(atom)].backtracks += 1
+        self.backtrack_depths[depth] += 1
+        self.reverted_ops += reverted
+
+    def cycle(self, atom, depth, event):
+        """Record a cycle breaking event."""
+        self.cycles.append({'atom': str(atom), 'depth': depth, 'event': event})
+
+    def add_cache_stats(self, name, stats):
+        """Record hit/miss statistics for a cache."""
+        stats = dict(stats)
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        if lookups:
+            stats['ratio'] = stats.get('hits', 0) / lookups
+        self.caches[name] = stats
+
+    def to_dict(self):
+        return {
+            'total_time': self.total_time,
+            'atoms': {k: v.to_dict() for k, v in sorted(self.atoms.items())},
+            'backtracks': {
+                'count': sum(self.backtrack_depths.values()),
+                'max_depth': max(self.backtrack_depths, default=0),
+                'depths': {str(k): v for k, v in sorted(self.backtrack_depths.items())},
+                'reverted_ops': self.reverted_ops,
+            },
+            'cycles': self.cycles,
+            'caches': self.caches,
+        }
+
+    def write_json(self, f):
+        json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    def write_flamegraph(self, f):
+        """Write collapsed stacks with self times in microseconds."""
+        for path, elapsed in sorted(self.stacks.items()):
+            f.write(f'{path} {int(round(elapsed * 1e6))}\n')
+
+    def write(self, f, format='json'):
+        if format == 'json':
+            self.write_json(f)
+        elif format == 'flamegraph':
+            self.write_flamegraph(f)
+        else:
+            raise ValueError(f'unknown profile format: {format!r}')
@@ -20,6 +20,8 @@ class plan_state:
         self.match_atom = self.state.find_atom_matches
         self.vdb_filter = set()
         self.forced_restrictions = RefCountingSet()
+        # bumped whenever vdb_filter or forced_restrictions change
+        self.filter_generation = 0
 
     def add_blocker(self, choices, blocker, key=None):
         """Adds blocker, returning any packages blocked.
@@ -160,9 +162,11 @@ class add_hardref_op(base_op_state):
     def apply(self, plan):
         plan.plan.append(self)
         plan.forced_restrictions.add(self.restriction)
+        plan.filter_generation += 1
 
     def revert(self, plan):
         plan.forced_restrictions.remove(self.restriction)
+        plan.filter_generation += 1
 
 
 class add_backref_op(base_op_state):
@@ -190,11 +194,13 @@ class remove_op(base_op_state):
         del plan.pkg_choices[self.pkg]
         plan.plan.append(self)
         plan.vdb_filter.add(self.pkg)
+        plan.filter_generation += 1
 
     def revert(self, plan):
         plan.state.fill_slotting(self.pkg, force=True)
         plan.pkg_choices[self.pkg] = self.choices
         plan.vdb_filter.remove(self.pkg)
+        plan.filter_generation += 1
 
 
 class replace_op(base_op_state):
@@ -235,6 +241,7 @@ class replace_op(base_op_state):
         plan.pkg_choices[self.pkg] = self.choices
         plan.plan.append(self)
         plan.vdb_filter.add(old)
+        plan.filter_generation += 1
 
     def revert(self, plan):
         # far simpler, since the apply op generates multiple ops on its own.
@@ -248,6 +255,7 @@ class replace_op(base_op_state):
         del plan.pkg_choices[self.pkg]
         plan.pkg_choices[self.old_pkg] = self.old_choices
         plan.vdb_filter.remove(self.old_pkg)
+        plan.filter_generation += 1
 
     def __str__(self):
         s = ''
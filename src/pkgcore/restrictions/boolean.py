@@ -17,7 +17,7 @@ from pkgcore.restrictions import restriction
 class base(restriction.base, metaclass=generic_equality):
     """base template for boolean restrictions"""
     __attr_comparison__ = ('negate', 'type', 'restrictions')
-    __slots__ = ('restrictions', 'type', 'negate', '_hash')
+    __slots__ = ('restrictions', 'type', 'negate', '_hash', '_compiled')
 
     _evaluate_collapsible = False
     _evaluate_wipe_empty = True
@@ -134,6 +134,10 @@ class base(restriction.base, metaclass=generic_equality):
     def __len__(self):
         return len(self.restrictions)
 
+    @property
+    def cost(self):
+        return sum(r.cost for r in self.restrictions)
+
     def __iter__(self):
         return iter(self.restrictions)
 
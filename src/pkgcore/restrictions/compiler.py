@@ -0,0 +1,145 @@
+"""
+compilation of package restriction trees into match functions
+
+Matching a package against a restriction tree normally walks the tree
+node by node, pulling the attribute each package restriction works against
+from the package every time it's needed. :obj:`compile_restriction`
+instead generates a single function for the tree that pulls each attribute
+at most once per match and evaluates boolean groupings in order of the
+estimated cost of their restrictions, so packages are usually rejected via
+their category, package name, or version before any metadata is loaded.
+"""
+
+__all__ = ("compile_restriction",)
+
+from operator import attrgetter
+
+from pkgcore.log import logger
+from pkgcore.restrictions import boolean, packages, restriction, values
+
+_cost = attrgetter('cost')
+_unset = object()
+
+
+def _is_package_restriction(restrict):
+    """Check if a restriction uses the standard attribute matching."""
+    return (isinstance(restrict, packages.native_PackageRestriction) and
+            type(restrict).match is packages.native_PackageRestriction.match)
+
+
+def _boolean_kind(restrict):
+    """Return whether a restriction is a standard AND or OR grouping."""
+    if isinstance(restrict, boolean.base):
+        match = type(restrict).match
+        if match is boolean.AndRestriction.match:
+            return 'and'
+        elif match is boolean.OrRestriction.match:
+            return 'or'
+    return None
+
+
+class _codegen:
+    """Generate the source of a match function for a restriction tree."""
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {'_unset': _unset, '_sentinel': packages.PackageRestriction.__sentinel__}
+        self.attrs = {}
+
+    def const(self, obj):
+        name = f'_c{len(self.namespace)}'
+        self.namespace[name] = obj
+        return name
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def attr_var(self, restrict):
+        multi = isinstance(restrict, packages.native_PackageRestrictionMulti)
+        key = (multi, restrict.attrs, restrict.ignore_missing)
+        var = self.attrs.get(key)
+        if var is None:
+            var = self.attrs[key] = f'_a{len(self.attrs)}'
+            self.namespace[f'{var}_pull'] = restrict._pull_attr
+        return var
+
+    def node(self, restrict, depth):
+        """Emit statements setting ``t`` to the match result of a node."""
+        kind = _boolean_kind(restrict)
+        if isinstance(restrict, restriction.AlwaysBool):
+            self.emit(depth, f't = {restrict.negate!r}')
+        elif kind is not None:
+            children = sorted(restrict.restrictions, key=_cost)
+            if not children:
+                self.emit(depth, f't = {kind == "and"!r}')
+            else:
+                self.node(children[0], depth)
+                for child in children[1:]:
+                    self.emit(depth, 'if t:' if kind == 'and' else 'if not t:')
+                    self.node(child, depth + 1)
+            if restrict.negate:
+                self.emit(depth, 't = not t')
+        elif _is_package_restriction(restrict):
+            var = self.attr_var(restrict)
+            self.emit(depth, f'if {var} is _unset:')
+            self.emit(depth + 1, f'{var} = {var}_pull(pkg)')
+            child = restrict.restriction
+            if isinstance(child, values.StrExactMatch) and child.case_sensitive:
+                op = '!=' if child.negate != restrict.negate else '=='
+                expr = f'str({var}) {op} {self.const(child.exact)}'
+            else:
+                expr = f'{self.const(child.match)}({var}) != {restrict.negate!r}'
+            self.emit(depth, f't = {restrict.negate!r} if {var} is _sentinel else {expr}')
+        else:
+            self.emit(depth, f't = {self.const(restrict.match)}(pkg)')
+
+    def source(self, restrict):
+        self.node(restrict, 1)
+        lines = ['def match(pkg):']
+        lines.extend(f'    {var} = _unset' for var in self.attrs.values())
+        lines.extend(self.lines)
+        lines.append('    return t')
+        return '\n'.join(lines) + '\n'
+
+
+def _finalized(restrict):
+    if isinstance(restrict, boolean.base):
+        if not isinstance(restrict.restrictions, tuple):
+            return False
+        return all(map(_finalized, restrict.restrictions))
+    return True
+
+
+def _compile(restrict):
+    gen = _codegen()
+    try:
+        source = gen.source(restrict)
+        code = compile(source, f'<compiled {restrict.__class__.__name__}>', 'exec')
+    except (RecursionError, MemoryError, SyntaxError) as e:
+        logger.debug('failed compiling restriction %r: %s', restrict, e)
+        return restrict.match
+    exec(code, gen.namespace)
+    return gen.namespace['match']
+
+
+def compile_restriction(restrict):
+    """Return a function matching packages against a restriction.
+
+    The function is cached on the restriction when it supports it.
+
+    :param restrict: :obj:`pkgcore.restrictions.restriction.base` instance
+    :return: callable taking a package, returning if it matches
+    """
+    func = getattr(restrict, '_compiled', None)
+    if func is not None:
+        return func
+    if (_boolean_kind(restrict) is None and not _is_package_restriction(restrict)) or \
+            not _finalized(restrict):
+        # nothing to gain, or the tree can still change
+        return restrict.match
+    func = _compile(restrict)
+    try:
+        object.__setattr__(restrict, '_compiled', func)
+    except AttributeError:
+        pass
+    return func
@@ -8,6 +8,26 @@ from snakeoil.klass import generic_equality, static_attrgetter
 from pkgcore.restrictions import restriction, boolean
 from pkgcore.log import logger
 
+# costs of pulling package attributes; anything unlisted is assumed to
+# require metadata
+attr_costs = {
+    'category': restriction.COST_STRING,
+    'package': restriction.COST_STRING,
+    'key': restriction.COST_STRING,
+    'cpvstr': restriction.COST_STRING,
+    'path': restriction.COST_STRING,
+    'repo': restriction.COST_STRING,
+    'repo.repo_id': restriction.COST_STRING,
+    'unversioned_atom': restriction.COST_STRING,
+    'version': restriction.COST_VERSION,
+    'revision': restriction.COST_VERSION,
+    'fullver': restriction.COST_VERSION,
+    'versioned_atom': restriction.COST_VERSION,
+    # pulled from disk uncached for every package
+    'contents': restriction.COST_REGEN,
+    'environment': restriction.COST_REGEN,
+}
+
 
 class native_PackageRestriction(metaclass=generic_equality):
 
@@ -113,6 +133,10 @@ class PackageRestriction_mixin(restriction.base):
             return 1
         return len(self.restriction) + 1
 
+    @property
+    def cost(self):
+        return sum(attr_costs.get(x, restriction.COST_METADATA) for x in self.attrs)
+
     def __hash__(self):
         return hash((self.negate, self.attrs, self.restriction))
 
@@ -201,7 +225,7 @@ PackageRestrictionMulti_base = native_PackageRestrictionMulti
 
 
 class PackageRestriction(PackageRestriction_base, PackageRestriction_mixin):
-    __slots__ = ()
+    __slots__ = ('_compiled',)
     __inst_caching__ = True
 
     __hash__ = PackageRestriction_mixin.__hash__
@@ -210,7 +234,7 @@ class PackageRestriction(PackageRestriction_base, PackageRestriction_mixin):
 
 class PackageRestrictionMulti(PackageRestrictionMulti_base, PackageRestrictionMulti_mixin):
 
-    __slots__ = ()
+    __slots__ = ('_compiled',)
     __inst_caching__ = True
 
     __hash__ = PackageRestriction_mixin.__hash__
@@ -7,6 +7,13 @@ from functools import partial
 from snakeoil import caching, klass
 from snakeoil.currying import pretty_docs
 
+# relative costs of matching packages, used to order evaluation so that
+# packages get rejected via cheap checks before more expensive ones
+COST_STRING = 1
+COST_VERSION = 2
+COST_METADATA = 10
+COST_REGEN = 100
+
 
 class base(klass.SlotsPicklingMixin, metaclass=caching.WeakInstMeta):
     """base restriction matching object.
@@ -20,6 +27,9 @@ class base(klass.SlotsPicklingMixin, metaclass=caching.WeakInstMeta):
     __slots__ = ()
     package_matching = False
 
+    # estimated relative cost of a match, see COST_METADATA and friends
+    cost = COST_METADATA
+
     klass.inject_immutable_instance(locals())
 
     def match(self, *arg, **kwargs):
@@ -34,6 +44,12 @@ class base(klass.SlotsPicklingMixin, metaclass=caching.WeakInstMeta):
     def __len__(self):
         return 1
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        # compiled match functions are regenerated on demand
+        state.pop('_compiled', None)
+        return state
+
 
 class AlwaysBool(base):
     """restriction that always yields a specific boolean"""
@@ -42,6 +58,8 @@ class AlwaysBool(base):
 
     __inst_caching__ = True
 
+    cost = 0
+
     def __init__(self, node_type=None, negate=False):
         """
         :param node_type: the restriction type the instance should be,
@@ -79,6 +97,14 @@ class AlwaysBool(base):
         object.__setattr__(self, "negate", negate)
         object.__setattr__(self, "type", node_type)
 
+    def __reduce__(self):
+        # unpickle to the cached instances, e.g. packages.AlwaysTrue
+        return _always_bool, (self.type, self.negate)
+
+
+def _always_bool(node_type, negate):
+    return AlwaysBool(node_type=node_type, negate=negate)
+
 
 class Negate(base):
     """wrap and negate a restriction instance"""
@@ -98,6 +124,10 @@ class Negate(base):
     def match(self, *a, **kw):
         return not self._restrict.match(*a, **kw)
 
+    @property
+    def cost(self):
+        return self._restrict.cost
+
     def __str__(self):
         return "not (%s)" % self._restrict
 
@@ -121,6 +151,10 @@ class FakeType(base):
     def match(self, *a, **kw):
         return self._restrict.match(*a, **kw)
 
+    @property
+    def cost(self):
+        return self._restrict.cost
+
     def __str__(self):
         return "Faked type(%s): %s" % (self.type, self._restrict)
 
@@ -250,6 +250,21 @@ def update_pkg_desc_index(repo, observer):
     return ret
 
 
+def update_secondary_index(repo, observer):
+    """Update a repo's secondary metadata indexes (metadata/pkgcore_index)"""
+    index = getattr(repo, 'secondary_index', None)
+    if index is None:
+        observer.warn(f"repo {repo} doesn't support secondary indexes")
+        return 0
+    try:
+        index.build(repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+    except IOError as e:
+        observer.error(
+            f"Unable to update secondary index file {index.path!r}: {e.strerror}")
+        return os.EX_IOERR
+    return 0
+
+
 regen = subparsers.add_parser(
     "regen", parents=shared_options_domain,
     description="regenerate repository caches")
@@ -275,6 +290,33 @@ regen_opts.add_argument(
         Number of threads to use for regeneration, defaults to using all
         available processors.
     """)
+regen_opts.add_argument(
+    "-j", "--jobs", type=int,
+    help="number of worker processes to use",
+    docs="""
+        Number of worker processes to use for regeneration. When set, each
+        process runs its own ebuild processor and writes directly to the
+        repo's metadata cache, avoiding contention on the python side that
+        limits how well thread based regeneration scales. Takes precedence
+        over --threads; falls back to threads for cache formats that don't
+        support concurrent writers.
+    """)
+regen_opts.add_argument(
+    "--ebd-pool-size", type=arghparse.positive_int,
+    help="maximum number of idle ebuild processors kept for reuse",
+    docs="""
+        Maximum number of idle ebuild processors kept around for reuse
+        between metadata requests, any released beyond that are shut down.
+        Defaults to no limit.
+    """)
+regen_opts.add_argument(
+    "--ebd-max-requests", type=arghparse.positive_int,
+    help="recycle ebuild processors after serving the given number of requests",
+    docs="""
+        Number of metadata requests an ebuild processor serves before it's
+        shut down and replaced by a fresh one, bounding the memory and state
+        accumulated by long lived processors. Defaults to no limit.
+    """)
 regen_opts.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings")
@@ -287,11 +329,26 @@ regen_opts.add_argument(
 regen_opts.add_argument(
     "--pkg-desc-index", action='store_true', default=False,
     help="update package description cache (metadata/pkg_desc_index)")
+regen_opts.add_argument(
+    "--secondary-index", action='store_true', default=False,
+    help="update secondary metadata indexes (metadata/pkgcore_index)",
+    docs="""
+        Update the inverted indexes mapping dependencies, USE flags, licenses,
+        maintainers, inherited eclasses, and EAPIs to the packages using them.
+        While the repo and its metadata cache are unchanged, queries on these
+        (e.g. pquery --restrict-revdep or --maintainer) use the indexes
+        instead of loading the metadata for every package.
+    """)
 @regen.bind_main_func
 def regen_main(options, out, err):
     """Regenerate a repository cache."""
     ret = []
 
+    if options.ebd_pool_size is not None or options.ebd_max_requests is not None:
+        # forked regen workers inherit the limits
+        processor.configure_processor_pool(
+            size=options.ebd_pool_size, max_requests=options.ebd_max_requests)
+
     observer = observer_mod.formatter_output(out)
     for repo in iter_stable_unique(options.repos):
         if not repo.operations.supports("regen_cache"):
@@ -303,7 +360,8 @@ def regen_main(options, out, err):
 
         start_time = time.time()
         ret.append(repo.operations.regen_cache(
-            threads=options.threads, observer=observer, force=options.force,
+            threads=options.threads, processes=options.jobs,
+            observer=observer, force=options.force,
             eclass_caching=(not options.disable_eclass_caching)))
         end_time = time.time()
 
@@ -325,6 +383,8 @@ def regen_main(options, out, err):
             ret.append(update_use_local_desc(repo, observer))
         if options.pkg_desc_index:
             ret.append(update_pkg_desc_index(repo, observer))
+        if options.secondary_index:
+            ret.append(update_secondary_index(repo, observer))
 
     return int(any(ret))
 
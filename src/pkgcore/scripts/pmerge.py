@@ -13,21 +13,26 @@ import sys
 from time import time
 from textwrap import dedent
 
+from snakeoil.cli import arghparse
 from snakeoil.cli.exceptions import ExitException
+from snakeoil.osutils import pjoin
 from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism
 
 from pkgcore.ebuild import resolver, restricts
 from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.misc import run_sanity_checks
+from pkgcore.fetch import prefetch
 from pkgcore.merge import errors as merge_errors
-from pkgcore.operations import observer, format
+from pkgcore.operations import observer, format, scheduler
 from pkgcore.repository.util import get_raw_repos
 from pkgcore.repository.virtual import RestrictionRepo
+from pkgcore.resolver import persist
+from pkgcore.resolver.profile import resolver_profiler
 from pkgcore.resolver.util import reduce_to_failures
 from pkgcore.restrictions import packages
 from pkgcore.restrictions.boolean import OrRestriction
-from pkgcore.util import commandline, parserestrict
+from pkgcore.util import cachefiles, commandline, parserestrict
 
 
 argparser = commandline.ArgumentParser(
@@ -150,6 +155,48 @@ resolution_options.add_argument(
         Pull in build time dependencies for built packages during dependency
         resolution, by default they're ignored.
     """)
+resolution_options.add_argument(
+    '--speculative-jobs', type=arghparse.positive_int, default=1, metavar='NUM',
+    help="number of resolver choices to evaluate in parallel",
+    docs="""
+        Evaluate alternative package choices near the top of the dependency
+        graph in parallel, each against a forked copy of the resolver state.
+        The first viable choice in the usual preference order is then
+        committed so the resulting plan matches a sequential run.
+
+        This can speed up resolution when large amounts of backtracking are
+        required. By default choices are evaluated sequentially.
+    """)
+resolution_options.add_argument(
+    '--resolver-profile', metavar='FILE',
+    help="write resolver profiling data to a file",
+    docs="""
+        Record per-atom resolution times, repository queries, backtracking,
+        cycle breaking events, and cache statistics during dependency
+        resolution and write them to the given file.
+
+        See --resolver-profile-format for the supported output formats.
+    """)
+resolution_options.add_argument(
+    '--resolver-profile-format', choices=('json', 'flamegraph'), default='json',
+    help="output format for --resolver-profile",
+    docs="""
+        Either 'json' (the default) for a full report or 'flamegraph' for
+        collapsed stacks of atoms with self times in microseconds, suitable
+        for flamegraph generation tools.
+    """)
+resolution_options.add_argument(
+    '--reuse-plan', action='store_true',
+    help="reuse resolved plans between runs",
+    docs="""
+        Save the resolved plan along with a fingerprint of the repos,
+        installed packages, profile, configuration, and resolver options
+        used. Later runs with a matching fingerprint reuse the saved plan
+        instead of resolving from scratch, only resolving targets that
+        weren't part of it.
+
+        This is useful when running with --pretend prior to the actual merge.
+    """)
 resolution_options.add_argument(
     '-O', '--nodeps', action='store_true',
     help='disable dependency resolution',
@@ -227,6 +274,32 @@ resolution_options.add_argument(
     docs="""
         Force (un)merging on the livefs (vdb), regardless of if it's frozen.
     """)
+resolution_options.add_argument(
+    '-j', '--jobs', type=arghparse.positive_int, default=1, metavar='NUM',
+    help="number of packages to build in parallel",
+    docs="""
+        Build up to the given number of packages concurrently, each in its
+        own ebuild environment. Packages are only built once the packages
+        they depend on have been merged and merging to the livefs is still
+        done one package at a time.
+    """)
+resolution_options.add_argument(
+    '--load-average', type=float, metavar='LOAD',
+    help="don't start parallel builds above the given load average",
+    docs="""
+        When building in parallel via --jobs, don't start new builds while
+        other builds are running and the system load average is at or above
+        the given value.
+    """)
+resolution_options.add_argument(
+    '--prefetch-jobs', type=arghparse.positive_int, metavar='NUM',
+    help="fetch distfiles in the background",
+    docs="""
+        Start fetching the distfiles for all packages in the plan in the
+        background when merging begins, using up to the given number of
+        concurrent fetches. Builds only wait for files that haven't finished
+        fetching yet, allowing downloads to overlap with building.
+    """)
 resolution_options.add_argument(
     '--preload-vdb-state', action='store_true',
     help="enable preloading of the installed packages database",
@@ -444,6 +517,140 @@ def update_worldset(world_set, pkg, remove=False):
     world_set.flush()
 
 
+def update_world_for_op(out, world_set, op, atoms, options, source_repos):
+    """update the worldset after a successful merge op"""
+    if world_set is None:
+        return
+    if op.desc == "remove":
+        out.write(f'>>> Removing {op.pkg.cpvstr} from world file')
+        removal_pkg = slotatom_if_slotted(
+            source_repos.combined, op.pkg.versioned_atom)
+        update_worldset(world_set, removal_pkg, remove=True)
+    elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
+        if not (options.upgrade or options.downgrade):
+            out.write(f'>>> Adding {op.pkg.cpvstr} to world file')
+            add_pkg = slotatom_if_slotted(
+                source_repos.combined, op.pkg.versioned_atom)
+            update_worldset(world_set, add_pkg)
+
+
+def resolve_on_plan(out, resolver_inst, remaining, atoms, preload_vdb_state=False):
+    """Resolve targets on top of a replayed resolver plan.
+
+    Choices replayed from a saved plan can't be backtracked into, so if the
+    remaining targets can't be resolved on top of it, all targets are
+    resolved from scratch instead.
+    """
+    ret = resolver_inst.add_atoms(remaining, finalize=True)
+    if ret:
+        out.write(out.bold, ' * ', out.reset,
+                  'Saved resolver plan conflicts with new targets, resolving from scratch')
+        resolver_inst.reset()
+        if preload_vdb_state:
+            resolver_inst.load_vdb_state()
+        ret = resolver_inst.add_atoms(atoms, finalize=True)
+    return ret
+
+
+def parallel_merge(out, domain, changes, atoms, options, world_set,
+                   source_repos, build_obs, repo_obs, prefetcher=None):
+    """Build and merge packages, running independent builds in parallel."""
+
+    def build(op):
+        # run in a forked child, the returned build stages are used to
+        # finalize the build in the parent
+        pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
+        if not pkg_ops.run_if_supported("fetch", or_return=True):
+            out.error(f"fetching failed for {op.pkg.cpvstr}")
+            return None
+        buildop = pkg_ops.run_if_supported("build", or_return=None)
+        if buildop is None:
+            return ()
+        out.write(f"building {op.pkg.cpvstr}")
+        if buildop.install() is False:
+            out.error(f"failed building {op.pkg.cpvstr}")
+            return None
+        return tuple(getattr(buildop, '_stage_state', ()))
+
+    def merge(op, stages):
+        cleanup = []
+        try:
+            if op.desc == "remove":
+                out.write(f">>> Removing {op.pkg.cpvstr}")
+                i = domain.uninstall_pkg(op.pkg, repo_obs)
+            else:
+                cleanup.append(op.pkg.release_cached_data)
+                pkg = op.pkg
+                pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+                if stages:
+                    # the build phases already ran in a worker
+                    buildop = pkg_ops.run_if_supported("build", failed=True, or_return=None)
+                    buildop.__set_stage_state__(stages)
+                    # start() only ran in the worker, but the builddir it
+                    # created still has to be removed
+                    buildop.clean_needed = True
+                    try:
+                        pkg = buildop.finalize()
+                    except format.BuildError as e:
+                        out.error(f"caught exception building {op.pkg.cpvstr}: {e}")
+                        return False
+                    if pkg is False:
+                        out.error(f"failed building {op.pkg.cpvstr}")
+                        return False
+                    cleanup.append(pkg.release_cached_data)
+                    pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+                    cleanup.append(buildop.cleanup)
+
+                cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+                pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
+                del pkg_ops
+
+                out.write()
+                if op.desc == "replace":
+                    if op.old_pkg == pkg:
+                        out.write(f">>> Reinstalling {pkg.cpvstr}")
+                    else:
+                        out.write(f">>> Replacing {op.old_pkg.cpvstr} with {pkg.cpvstr}")
+                    i = domain.replace_pkg(op.old_pkg, pkg, repo_obs)
+                    cleanup.append(op.old_pkg.release_cached_data)
+                else:
+                    out.write(f">>> Installing {pkg.cpvstr}")
+                    i = domain.install_pkg(pkg, repo_obs)
+            try:
+                i.finish()
+            except merge_errors.BlockModification as e:
+                out.error(f"Failed to merge {op.pkg}: {e}")
+                return False
+            update_world_for_op(out, world_set, op, atoms, options, source_repos)
+            return True
+        finally:
+            for func in cleanup:
+                func()
+
+    out.write(f"\nProcessing {len(changes)} packages using up to {options.jobs} jobs")
+    out.flush()
+    prepare = None
+    if prefetcher is not None:
+        # workers can't wait on the background fetches, so builds are only
+        # forked once their fetches are finished
+        def prepare(op):
+            fetch_op = domain.pkg_operations(op.pkg)._fetch_op
+            return prefetcher.done(fetch_op.fetcher, fetch_op.fetchables)
+
+    build_scheduler = scheduler.build_scheduler(
+        changes, build, merge, jobs=options.jobs, load_average=options.load_average,
+        prepare=prepare)
+    failed = build_scheduler.run(ignore_failures=options.ignore_failures)
+    if failed:
+        out.write()
+        out.error("failed or skipped due to failures:")
+        for op in failed:
+            out.write(f"  {op.pkg.cpvstr}::{op.pkg.repo}")
+        if not options.ignore_failures:
+            return 1
+    return 0
+
+
 @argparser.bind_final_check
 def _validate(parser, namespace):
     # nothing to validate if listing pkgsets
@@ -673,6 +880,10 @@ def main(options, out, err):
         extra_kwargs['resolver_cls'] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs['debug'] = True
+    if options.speculative_jobs > 1:
+        extra_kwargs['speculative_jobs'] = options.speculative_jobs
+    if options.resolver_profile is not None:
+        extra_kwargs['profiler'] = resolver_profiler()
 
     # XXX: This should recurse on deep
     if options.newuse:
@@ -710,7 +921,21 @@ def main(options, out, err):
         drop_cycles=options.ignore_cycles, force_replace=options.replace,
         process_built_depends=options.with_bdeps, **extra_kwargs)
 
-    if options.preload_vdb_state:
+    plan_cache = remaining = None
+    if options.reuse_plan:
+        plan_cache = persist.plan_cache(cachefiles.cache_dir('pmerge', 'plan'))
+        plan_fingerprint = cachefiles.fingerprint(
+            getattr(options.resolver_kls, '__name__', repr(options.resolver_kls)),
+            options.deep, options.nodeps, options.ignore_cycles, options.replace,
+            options.with_bdeps, options.empty, options.preload_vdb_state,
+            [str(x) for x in excludes],
+            [persist.repo_signature(x) for x in get_raw_repos(source_repos)],
+            [persist.repo_signature(x) for x in get_raw_repos(installed_repos)],
+            persist.domain_signature(domain))
+        # saved plans include preloaded vdb state
+        remaining = plan_cache.load(resolver_inst, plan_fingerprint, atoms)
+
+    if options.preload_vdb_state and remaining is None:
         out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
         vdb_time = time()
         resolver_inst.load_vdb_state()
@@ -728,7 +953,12 @@ def main(options, out, err):
         out.title('Resolving...')
         out.write(out.bold, ' * ', out.reset, 'Resolving...')
         out.flush()
-    ret = resolver_inst.add_atoms(atoms, finalize=True)
+    if remaining is not None:
+        out.write(out.bold, ' * ', out.reset, 'Reusing saved resolver plan')
+        ret = resolve_on_plan(
+            out, resolver_inst, remaining, atoms, options.preload_vdb_state)
+    else:
+        ret = resolver_inst.add_atoms(atoms, finalize=True)
     while ret:
         out.error('resolution failed')
         restrict = ret[0][0]
@@ -743,6 +973,19 @@ def main(options, out, err):
         ret = resolver_inst.add_atoms(atoms, finalize=True)
     resolve_time = time() - resolve_time
 
+    if plan_cache is not None and not failures:
+        plan_cache.save(resolver_inst, plan_fingerprint, atoms)
+
+    if options.resolver_profile is not None:
+        profiler = resolver_inst.profiler
+        profiler.add_cache_stats('candidates', resolver_inst.candidates_stats)
+        try:
+            with open(options.resolver_profile, 'w') as f:
+                profiler.write(f, options.resolver_profile_format)
+        except OSError as e:
+            out.error(f'failed writing resolver profile: {e}')
+            return 1
+
     if failures:
         out.write()
         out.write('Failures encountered:')
@@ -761,6 +1004,11 @@ def main(options, out, err):
                 return 1
             out.write()
 
+    if options.debug:
+        stats = resolver_inst.candidates_stats
+        out.write(
+            f"debug: candidate cache: {stats['hits']} hits, "
+            f"{stats['misses']} misses, {stats['size']} entries")
     resolver_inst.free_caches()
 
     if options.clean:
@@ -876,6 +1124,29 @@ def main(options, out, err):
     if (options.ask and not formatter.ask(f"Would you like to {action} these packages?")):
         return
 
+    prefetcher = None
+    if options.prefetch_jobs is not None:
+        prefetcher = prefetch.prefetcher(jobs=options.prefetch_jobs)
+        prefetcher.add_pkgs(domain, (op.pkg for op in changes if op.desc != 'remove'))
+
+    try:
+        if options.jobs > 1 and not options.fetchonly:
+            return parallel_merge(
+                out, domain, changes, atoms, options, world_set, source_repos,
+                build_obs, repo_obs, prefetcher)
+        return serial_merge(
+            out, domain, changes, atoms, options, world_set, source_repos,
+            build_obs, repo_obs)
+    finally:
+        if prefetcher is not None:
+            # abort fetches still running after failures
+            prefetcher.shutdown(wait=False)
+
+
+def serial_merge(out, domain, changes, atoms, options, world_set,
+                 source_repos, build_obs, repo_obs):
+    """Fetch, build and merge packages one at a time."""
+
     change_count = len(changes)
 
     # left in place for ease of debugging.
@@ -967,18 +1238,7 @@ def main(options, out, err):
             # mainly to protect against any code following triggering reloads
             # basically, be protective
 
-            if world_set is not None:
-                if op.desc == "remove":
-                    out.write(f'>>> Removing {op.pkg.cpvstr} from world file')
-                    removal_pkg = slotatom_if_slotted(
-                        source_repos.combined, op.pkg.versioned_atom)
-                    update_worldset(world_set, removal_pkg, remove=True)
-                elif not options.oneshot and any(x.match(op.pkg) for x in atoms):
-                    if not (options.upgrade or options.downgrade):
-                        out.write(f'>>> Adding {op.pkg.cpvstr} to world file')
-                        add_pkg = slotatom_if_slotted(
-                            source_repos.combined, op.pkg.versioned_atom)
-                        update_worldset(world_set, add_pkg)
+            update_world_for_op(out, world_set, op, atoms, options, source_repos)
 
 
 #    again... left in place for ease of debugging.
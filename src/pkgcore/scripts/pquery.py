@@ -22,7 +22,7 @@ from snakeoil.formatters import decorate_forced_wrapping
 from snakeoil.osutils import sizeof_fmt
 from snakeoil.sequences import iter_stable_unique
 
-from pkgcore.ebuild import conditionals, atom
+from pkgcore.ebuild import conditionals, atom, restricts
 from pkgcore.fs import fs as fs_module, contents as contents_module
 from pkgcore.repository import multiplex
 from pkgcore.repository.util import get_raw_repos, get_virtual_repos
@@ -411,13 +411,15 @@ def print_packages_noversion(options, out, err, pkgs):
         out.write(out.bold, green, ' * ', out.fg(), pkgs[0].key)
         out.wrap = True
         out.later_prefix = ['                  ']
-        versions = ' '.join(pkg.fullver for pkg in sorted(pkgs))
+        versions = ' '.join(pkg.fullver for pkg in sorted(pkgs, key=pkgutils.sort_key))
         out.write(green, '     versions: ', out.fg(), versions)
         # If we are already matching on all repos we do not need to duplicate.
         if not options.all_repos:
-            versions = sorted(
-                pkg.fullver for repo in options.domain.installed_repos
-                for pkg in repo.itermatch(pkgs[0].unversioned_atom))
+            versions = [
+                pkg.fullver for pkg in sorted(
+                    (pkg for repo in options.domain.installed_repos
+                     for pkg in repo.itermatch(pkgs[0].unversioned_atom)),
+                    key=pkgutils.sort_key)]
             if versions:
                 out.write(green, '     installed: ', out.fg(), ' '.join(versions))
         for attr in options.attr:
@@ -741,28 +743,64 @@ def parse_eapi(value):
         'eapi',
         values.StrExactMatch(value))
 
+def _owners_restrict(namespace, lookup, fallback):
+    """Restrict to the pkgs owning matching paths.
+
+    Uses the reverse file ownership index of the installed repos, falling
+    back to matching against pkg contents if none of them have one. Repos
+    without an index (e.g. the package.provided repo) don't own any files.
+    """
+    repos = [repo for repo in namespace.repos if hasattr(repo, 'file_owners')]
+    if not repos:
+        return fallback
+    restrictions = []
+    for repo in repos:
+        for cpv in iter_stable_unique(lookup(repo)):
+            restrictions.append(packages.AndRestriction(
+                atom.atom(f'={cpv}'), restricts.RepositoryDep(repo.repo_id)))
+    if not restrictions:
+        return packages.AlwaysFalse
+    return packages.OrRestriction(*restrictions)
+
+
 @bind_add_query(
-    '--owns', action='append',
+    '--owns', action='append', type=None, bind='final_converter',
     help='exact match on an owned file/dir')
-def parse_owns(value):
-    return packages.PackageRestriction(
+def owns_finalize(sequence, namespace):
+    if not sequence:
+        return []
+    fallback = packages.PackageRestriction(
         'contents',
         values.AnyMatch(values.GetAttrRestriction(
-            'location', values.StrExactMatch(value))))
+            'location', values.OrRestriction(*map(values.StrExactMatch, sequence)))))
+    return _owners_restrict(
+        namespace,
+        lambda repo: (cpv for path in sequence for cpv in repo.file_owners(path)),
+        fallback)
 
 @bind_add_query(
-    '--owns-re', action='append',
+    '--owns-re', action='append', type=None, bind='final_converter',
     help='like "owns" but using a regexp for matching')
-def parse_ownsre(value):
-    """Value is a regexp matched against the string form of an fs object.
+def owns_re_finalize(sequence, namespace):
+    """Values are regexps matched against the paths of owned fs objects.
 
-    This means the object kind is prepended to the path the regexp has
-    to match.
+    All regexps are checked in a single pass over the installed files.
     """
-    return packages.PackageRestriction(
+    if not sequence:
+        return []
+    try:
+        regexes = [values.StrRegex(x) for x in sequence]
+    except ValueError as e:
+        argparser.error(e)
+    fallback = packages.PackageRestriction(
         'contents',
         values.AnyMatch(values.GetAttrRestriction(
-            'location', values.StrRegex(value))))
+            'location', values.OrRestriction(*regexes))))
+    predicate = lambda path: any(r.match(path) for r in regexes)
+    return _owners_restrict(
+        namespace,
+        lambda repo: (cpv for _path, cpv in repo.iter_file_owners(predicate)),
+        fallback)
 
 @bind_add_query(
     '--maintainer', action='append',
@@ -842,7 +880,8 @@ def _add_all_if_needed(namespace, attr):
 def pkg_upgrade(_value, namespace):
     pkgs = []
     for pkg in namespace.domain.all_installed_repos:
-        matches = sorted(namespace.domain.all_source_repos.match(pkg.slotted_atom))
+        matches = sorted(
+            namespace.domain.all_source_repos.match(pkg.slotted_atom), key=pkgutils.sort_key)
         if matches and matches[-1] != pkg:
             pkgs.append(matches[-1].versioned_atom)
     return packages.OrRestriction(*pkgs)
@@ -985,6 +1024,10 @@ def _validate_args(parser, namespace):
     namespace.attr = list(iter_stable_unique(attrs))
 
 
+# key based sorter, allowing multiplexed repos to merge results directly
+_pkg_sorter = partial(sorted, key=pkgutils.sort_key)
+
+
 @argparser.bind_main_func
 def main(options, out, err):
     """Run a query."""
@@ -998,15 +1041,15 @@ def main(options, out, err):
         return 0
     for repo in options.repos:
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=_pkg_sorter)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
                 elif options.min or options.max:
                     if options.min:
-                        print_package(options, out, err, min(pkgs))
+                        print_package(options, out, err, min(pkgs, key=pkgutils.sort_key))
                     if options.max:
-                        print_package(options, out, err, max(pkgs))
+                        print_package(options, out, err, max(pkgs, key=pkgutils.sort_key))
                 else:
                     for pkg in pkgs:
                         print_package(options, out, err, pkg)
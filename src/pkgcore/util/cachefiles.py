@@ -0,0 +1,137 @@
+"""Helpers for persistent cache files.
+
+Data cached across runs is tagged with signatures of the files it was
+generated from, i.e. their modification times and sizes, and is only reused
+while those are unchanged. Cache files can contain pickled data so they're
+only written with owner access and are ignored unless owned by the current
+user.
+"""
+
+__all__ = (
+    "fingerprint", "path_signature", "dir_paths", "tree_paths", "cache_dir",
+    "open_private", "write_private",
+)
+
+from collections.abc import Mapping
+import hashlib
+import os
+
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs, listdir_dirs, listdir_files, pjoin
+
+from pkgcore import const
+
+
+def _stable(obj):
+    """Convert settings values into a form with a stable repr."""
+    if isinstance(obj, (str, int, float, bool, type(None))):
+        return obj
+    if isinstance(obj, Mapping):
+        return tuple(sorted((str(k), _stable(v)) for k, v in obj.items()))
+    if isinstance(obj, (set, frozenset)):
+        return tuple(sorted(repr(_stable(x)) for x in obj))
+    if isinstance(obj, (list, tuple)):
+        return tuple(_stable(x) for x in obj)
+    # objects without a stable representation only contribute their type
+    return type(obj).__name__
+
+
+def fingerprint(*parts):
+    """Return a hash of the given, arbitrarily nested, input data."""
+    return hashlib.sha1(repr(_stable(parts)).encode()).hexdigest()
+
+
+def path_signature(paths):
+    """Return the modification state of the given paths."""
+    l = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            l.append((path, None))
+        else:
+            l.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(l)
+
+
+def cache_dir(*parts):
+    """Return a path for persistent data within the pkgcore cache directory.
+
+    The user's cache directory is taken from the environment so root uses
+    the system cache directory instead.
+    """
+    if os.geteuid() == 0:
+        return pjoin(const.SYSTEM_CACHE_PATH, *parts)
+    return pjoin(const.USER_CACHE_PATH, *parts)
+
+
+def open_private(path):
+    """Open a file written by :obj:`write_private` for reading.
+
+    :raises PermissionError: if the file isn't owned by the current user or
+        is accessible by others, in which case it can't be trusted to be
+        unpickled
+    """
+    f = open(path, 'rb')
+    try:
+        st = os.fstat(f.fileno())
+        if st.st_uid != os.geteuid() or st.st_mode & 0o077:
+            raise PermissionError(f'untrusted file: {path!r}')
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def write_private(path, data):
+    """Atomically write data to a file only accessible by the current user."""
+    ensure_dirs(os.path.dirname(path), mode=0o755)
+    f = AtomicWriteFile(path, binary=True, perms=0o600)
+    try:
+        f.write(data)
+    except BaseException:
+        f.discard()
+        raise
+    f.close()
+
+
+def dir_paths(path):
+    """Return a dir along with its subdirs."""
+    try:
+        return [path] + [pjoin(path, x) for x in sorted(listdir_dirs(path))]
+    except OSError:
+        return [path]
+
+
+def _files(path, suffix):
+    try:
+        return [pjoin(path, x) for x in sorted(listdir_files(path)) if x.endswith(suffix)]
+    except OSError:
+        return []
+
+
+def tree_paths(location, categories=None):
+    """Return the category and package dirs of a repo along with its ebuilds.
+
+    Package dir mtimes change when ebuilds are added or removed, while the
+    ebuilds themselves are included to catch in-place edits.
+
+    :param location: repo root
+    :param categories: category names to use, by default all dirs in the
+        repo root are used and the root itself is included
+    """
+    if categories is None:
+        paths = [location]
+        categories = (
+            x for x in dir_paths(location)[1:]
+            if not os.path.basename(x).startswith('.'))
+    else:
+        paths = []
+        categories = (pjoin(location, x) for x in sorted(categories))
+    for category in categories:
+        paths.append(category)
+        for pkg in dir_paths(category)[1:]:
+            paths.append(pkg)
+            paths.extend(_files(pkg, '.ebuild'))
+    paths.extend(_files(pjoin(location, 'eclass'), '.eclass'))
+    return paths
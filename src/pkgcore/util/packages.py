@@ -1,4 +1,4 @@
-__all__ = ("get_raw_pkg", "groupby_pkg")
+__all__ = ("get_raw_pkg", "groupby_pkg", "sort_key")
 
 import itertools
 import operator
@@ -14,3 +14,14 @@ groupby_key_getter = operator.attrgetter("key")
 def groupby_pkg(iterable):
     for key, pkgs in itertools.groupby(iterable, groupby_key_getter):
         yield pkgs
+
+
+def sort_key(obj):
+    """Key function ordering packages the same as their rich comparisons.
+
+    Strings and tuples, e.g. category and package names passed through
+    repository sorters, are returned as is.
+    """
+    if isinstance(obj, (str, tuple)):
+        return obj
+    return obj.category, obj.package, obj.version_key or ()
@@ -0,0 +1,338 @@
+"""
+persistent indexes for the installed package database
+
+Package directory listings and commonly used metadata keys are stored in a
+single file, each entry tagged with the mtime of the directory it was pulled
+from. Entries are only trusted while that mtime matches, so changes made
+behind our back (e.g. by other package managers) invalidate them.
+
+File ownership is tracked separately in a reverse index mapping paths to the
+packages owning them, kept sorted by path so lookups are a binary search.
+"""
+
+__all__ = ("MetadataIndex", "OwnersIndex")
+
+import heapq
+import json
+import mmap
+import os
+
+from snakeoil.osutils import ensure_dirs, listdir_dirs, pjoin
+
+from pkgcore.log import logger
+
+
+class MetadataIndex:
+    """Metadata index for a vdb, stored as a single JSON file.
+
+    :param path: file the index is stored in
+    :param location: vdb location the index belongs to
+    """
+
+    version = 1
+
+    def __init__(self, path, location):
+        self.path = path
+        self.location = location
+        self._categories = None
+        self._dirty = False
+
+    @property
+    def _data(self):
+        if self._categories is None:
+            self._categories = self._load()
+        return self._categories
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (EnvironmentError, ValueError) as e:
+            logger.debug(f'ignoring unusable vdb index {self.path!r}: {e}')
+            return {}
+        if (not isinstance(data, dict) or data.get('version') != self.version or
+                data.get('location') != self.location):
+            return {}
+        return data.get('categories', {})
+
+    def packages(self, category, mtime):
+        """Return the cached directory listing for a category if still valid."""
+        cat = self._data.get(category)
+        if cat is not None and cat['mtime'] == mtime:
+            return cat['listing']
+        return None
+
+    def set_packages(self, category, mtime, listing):
+        """Update the directory listing for a category."""
+        cat = self._data.setdefault(category, {'pkgs': {}})
+        cat['mtime'] = mtime
+        cat['listing'] = list(listing)
+        # drop entries for packages that are gone
+        listing = frozenset(listing)
+        for pkg in list(cat['pkgs']):
+            if pkg not in listing:
+                del cat['pkgs'][pkg]
+        self._dirty = True
+
+    def metadata(self, category, pkg, mtime):
+        """Return indexed metadata for a package directory if still valid.
+
+        :param pkg: package directory name, e.g. foo-1.0
+        :return: mapping of key to value, None for keys lacking a file
+        """
+        entry = self._data.get(category, {}).get('pkgs', {}).get(pkg)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry['data']
+        return None
+
+    def set_metadata(self, category, pkg, mtime, data):
+        """Update the indexed metadata for a package directory."""
+        cat = self._data.setdefault(category, {'mtime': None, 'listing': (), 'pkgs': {}})
+        cat['pkgs'][pkg] = {'mtime': mtime, 'data': data}
+        self._dirty = True
+
+    def remove(self, category, pkg):
+        """Drop the indexed metadata for a package directory."""
+        cat = self._data.get(category)
+        if cat is not None and cat['pkgs'].pop(pkg, None) is not None:
+            self._dirty = True
+
+    def invalidate(self, category):
+        """Force the directory listing for a category to be refreshed."""
+        cat = self._data.get(category)
+        if cat is not None and cat['mtime'] is not None:
+            cat['mtime'] = None
+            self._dirty = True
+
+    def save(self):
+        """Write the index out if it was modified, failures are ignored."""
+        if not self._dirty:
+            return
+        data = {
+            'version': self.version,
+            'location': self.location,
+            'categories': self._categories,
+        }
+        tmp = f'{self.path}.update.{os.getpid()}'
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0o775, minimal=True):
+                raise PermissionError(f'failed creating dir for {self.path!r}')
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.rename(tmp, self.path)
+        except EnvironmentError as e:
+            # unprivileged users commonly lack write access, that's fine
+            logger.debug(f'failed writing vdb index {self.path!r}: {e}')
+            try:
+                os.unlink(tmp)
+            except EnvironmentError:
+                pass
+            return
+        self._dirty = False
+
+
+def _contents_paths(path):
+    """Yield the paths listed in a CONTENTS file.
+
+    Mirrors the parsing done by :obj:`pkgcore.vdb.contents.ContentsFile`
+    without creating fs objects for each entry.
+    """
+    with open(path, 'r', encoding='utf8', errors='surrogateescape') as f:
+        for line in f:
+            s = line.rstrip('\n').split(' ')
+            if s[0] in ('dir', 'dev', 'fif'):
+                yield ' '.join(s[1:])
+            elif s[0] == 'obj':
+                yield ' '.join(s[1:-2])
+            elif s[0] == 'sym':
+                try:
+                    yield ' '.join(s[1:s.index('->')])
+                except ValueError:
+                    continue
+
+
+def _encode(value):
+    return value.encode('utf8', 'surrogateescape')
+
+
+def _decode(value):
+    return value.decode('utf8', 'surrogateescape')
+
+
+class OwnersIndex:
+    """Reverse index mapping file paths to the vdb packages owning them.
+
+    The index is stored as a header listing every indexed package directory
+    with its mtime, followed by ``path\\0cpv`` lines sorted by path. On load
+    the package directories are compared against the vdb and only entries for
+    changed packages are regenerated.
+
+    :param path: file the index is stored in
+    :param location: vdb location the index belongs to
+    """
+
+    version = 1
+
+    def __init__(self, path, location):
+        self.path = path
+        self.location = location
+        self._buf = None
+        self._offset = 0
+        self._pkgs = None
+
+    def _scan(self):
+        """Return a mapping of package directories in the vdb to their mtime."""
+        pkgs = {}
+        try:
+            categories = listdir_dirs(self.location)
+        except FileNotFoundError:
+            return pkgs
+        for category in categories:
+            if category.startswith('.'):
+                continue
+            cpath = pjoin(self.location, category)
+            for pf in listdir_dirs(cpath):
+                if pf.startswith(('.tmp.', '-MERGING-')) or pf.endswith('.lockfile'):
+                    continue
+                try:
+                    pkgs[f'{category}/{pf}'] = os.stat(pjoin(cpath, pf)).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+        return pkgs
+
+    def _load(self):
+        """Map the stored index, returning the indexed package mtimes."""
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                if header != _encode(f'pkgcore-owners {self.version} {self.location}\n'):
+                    return {}
+                pkgs = {}
+                for _ in range(int(f.readline())):
+                    cpv, mtime = _decode(f.readline()).split()
+                    pkgs[cpv] = int(mtime)
+                self._offset = f.tell()
+                if os.fstat(f.fileno()).st_size > self._offset:
+                    self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self._buf = b''
+        except FileNotFoundError:
+            return {}
+        except (EnvironmentError, ValueError) as e:
+            logger.debug(f'ignoring unusable vdb owners index {self.path!r}: {e}')
+            self._buf = None
+            return {}
+        return pkgs
+
+    def _iter_lines(self, start=None):
+        buf = self._buf
+        pos = self._offset if start is None else start
+        end = len(buf)
+        while pos < end:
+            eol = buf.find(b'\n', pos)
+            if eol == -1:
+                eol = end
+            yield buf[pos:eol]
+            pos = eol + 1
+
+    def refresh(self):
+        """Bring the index in sync with the vdb, rewriting it if needed."""
+        pkgs = self._load() if self._pkgs is None else self._pkgs
+        current = self._scan()
+        if self._buf is not None and pkgs == current:
+            self._pkgs = pkgs
+            return
+        stale = {cpv for cpv, mtime in pkgs.items() if current.get(cpv) != mtime}
+        new = []
+        for cpv, mtime in current.items():
+            if pkgs.get(cpv) == mtime:
+                continue
+            stale.add(cpv)
+            try:
+                paths = list(_contents_paths(pjoin(self.location, cpv, 'CONTENTS')))
+            except FileNotFoundError:
+                continue
+            except EnvironmentError as e:
+                logger.warning(f'failed reading CONTENTS for {cpv}: {e}')
+                current.pop(cpv)
+                continue
+            cpv = _encode(cpv)
+            new.extend(_encode(path) + b'\0' + cpv for path in paths)
+        new.sort()
+
+        old = ()
+        if self._buf is not None:
+            stale = frozenset(map(_encode, stale))
+            old = (line for line in self._iter_lines()
+                   if line[line.index(b'\0') + 1:] not in stale)
+        self._write(current, heapq.merge(old, new))
+        self._pkgs = current
+
+    def _write(self, pkgs, lines):
+        header = [_encode(f'pkgcore-owners {self.version} {self.location}\n{len(pkgs)}\n')]
+        header.extend(_encode(f'{cpv} {mtime}\n') for cpv, mtime in sorted(pkgs.items()))
+        header = b''.join(header)
+        data = b''.join(line + b'\n' for line in lines)
+        tmp = f'{self.path}.update.{os.getpid()}'
+        try:
+            if not ensure_dirs(os.path.dirname(self.path), mode=0o775, minimal=True):
+                raise PermissionError(f'failed creating dir for {self.path!r}')
+            with open(tmp, 'wb') as f:
+                f.write(header)
+                f.write(data)
+            os.rename(tmp, self.path)
+        except EnvironmentError as e:
+            # unprivileged users commonly lack write access, keep it in memory
+            logger.debug(f'failed writing vdb owners index {self.path!r}: {e}')
+            try:
+                os.unlink(tmp)
+            except EnvironmentError:
+                pass
+            self._buf, self._offset = header + data, len(header)
+            return
+        self._load()
+
+    def _ensure(self):
+        if self._pkgs is None:
+            self.refresh()
+
+    def owners(self, path):
+        """Return the packages owning a given path.
+
+        :param path: absolute path, matched exactly
+        :return: tuple of cpv strings
+        """
+        self._ensure()
+        key = _encode(path) + b'\0'
+        buf = self._buf
+        lo, hi = self._offset, len(buf)
+        # bisect to the first line sorting at or after the key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = max(buf.rfind(b'\n', lo, mid) + 1, lo)
+            end = buf.find(b'\n', start)
+            if end == -1:
+                end = len(buf)
+            if buf[start:end] < key:
+                lo = end + 1
+            else:
+                hi = start
+        owners = []
+        for line in self._iter_lines(lo):
+            if not line.startswith(key):
+                break
+            owners.append(_decode(line[len(key):]))
+        return tuple(owners)
+
+    def iter_owners(self, predicate):
+        """Yield (path, cpv) pairs for all indexed paths matching a predicate.
+
+        :param predicate: callable taking a path, e.g. a compiled regex's search
+        """
+        self._ensure()
+        for line in self._iter_lines():
+            path, cpv = _decode(line).split('\0', 1)
+            if predicate(path):
+                yield path, cpv
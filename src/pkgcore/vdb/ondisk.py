@@ -4,11 +4,12 @@ import errno
 from functools import partial
 import os
 import stat
+import weakref
 
 from snakeoil import data_source, klass
 from snakeoil.fileutils import readfile
 from snakeoil.mappings import IndeterminantDict
-from snakeoil.osutils import listdir_dirs, pjoin
+from snakeoil.osutils import listdir_dirs, normpath, pjoin
 
 from pkgcore.config.hint import ConfigHint
 from pkgcore.ebuild import ebuild_built
@@ -18,6 +19,7 @@ from pkgcore.log import logger
 from pkgcore.package import base as pkg_base
 from pkgcore.repository import errors, prototype, wrapper
 from pkgcore.vdb import repo_ops
+from pkgcore.vdb.index import MetadataIndex, OwnersIndex
 from pkgcore.vdb.contents import ContentsFile
 
 
@@ -48,6 +50,13 @@ class tree(prototype.tree):
             cache_location = pjoin("/var/cache/edb/dep", location.lstrip("/"))
         self.cache_location = cache_location
         self._versions_tmp_cache = {}
+        self._index = None
+        self._owners = None
+        if cache_location is not None:
+            self._index = MetadataIndex(pjoin(cache_location, 'index'), self.location)
+            self._owners = OwnersIndex(pjoin(cache_location, 'owners'), self.location)
+            # write out metadata pulled in during this run on exit
+            weakref.finalize(self, self._index.save)
         try:
             st = os.stat(self.location)
             if not stat.S_ISDIR(st.st_mode):
@@ -76,13 +85,23 @@ class tree(prototype.tree):
         finally:
             pass
 
+    def _list_packages(self, category, cpath):
+        if self._index is None:
+            return listdir_dirs(cpath)
+        mtime = os.stat(cpath).st_mtime_ns
+        listing = self._index.packages(category, mtime)
+        if listing is None:
+            listing = listdir_dirs(cpath)
+            self._index.set_packages(category, mtime, listing)
+        return listing
+
     def _get_packages(self, category):
         cpath = pjoin(self.location, category.lstrip(os.path.sep))
         l = set()
         d = {}
         bad = False
         try:
-            for x in listdir_dirs(cpath):
+            for x in self._list_packages(category, cpath):
                 if x.startswith(".tmp.") or x.endswith(".lockfile") \
                         or x.startswith("-MERGING-"):
                     continue
@@ -134,11 +153,78 @@ class tree(prototype.tree):
         "source_repository": "repository", "fullslot": "SLOT",
     }
 
+    # metadata files stored in the index, used for resolving against the vdb
+    _indexed_keys = (
+        "BDEPEND", "DEPEND", "EAPI", "IUSE", "KEYWORDS", "PDEPEND", "RDEPEND",
+        "SLOT", "USE", "repository",
+    )
+
     def _get_metadata(self, pkg):
-        return IndeterminantDict(
-            partial(self._internal_load_key, pjoin(
-                self.location, pkg.category,
-                f"{pkg.package}-{pkg.fullver}")))
+        pf = f"{pkg.package}-{pkg.fullver}"
+        path = pjoin(self.location, pkg.category, pf)
+        if self._index is not None:
+            indexed = self._get_indexed_metadata(pkg.category, pf, path)
+            if indexed:
+                return IndeterminantDict(
+                    partial(self._load_indexed_key, indexed, path))
+        return IndeterminantDict(partial(self._internal_load_key, path))
+
+    def _get_indexed_metadata(self, category, pf, path):
+        """Return indexed metadata for a package, pulling it in if necessary."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except EnvironmentError:
+            return None
+        data = self._index.metadata(category, pf, mtime)
+        if data is None:
+            data = {}
+            for key in self._indexed_keys:
+                value = readfile(pjoin(path, key), True)
+                data[key] = value if value is None else value.rstrip('\n')
+            self._index.set_metadata(category, pf, mtime, data)
+        return data
+
+    def _load_indexed_key(self, indexed, path, key):
+        filename = self._metadata_rewrites.get(key, key)
+        try:
+            value = indexed[filename]
+        except KeyError:
+            return self._internal_load_key(path, key)
+        if value is None:
+            raise KeyError((path, filename))
+        return value
+
+    def _update_index(self, pkg, removed=False):
+        """Update the index after a package was merged or unmerged."""
+        if self._index is None:
+            return
+        pf = f"{pkg.package}-{pkg.fullver}"
+        self._index.invalidate(pkg.category)
+        if removed:
+            self._index.remove(pkg.category, pf)
+        else:
+            self._get_indexed_metadata(
+                pkg.category, pf, pjoin(self.location, pkg.category, pf))
+        self._index.save()
+        if os.path.exists(self._owners.path):
+            self._owners.refresh()
+
+    def file_owners(self, path):
+        """Return the cpvs of installed packages owning a given path."""
+        path = normpath(path)
+        if self._owners is None:
+            return tuple(pkg.cpvstr for pkg in self if path in pkg.contents)
+        return self._owners.owners(path)
+
+    def iter_file_owners(self, predicate):
+        """Yield (path, cpv) pairs for installed paths matching a predicate."""
+        if self._owners is None:
+            for pkg in self:
+                for obj in pkg.contents:
+                    if predicate(obj.location):
+                        yield obj.location, pkg.cpvstr
+        else:
+            yield from self._owners.iter_owners(predicate)
 
     def _internal_load_key(self, path, key):
         key = self._metadata_rewrites.get(key, key)
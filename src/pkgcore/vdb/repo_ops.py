@@ -114,6 +114,7 @@ class install(repo_ops.install):
     def finalize_data(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
+        self.repo._update_index(self.new_pkg)
         return True
 
 
@@ -131,6 +132,7 @@ class uninstall(repo_ops.uninstall):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
+        self.repo._update_index(self.old_pkg, removed=True)
         return True
 
 
@@ -3,6 +3,7 @@ import operator
 from snakeoil.chksum import LazilyHashedPath
 
 from pkgcore.cache import base, errors, bulk
+from pkgcore.ebuild import eclass_cache
 from snakeoil.test import TestCase
 
 
@@ -190,3 +191,65 @@ class TestBulk(BaseTest):
         # write a key outside of known keys
         db["dar"] = {"foo2":"dar"}
         assert list(db["dar"].items()) == []
+
+
+class TestValidateEntries(TestCase):
+
+    class cache_kls(DictCache):
+        # keep chksum data around so validation works
+        def __getitem__(self, cpv):
+            return dict(base.__getitem__(self, cpv).items())
+
+        def _getitem(self, cpv):
+            d = dict(self._data[cpv])
+            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+            return d
+
+    class eclass_db(eclass_cache.base):
+
+        def __init__(self):
+            super().__init__(location='/nonexistent', eclassdir='/nonexistent')
+            self.eclasses = {
+                'eclass1': _mk_chf_obj(mtime=1),
+                'eclass2': _mk_chf_obj(mtime=2),
+            }
+            self.rebuilds = []
+
+        def _rebuild_cache_entry(self, entry_eclasses):
+            self.rebuilds.append(entry_eclasses)
+            return super()._rebuild_cache_entry(entry_eclasses)
+
+    def test_validate_entries(self):
+        cache = self.cache_kls(auxdbkeys=('foo', '_eclasses_'))
+        eclasses = {'eclass1': _mk_chf_obj(mtime=1), 'eclass2': _mk_chf_obj(mtime=2)}
+        for cpv in ('cat/pkg-1', 'cat/pkg-2', 'cat/pkg-3'):
+            cache[cpv] = {'foo': cpv, '_eclasses_': eclasses}
+        cache['cat/stale-1'] = {'foo': 'stale', '_eclasses_': {'eclass1': _mk_chf_obj(mtime=3)}}
+        cache['cat/noeclass-1'] = {'foo': 'noeclass'}
+
+        ec = self.eclass_db()
+        entries = [
+            ('cat/pkg-1', _chf_obj),
+            ('cat/pkg-2', _chf_obj),
+            ('cat/pkg-3', _mk_chf_obj(mtime=200)),
+            ('cat/stale-1', _chf_obj),
+            ('cat/noeclass-1', _chf_obj),
+            ('cat/missing-1', _chf_obj),
+        ]
+        inherited = {}
+        valid = dict(cache.validate_entries(entries, ec, inherited))
+        assert sorted(valid) == ['cat/noeclass-1', 'cat/pkg-1', 'cat/pkg-2']
+        # inherited eclasses are reported for stale entries as well
+        assert sorted(inherited) == ['cat/pkg-1', 'cat/pkg-2', 'cat/pkg-3', 'cat/stale-1']
+        assert inherited['cat/stale-1'] == ('eclass1',)
+        assert valid['cat/pkg-1']['_eclasses_'] == ec.eclasses
+        # a shared eclass set is only checked once
+        assert len(ec.rebuilds) == 2
+
+        # and results agree with validating entries individually
+        for cpv, ebuild_hash in entries:
+            try:
+                item = cache[cpv]
+            except KeyError:
+                continue
+            assert cache.validate_entry(item, ebuild_hash, ec) == (cpv in valid)
@@ -0,0 +1,105 @@
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import errors, packed
+
+from . import test_base
+from .test_util import GenericCacheMixin
+
+
+class db(packed.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return packed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(packed.database.__getitem__(self, cpv).items())
+        d.pop(f'_{self.chf_type}_', None)
+        return d
+
+
+class TestPacked(GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(pjoin(self.dir, 'metadata.pack'),
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_roundtrip(self):
+        db = self.get_db()
+        db['cat/pkg-1'] = {'SLOT': '0', 'EAPI': '7'}
+        # pending updates are visible before being committed
+        assert db['cat/pkg-1'] == {'SLOT': '0', 'EAPI': '7'}
+        assert not os.path.exists(db.location)
+        db.commit()
+        db = self.get_db()
+        assert list(db.keys()) == ['cat/pkg-1']
+        assert 'cat/pkg-1' in db
+        assert db['cat/pkg-1'] == {'SLOT': '0', 'EAPI': '7'}
+
+    def test_flushed_at_exit(self):
+        db = self.get_db()
+        # backfilled entries usually stay below the sync rate
+        db['cat/pkg-1'] = {'SLOT': '0'}
+        assert not os.path.exists(db.location)
+        packed._commit_open_databases()
+        assert self.get_db()['cat/pkg-1'] == {'SLOT': '0'}
+        # readonly databases aren't tracked
+        assert self.get_db(readonly=True) not in packed._open_databases
+
+    def test_append_and_delete(self):
+        db = self.get_db()
+        for i in range(10):
+            db[f'cat/pkg-{i}'] = {'SLOT': str(i)}
+        db.commit()
+        size = os.stat(db.location).st_size
+        # small updates are appended instead of rewriting the file
+        db['cat/pkg-0'] = {'SLOT': 'new'}
+        del db['cat/pkg-1']
+        db.commit()
+        assert os.stat(db.location).st_size > size
+        db = self.get_db()
+        assert db['cat/pkg-0'] == {'SLOT': 'new'}
+        assert 'cat/pkg-1' not in db
+        self.assertRaises(KeyError, db.__getitem__, 'cat/pkg-1')
+        self.assertRaises(KeyError, db.__delitem__, 'cat/pkg-1')
+        assert sorted(db.keys()) == sorted(f'cat/pkg-{i}' for i in range(10) if i != 1)
+
+    def test_compaction(self):
+        db = self.get_db()
+        db['cat/pkg-1'] = {'SLOT': '0'}
+        db.commit()
+        size = os.stat(db.location).st_size
+        # repeatedly rewriting the same entry triggers a rewrite of the file
+        for i in range(10):
+            db['cat/pkg-1'] = {'SLOT': '0'}
+            db.commit()
+        assert os.stat(db.location).st_size < size * 3
+        assert self.get_db()['cat/pkg-1'] == {'SLOT': '0'}
+
+    def test_concurrent_writers(self):
+        db1 = self.get_db()
+        db2 = self.get_db()
+        db1['cat/pkg-1'] = {'SLOT': '1'}
+        db1.commit()
+        db2['cat/pkg-2'] = {'SLOT': '2'}
+        db2.commit()
+        db = self.get_db()
+        assert sorted(db.keys()) == ['cat/pkg-1', 'cat/pkg-2']
+
+    def test_corruption(self):
+        db = self.get_db()
+        with open(db.location, 'wb') as f:
+            f.write(b'garbage')
+        self.assertRaises(errors.GeneralCacheCorruption, db.__contains__, 'cat/pkg-1')
+        # writers start over when faced with an unusable file
+        db['cat/pkg-1'] = {'SLOT': '0'}
+        db.commit()
+        assert self.get_db()['cat/pkg-1'] == {'SLOT': '0'}
+
+    def test_readonly_commit(self):
+        db = self.get_db(readonly=True)
+        db.commit(force=True)
+        assert not os.path.exists(db.location)
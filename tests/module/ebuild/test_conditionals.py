@@ -1,3 +1,5 @@
+import pickle
+
 from snakeoil.currying import post_curry
 from snakeoil.iterables import expandable_chain
 from snakeoil.sequences import iflatten_instance
@@ -333,6 +335,54 @@ class native_DepSetEvaluateTest(base):
             if not ('?' in src or kwds.get("transitive_use_atoms")):
                 self.assertIdentical(orig, collapsed)
 
+    def test_eval_flags(self):
+        d = self.gen_depset("a x? ( b !y? ( c ) ) || ( z? ( d ) e )")
+        self.assertEqual(d.eval_flags, ('x', 'y', 'z'))
+        d = self.gen_depset(
+            "a/b[c?,!d=,e(+)?,f] x? ( g/h )", element_kls=atom,
+            transitive_use_atoms=True)
+        self.assertEqual(sorted(d.eval_flags), ['c', 'd', 'e', 'x'])
+
+    def test_cached(self):
+        d = self.gen_depset("a x? ( b ) !y? ( c )")
+        r = d.evaluate_depset(['x', 'unrelated'])
+        self.assertEqual(str(r), "a b c")
+        # only the states of the flags used by conditionals matter
+        self.assertIdentical(d.evaluate_depset(('x', 'z')), r)
+        self.assertNotIdentical(d.evaluate_depset(['x', 'y']), r)
+        self.assertEqual(str(d.evaluate_depset(['x', 'y'])), "a b")
+
+        # tristate filtering is cached separately
+        t = d.evaluate_depset(['x'], tristate_filter=['y'])
+        self.assertNotIdentical(t, r)
+        self.assertEqual(str(t), "a b c")
+        self.assertIdentical(d.evaluate_depset(['x'], tristate_filter=['y', 'z']), t)
+        self.assertEqual(str(d.evaluate_depset(['x'], tristate_filter=[])), "a b c")
+
+        d = self.gen_depset(
+            "a/b[c?,!d=]", element_kls=atom, transitive_use_atoms=True)
+        r = d.evaluate_depset(['c'])
+        self.assertEqual(str(r), "a/b[c,d]")
+        self.assertIdentical(d.evaluate_depset(['c', 'x']), r)
+        self.assertEqual(str(d.evaluate_depset(['d'])), "a/b[-d]")
+
+        # evaluated results aren't pickled
+        d2 = pickle.loads(pickle.dumps(d))
+        self.assertIdentical(d2._eval_cache, None)
+        self.assertEqual(str(d2.evaluate_depset(['c'])), "a/b[c,d]")
+
+    def test_cache_bounded(self):
+        class kls(self.kls):
+            __slots__ = ()
+            eval_cache_size = 2
+
+        d = kls.parse("a x? ( b ) y? ( c )", str)
+        results = [d.evaluate_depset(use) for use in ([], ['x'], ['y'])]
+        self.assertLen(d._eval_cache, 2)
+        # least recently used results are evicted first
+        self.assertNotIdentical(d.evaluate_depset([]), results[0])
+        self.assertIdentical(d.evaluate_depset(['y']), results[2])
+
 
 class cpy_DepSetEvaluateTest(native_DepSetEvaluateTest):
 
@@ -340,5 +390,46 @@ class cpy_DepSetEvaluateTest(native_DepSetEvaluateTest):
     if not conditionals.DepSet.parse_depset:
         skip = "extension not available"
 
+
+class DepSetParseCacheTest(TestCase):
+
+    def test_shared(self):
+        cache = conditionals.DepSetParseCache()
+        d = cache.parse('dev-util/foo x? ( dev-util/bar )', atom)
+        self.assertEqual(str(d), 'dev-util/foo x? ( dev-util/bar )')
+        self.assertIdentical(cache.parse('dev-util/foo x? ( dev-util/bar )', atom), d)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # element classes, functions, and transitive USE handling are part of the key
+        self.assertNotIdentical(cache.parse('dev-util/foo x? ( dev-util/bar )', str), d)
+        self.assertNotIdentical(cache.parse(
+            'dev-util/foo x? ( dev-util/bar )', atom, transitive_use_atoms=True), d)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertLen(cache, 3)
+
+        cache.clear()
+        self.assertLen(cache, 0)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def test_bounded(self):
+        cache = conditionals.DepSetParseCache(maxsize=2)
+        cache.parse('a', str)
+        cache.parse('b', str)
+        cache.parse('a', str)
+        cache.parse('c', str)
+        self.assertLen(cache, 2)
+        # least recently used entries are evicted first
+        cache.parse('a', str)
+        self.assertEqual(cache.hits, 2)
+        cache.parse('b', str)
+        self.assertEqual(cache.misses, 4)
+
+    def test_errors(self):
+        cache = conditionals.DepSetParseCache()
+        for i in range(2):
+            self.assertRaises(DepsetParseError, cache.parse, 'x? ( dev-util/foo', atom)
+        self.assertLen(cache, 0)
+
+
 test_cpy_used = mk_cpy_loadable_testcase('pkgcore.ebuild._depset',
     "pkgcore.ebuild.conditionals", "parse_depset", "parse_depset")
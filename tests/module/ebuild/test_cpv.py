@@ -330,3 +330,37 @@ class TestCPV:
         assert str(obj) == "dev-util/diffball-1.0-r1"
         assert obj.fullver == "1.0-r0001"
         assert obj.revision == 1
+
+    def test_interning(self):
+        obj = cpv.VersionedCPV("dev-util/diffball-1.0-r1")
+        assert obj is cpv.VersionedCPV("dev-util/diffball-1.0-r1")
+        assert cpv.UnversionedCPV("dev-util/diffball") is cpv.UnversionedCPV("dev-util/diffball")
+        # other invocations share the parsed attributes
+        other = cpv.CPV("dev-util/diffball-1.0-r1", versioned=True)
+        assert other is not obj
+        assert other.version is obj.version
+        assert other.revision is obj.revision
+        # the versioned flag is still respected
+        with pytest.raises(cpv.InvalidCPV):
+            cpv.UnversionedCPV("dev-util/diffball-1.0-r1")
+        with pytest.raises(cpv.InvalidCPV):
+            cpv.CPV("dev-util/diffball-1.0-r1", versioned=False)
+
+    def test_version_key(self):
+        vkls = cpv.VersionedCPV
+        assert cpv.UnversionedCPV("da/ba").version_key is None
+        versions = [
+            "1_alpha", "1_beta2", "1_pre", "1_rc1", "1", "1-r1", "1_p", "1_p1",
+            "1.0", "1.0a", "1.0.0", "1.01", "1.02.0", "1.1", "1.1_p1_alpha",
+            "1.1_p1", "1.2", "2", "10", "10a",
+        ]
+        objs = [vkls(f"da/ba-{x}") for x in versions]
+        for x, y in zip(objs, objs[1:]):
+            assert x.version_key <= y.version_key, f"{x} must sort before {y}"
+            assert cmp(x.version_key, y.version_key) == cmp(x, y) == cpv.ver_cmp(
+                x.version, x.revision, y.version, y.revision)
+        assert vkls("da/ba-1.0-r0").version_key == vkls("da/ba-1.0").version_key
+        assert vkls("da/ba-1.010").version_key == vkls("da/ba-1.01").version_key
+        shuffled = objs[:]
+        shuffle(shuffled)
+        assert [x.fullver for x in sorted(shuffled, key=lambda x: x.version_key)] == versions
@@ -592,3 +592,75 @@ class TestPackageFactory:
         # thus, modifying (popping _mtime_) _is_ valid
         assert cache2[pkg.cpvstr] == \
             {'_eclasses_': {'eclass1': (None, 100)}, 'marker': 2, '_mtime_': 200}
+
+    def test_get_metadata_backfill(self):
+        ec = FakeEclassCache('/nonexistent/path')
+        pkg = malleable_obj(_mtime_=100, cpvstr='dev-util/diffball-0.71', path='bollocks')
+
+        class fake_cache(dict):
+            readonly = False
+            backfill = True
+            _chf_key = '_mtime_'
+            def validate_entry(self, *args):
+                return True
+
+        cache1 = fake_cache({pkg.cpvstr: {'_mtime_': 100, 'marker': 1}})
+        cache2 = fake_cache({})
+        pf = self.mkinst(cache=(cache2, cache1), eclasses=ec)
+
+        assert pf._get_metadata(pkg) == {'marker': 1, '_mtime_': 100}
+        # entry was copied to the higher priority cache, with the source
+        # cache's chksum swapped for the ebuild's
+        assert list(cache2.keys()) == [pkg.cpvstr]
+        entry = cache2[pkg.cpvstr]
+        assert entry['marker'] == 1
+        assert '_mtime_' not in entry
+        assert entry['_chf_'].path == pkg.path
+
+        # caches not requesting backfills are left alone
+        cache2.clear()
+        cache2.backfill = False
+        pf._get_metadata(pkg)
+        assert not cache2
+
+    def test_get_stale_pkgs(self, tmpdir):
+        ec = FakeEclassCache('/nonexistent/path')
+        pkg_dir = tmpdir.mkdir('diffball')
+        pkgs = []
+        for ver in ('0.1', '0.2', '0.3'):
+            path = str(pkg_dir.join(f'diffball-{ver}.ebuild'))
+            with open(path, 'w') as f:
+                f.write('EAPI=7\n')
+            os.utime(path, (100, 100))
+            pkgs.append(malleable_obj(cpvstr=f'dev-util/diffball-{ver}', path=path))
+        pkgs.append(malleable_obj(
+            cpvstr='dev-util/diffball-0.4', path=str(pkg_dir.join('diffball-0.4.ebuild'))))
+
+        class fake_cache(dict):
+            readonly = False
+            def validate_entries(self, entries, eclass_db, inherited=None):
+                for cpv, ebuild_hash in entries:
+                    if cpv not in self:
+                        continue
+                    if inherited is not None:
+                        inherited[cpv] = ('eutils', cpv.split('-')[-1])
+                    if self[cpv] == ebuild_hash.mtime:
+                        yield cpv, {}
+
+        cache1 = fake_cache({
+            'dev-util/diffball-0.1': 100, 'dev-util/diffball-0.2': 200,
+            'dev-util/diffball-0.3': 300})
+        cache2 = fake_cache({'dev-util/diffball-0.2': 100})
+        pf = self.mkinst(cache=(cache1, cache2), eclasses=ec)
+        stale = pf._get_stale_pkgs(pkgs)
+        assert sorted(pkg.cpvstr for pkg in stale) == [
+            'dev-util/diffball-0.3', 'dev-util/diffball-0.4']
+        # eclass usage is tracked from all existing entries, once per package
+        assert pf.popular_eclasses(1) == ['eutils']
+        assert sorted(pf.popular_eclasses()) == ['0.1', '0.2', '0.3', 'eutils']
+        assert pf._eclass_usage['eutils'] == 3
+
+        # forced regens keep all packages while still tracking eclass usage
+        pf = self.mkinst(cache=(cache1, cache2), eclasses=ec)
+        assert len(pf._get_stale_pkgs(pkgs, force=True)) == 4
+        assert pf._eclass_usage['eutils'] == 3
@@ -37,6 +37,16 @@ class TestBase(TestCase):
         assertRebuildResults(True, 'eclass1', 100)
         assertRebuildResults(False, 'eclass1', 200)
 
+    def test_rebuild_eclass_entry_memoized(self):
+        data = tuple(
+            (x, (('mtime', self.ec.eclasses[x].mtime),)) for x in ('eclass1', 'eclass2'))
+        got = self.ec.rebuild_cache_entry(data)
+        self.assertEqual(dict(got), {x: self.ec.eclasses[x] for x in ('eclass1', 'eclass2')})
+        self.assertIdentical(got, self.ec.rebuild_cache_entry(list(data)))
+        stale = (('eclass1', (('mtime', 300),)),)
+        self.assertEqual(self.ec.rebuild_cache_entry(stale), None)
+        self.assertEqual(self.ec.rebuild_cache_entry(stale), None)
+
     def test_get_eclass_data(self):
         keys = list(self.ec.eclasses.keys())
         data = self.ec.get_eclass_data([])
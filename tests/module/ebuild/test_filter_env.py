@@ -255,3 +255,36 @@ class CPyFilterEnvTest(NativeFilterEnvTest):
 
 cpy_loaded_Test = mk_cpy_loadable_testcase("pkgcore.ebuild._filter_env",
     "pkgcore.ebuild.filter_env", "run", "run")
+
+
+class StreamFilterEnvTest(NativeFilterEnvTest):
+
+    filter_env = staticmethod(partial(filter_env.main_run, _parser=filter_env.stream_run))
+
+    data = '\n'.join((
+        "# comment {\nfoo() {\n    echo ${x//}/y} $(bar() { :; }; bar)\n}",
+        "X='a b'#not a comment\nY=\"$(echo \"}\")\" Z=${Y:-${X}}",
+        "cat <<- EOF\n\tfoo() {\n\tEOF\n",
+        "function baz ()\n{\n    [[ $1 == \\} ]] && echo `a # b`\n}#c",
+        "A=(1 2 '3') B=$'\\'' declare -x C=d\n",
+    )) * 3
+
+    def run_parser(self, parser, data, **kwargs):
+        out = io.BytesIO()
+        calls = []
+        parser(out, data, filter_env.build_regex_string(['[A-C]']).match,
+               filter_env.build_regex_string(['foo', 'baz']).match,
+               global_envvar_callback=lambda *args: calls.append(args),
+               func_callback=lambda *args: calls.append(args), **kwargs)
+        return out.getvalue(), calls
+
+    def test_chunk_boundaries(self):
+        expected = self.run_parser(filter_env.native_run, self.data + '\0')
+        for chunk_size in range(1, len(self.data) + 2, 7):
+            assert expected == self.run_parser(
+                filter_env.stream_run, io.StringIO(self.data), chunk_size=chunk_size)
+
+    def test_file_input(self):
+        out = io.BytesIO()
+        filter_env.main_run(out, io.StringIO("X=1\nY=2\n"), vars_to_filter=['X'])
+        assert out.getvalue() == b"\nY=2\n"
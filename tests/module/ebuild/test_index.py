@@ -0,0 +1,198 @@
+import os
+
+import pytest
+from snakeoil.osutils import pjoin
+
+from pkgcore.ebuild import repository, eclass_cache
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.index import SecondaryIndex
+from pkgcore.ebuild.repo_objs import Maintainer
+from pkgcore.package.errors import MetadataException
+from pkgcore.restrictions import packages, values
+from pkgcore.scripts.pquery import parse_maintainer, parse_revdep
+from pkgcore.test import malleable_obj
+from pkgcore.util.parserestrict import comma_separated_containment
+
+
+class FakeRepo:
+
+    def __init__(self, location, categories=('dev-util', 'dev-libs')):
+        self.location = location
+        self.categories = categories
+        self.cache = ()
+        for cat in categories:
+            os.makedirs(pjoin(location, cat), exist_ok=True)
+
+
+def mk_pkg(cpv, depend=(), rdepend=(), iuse=(), license=(), inherited=(), eapi='7',
+           maintainers=()):
+    a = atom(f'={cpv}')
+    return malleable_obj(
+        category=a.category, package=a.package, fullver=a.fullver,
+        bdepend=(), depend=tuple(map(atom, depend)), rdepend=tuple(map(atom, rdepend)),
+        pdepend=(), iuse_stripped=frozenset(iuse), license=tuple(license),
+        inherited=tuple(inherited), eapi=eapi, maintainers=tuple(maintainers))
+
+
+class BadPkg:
+
+    def __init__(self, category='dev-util', package='bad', fullver='1'):
+        self.category, self.package, self.fullver = category, package, fullver
+
+    @property
+    def bdepend(self):
+        raise MetadataException(self, 'bdepend', 'broken')
+
+
+class TestSecondaryIndex:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.repo = FakeRepo(str(tmp_path))
+        self.path = pjoin(str(tmp_path), 'metadata', 'pkgcore_index')
+        self.index = SecondaryIndex(self.path, self.repo)
+        self.index.build([
+            mk_pkg('dev-util/foo-1', depend=['dev-libs/bar'], iuse=['ssl'],
+                   license=['GPL-2'], inherited=['git-r3'],
+                   maintainers=[Maintainer('dev@example.com', 'Dev')]),
+            mk_pkg('dev-util/foo-2', rdepend=['>=dev-libs/bar-2'], iuse=['ssl', 'doc'],
+                   license=['MIT'], eapi='8',
+                   maintainers=[Maintainer('dev@example.com', 'Dev')]),
+            mk_pkg('dev-libs/bar-2', iuse=['doc'], license=['MIT'], eapi='6'),
+            BadPkg(),
+        ])
+        self.index = SecondaryIndex(self.path, self.repo)
+
+    def match(self, restrict):
+        ret = self.index.match(restrict)
+        if ret is None:
+            return None
+        return sorted('{}/{}-{}'.format(*x) for x in ret)
+
+    def test_available(self):
+        assert self.index.available
+        assert len(self.index.cpvs) == 3
+        assert not SecondaryIndex(self.path + '.missing', self.repo).available
+
+    def test_stale(self):
+        # adding a package changes the category dir mtime
+        os.mkdir(pjoin(self.repo.location, 'dev-util', 'new'))
+        index = SecondaryIndex(self.path, self.repo)
+        assert not index.available
+        assert index.match(comma_separated_containment('iuse_stripped')('ssl')) is None
+
+    def test_stale_version(self):
+        # adding a version to an existing package changes the package dir mtime
+        pkg_dir = pjoin(self.repo.location, 'dev-util', 'foo')
+        os.mkdir(pkg_dir)
+        self.index.build([mk_pkg('dev-util/foo-1')])
+        assert SecondaryIndex(self.path, self.repo).available
+        with open(pjoin(pkg_dir, 'foo-2.ebuild'), 'w') as f:
+            f.write('EAPI=7\n')
+        assert not SecondaryIndex(self.path, self.repo).available
+
+    def test_skipped(self):
+        assert ('dev-util', 'foo') in self.index.packages
+        assert ('dev-util', 'bad') not in self.index.packages
+
+    def test_revdep(self):
+        assert self.match(parse_revdep('dev-libs/bar')) == ['dev-util/foo-1', 'dev-util/foo-2']
+        assert self.match(parse_revdep('dev-util/foo')) == []
+
+    def test_use(self):
+        has_use = comma_separated_containment('iuse_stripped')
+        assert self.match(has_use('ssl')) == ['dev-util/foo-1', 'dev-util/foo-2']
+        assert self.match(has_use('doc,ssl')) == [
+            'dev-libs/bar-2', 'dev-util/foo-1', 'dev-util/foo-2']
+
+    def test_license(self):
+        license = comma_separated_containment('license')
+        assert self.match(license('MIT')) == ['dev-libs/bar-2', 'dev-util/foo-2']
+
+    def test_eclass(self):
+        r = packages.PackageRestriction(
+            'inherited', values.AnyMatch(values.StrExactMatch('git-r3')))
+        assert self.match(r) == ['dev-util/foo-1']
+
+    def test_eapi(self):
+        r = packages.PackageRestriction('eapi', values.StrExactMatch('6'))
+        assert self.match(r) == ['dev-libs/bar-2']
+        r = packages.PackageRestriction('eapi', values.StrExactMatch('6', negate=True))
+        assert self.match(r) == ['dev-util/foo-1', 'dev-util/foo-2']
+
+    def test_maintainer(self):
+        assert self.match(parse_maintainer('dev@')) == ['dev-util/foo-1', 'dev-util/foo-2']
+        assert self.match(parse_maintainer('nobody')) == []
+        # packages without maintainers can't be looked up
+        assert self.match(parse_maintainer('')) is None
+
+    def test_boolean(self):
+        has_use = comma_separated_containment('iuse_stripped')
+        cat = packages.PackageRestriction('category', values.StrExactMatch('dev-util'))
+        r = packages.AndRestriction(has_use('doc'), cat)
+        assert self.match(r) == ['dev-libs/bar-2', 'dev-util/foo-2']
+        r = packages.AndRestriction(has_use('doc'), parse_revdep('dev-libs/bar'))
+        assert self.match(r) == ['dev-util/foo-2']
+        assert self.match(packages.AndRestriction(cat)) is None
+        assert self.match(packages.OrRestriction(has_use('doc'), cat)) is None
+        assert self.match(packages.AndRestriction(has_use('doc'), negate=True)) is None
+        assert self.match(atom('dev-util/foo')) is None
+
+
+class TestUnconfiguredTreeIndex:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.dir = str(tmp_path)
+        os.makedirs(pjoin(self.dir, 'profiles'))
+        os.makedirs(pjoin(self.dir, 'metadata'))
+        with open(pjoin(self.dir, 'metadata', 'layout.conf'), 'w') as f:
+            f.write('masters =\n')
+        for cpv in ('dev-util/foo-1', 'dev-util/foo-2', 'dev-libs/bar-1'):
+            cat, pf = cpv.split('/')
+            pkg = pf.rsplit('-', 1)[0]
+            os.makedirs(pjoin(self.dir, cat, pkg), exist_ok=True)
+            with open(pjoin(self.dir, cat, pkg, f'{pf}.ebuild'), 'w') as f:
+                f.write('EAPI=7\n')
+        epath = pjoin(self.dir, 'eclass')
+        os.makedirs(epath)
+        self.repo = repository.UnconfiguredTree(
+            self.dir, eclass_cache=eclass_cache.cache(epath))
+
+    def test_candidates(self):
+        has_use = comma_separated_containment('iuse_stripped')('ssl')
+        assert self.repo.secondary_index.match(has_use) is None
+        self.repo.secondary_index.build([
+            mk_pkg('dev-util/foo-1', iuse=['ssl']), mk_pkg('dev-libs/bar-1', eapi='6')])
+        assert sorted(self.repo._identify_candidates(has_use, iter)) == [('dev-util', 'foo')]
+
+        # unindexed versions of candidate packages are still matched
+        matched = list(self.repo._index_filter(
+            self.repo.secondary_index.match(has_use),
+            (self.repo[('dev-util', 'foo', v)] for v in ('1', '2'))))
+        assert [pkg.cpvstr for pkg in matched] == ['dev-util/foo-1', 'dev-util/foo-2']
+
+        # packages are only loaded for indexed matches, the index is trusted
+        # for dev-libs/bar even though its actual EAPI matches
+        eapi = packages.PackageRestriction('eapi', values.StrExactMatch('7'))
+        pkgs = self.repo.itermatch(eapi, pkg_filter=None)
+        assert sorted(pkg.cpvstr for pkg in pkgs) == ['dev-util/foo-1', 'dev-util/foo-2']
+
+        # packages with versions skipped due to bad metadata are matched normally
+        self.repo.secondary_index.build([
+            mk_pkg('dev-util/foo-1', iuse=['ssl']), mk_pkg('dev-libs/bar-1', eapi='6'),
+            BadPkg('dev-libs', 'bar', '0')])
+        assert sorted(self.repo._identify_candidates(has_use, iter)) == [
+            ('dev-libs', 'bar'), ('dev-util', 'foo')]
+
+    def test_new_version(self):
+        self.repo.secondary_index.build([
+            mk_pkg('dev-util/foo-1'), mk_pkg('dev-util/foo-2'), mk_pkg('dev-libs/bar-1')])
+        revdep = parse_revdep('dev-libs/bar')
+        assert self.repo.secondary_index.match(revdep) == frozenset()
+        with open(pjoin(self.dir, 'dev-util', 'foo', 'foo-3.ebuild'), 'w') as f:
+            f.write('EAPI=7\nRDEPEND="dev-libs/bar"\n')
+        repo = repository.UnconfiguredTree(
+            self.dir, eclass_cache=eclass_cache.cache(pjoin(self.dir, 'eclass')))
+        assert repo.secondary_index.match(revdep) is None
+        assert [pkg.cpvstr for pkg in repo.itermatch(revdep, pkg_filter=None)] == ['dev-util/foo-3']
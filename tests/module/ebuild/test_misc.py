@@ -1,7 +1,12 @@
+from itertools import product
+import pickle
+
 from snakeoil.test import TestCase, mk_cpy_loadable_testcase
 
 from pkgcore.ebuild import misc
-from pkgcore.restrictions import packages
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import VersionedCPV
+from pkgcore.restrictions import packages, values
 
 AlwaysTrue = packages.AlwaysTrue
 AlwaysFalse = packages.AlwaysFalse
@@ -39,6 +44,88 @@ class test_collapsed_restrict_to_data(base):
             defaults=['y'])
 
 
+class FakePkg(VersionedCPV):
+
+    def __init__(self, cpv, slot='0', subslot=None):
+        super().__init__(cpv)
+        object.__setattr__(self, 'slot', slot)
+        object.__setattr__(self, 'subslot', slot if subslot is None else subslot)
+        object.__setattr__(self, 'pulled', [])
+
+    def __getattribute__(self, attr):
+        if attr in ('slot', 'subslot'):
+            object.__getattribute__(self, 'pulled').append(attr)
+        return super().__getattribute__(attr)
+
+
+class TestChunkedDataDict(TestCase):
+
+    def mk_dict(self, freeze=True):
+        d = misc.ChunkedDataDict()
+        d.add_bare_global(('-x',), ('a', 'b'))
+        d.update_from_stream([
+            misc.chunked_data(atom('dev-util/foo'), ('a',), ('c',)),
+            misc.chunked_data(atom('>=dev-util/foo-2'), (), ('d',)),
+            misc.chunked_data(atom('dev-util/foo:1'), ('c',), ('e',)),
+            misc.chunked_data(packages.AlwaysFalse, (), ('never',)),
+            misc.chunked_data(atom('dev-util/bar[x]'), (), ('x',)),
+        ])
+        d.add_bare_global(('b',), ('f',))
+        if freeze:
+            d.freeze()
+        return d
+
+    def test_render(self):
+        frozen, unfrozen = self.mk_dict(), self.mk_dict(freeze=False)
+        pkgs = [
+            FakePkg(cpv, slot) for cpv, slot in product(
+                ('dev-util/foo-1', 'dev-util/foo-2', 'dev-util/bar-1', 'dev-libs/baz-1'),
+                ('0', '1'))]
+        for pkg, pre_defaults in product(pkgs, ((), ('b', 'c', 'x', 'y'))):
+            self.assertEqual(
+                frozen.render_pkg(pkg, pre_defaults),
+                unfrozen.render_pkg(pkg, pre_defaults),
+                msg=f'{pkg} mismatched with defaults {pre_defaults!r}')
+        self.assertEqual(
+            frozen.render_pkg(FakePkg('dev-util/foo-2', '1')), {'d', 'e', 'f'})
+
+    def test_memoized(self):
+        d = self.mk_dict()
+        pkg = FakePkg('dev-util/foo-2')
+        self.assertEqual(d.render_pkg(pkg), {'c', 'd', 'f'})
+        self.assertEqual(len(d._memo), 1)
+        # packages without chunk restrictions are rendered from the collapsed globals
+        d.render_pkg(FakePkg('dev-libs/baz-1'))
+        self.assertEqual(len(d._memo), 1)
+        # USE dependent chunks aren't memoized
+        d.render_pkg(FakePkg('dev-util/bar-1'))
+        self.assertEqual(len(d._memo), 1)
+
+        # the memo is keyed on the slot, clones share it
+        d2 = d.clone()
+        self.assertEqual(d2.render_pkg(FakePkg('dev-util/foo-2', '1')), {'d', 'e', 'f'})
+        self.assertEqual(len(d._memo), 2)
+
+        d.memo_size = 2
+        d.render_pkg(FakePkg('dev-util/foo-3'))
+        self.assertEqual(len(d._memo), 2)
+        self.assertNotIn(('dev-util/foo', '2', '0', '0'), d._memo)
+
+        # the memo isn't pickled
+        d3 = pickle.loads(pickle.dumps(d))
+        self.assertEqual(d3, d)
+        self.assertEqual(len(d3._memo), 0)
+        self.assertEqual(d3.render_pkg(pkg), {'c', 'd', 'f'})
+
+    def test_unneeded_attrs(self):
+        d = misc.ChunkedDataDict()
+        d.update_from_stream([misc.chunked_data(atom('>=dev-util/foo-2'), (), ('a',))])
+        d.freeze()
+        pkg = FakePkg('dev-util/foo-2')
+        self.assertEqual(d.render_pkg(pkg), {'a'})
+        self.assertEqual(pkg.pulled, [])
+
+
 class test_incremental_license_expansion(TestCase):
 
     def test_it(self):
@@ -47,6 +134,36 @@ class test_incremental_license_expansion(TestCase):
     test_it.todo = "implement this..."
 
 
+class test_collapse_license_tokens(TestCase):
+
+    groups = {'FREE': ('GPL-2', 'MIT'), 'EMPTY': ()}
+
+    def expand(self, licenses, tokens):
+        return misc.incremental_expansion_license(
+            'dev-util/foo-1', licenses, self.groups, tokens)
+
+    def test_it(self):
+        self.assertEqual(
+            misc.collapse_license_tokens(None, self.groups, ['@FREE', 'BSD', '-MIT']),
+            ({'GPL-2', 'BSD'}, False, set()))
+        self.assertEqual(
+            misc.collapse_license_tokens(None, self.groups, ['BSD', '*', '-@FREE', 'MIT']),
+            ({'BSD', 'MIT'}, True, {'GPL-2'}))
+        self.assertEqual(
+            misc.collapse_license_tokens(None, self.groups, ['*', '-*', 'BSD']),
+            ({'BSD'}, False, set()))
+        for tokens in (['-'], ['-@'], ['@']):
+            self.assertRaises(
+                ValueError, misc.collapse_license_tokens, None, self.groups, tokens)
+
+    def test_expansion(self):
+        licenses = ('GPL-2', 'MIT', 'EULA')
+        self.assertEqual(self.expand(licenses, ['@FREE']), {'GPL-2', 'MIT'})
+        self.assertEqual(self.expand(licenses, ['*', '-EULA']), {'GPL-2', 'MIT'})
+        self.assertEqual(self.expand(licenses, ['*', '-@FREE', 'MIT']), {'MIT', 'EULA'})
+        self.assertEqual(self.expand(licenses, ['BSD', '*', '-*', 'EULA']), {'EULA'})
+
+
 class test_native_incremental_expansion(TestCase):
     f = staticmethod(misc.native_incremental_expansion)
 
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from pkgcore.ebuild import processor
+
+
+class FakeProcessor:
+
+    def __init__(self, userpriv=False, sandbox=False, fd_pipes=None):
+        self._userpriv = userpriv
+        self._sandbox = sandbox
+        self._fd_pipes = fd_pipes
+        self.locked = False
+        self.is_alive = True
+        self.requests = 0
+        self.preloaded = []
+        self.shutdown = False
+
+    def userprived(self):
+        return self._userpriv
+
+    def sandboxed(self):
+        return self._sandbox
+
+    def shutdown_processor(self, force=False):
+        self.is_alive = False
+        self.shutdown = True
+
+    def preload_eclasses(self, cache, async_req=False, limited_to=None):
+        self.preloaded.extend(limited_to)
+
+    def _consume_async_expects(self):
+        return True
+
+
+class TestProcessorPool:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, monkeypatch):
+        monkeypatch.setattr(processor, 'EbuildProcessor', FakeProcessor)
+        monkeypatch.setattr(processor, 'active_ebp_list', [])
+        monkeypatch.setattr(processor, 'inactive_ebp_list', [])
+        monkeypatch.setattr(processor, '_pool_limits', {'size': None, 'max_requests': None})
+
+    def test_reuse(self):
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        assert processor.release_ebuild_processor(ebp)
+        assert processor.request_ebuild_processor(sandbox=False) is ebp
+        assert ebp.requests == 2
+        # dead processors are dropped instead of reused
+        processor.release_ebuild_processor(ebp)
+        ebp.is_alive = False
+        assert processor.request_ebuild_processor(sandbox=False) is not ebp
+        assert not processor.inactive_ebp_list
+
+    def test_max_requests(self):
+        processor.configure_processor_pool(max_requests=2)
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        assert processor.request_ebuild_processor(sandbox=False) is ebp
+        processor.release_ebuild_processor(ebp)
+        assert ebp.shutdown
+        assert not processor.inactive_ebp_list
+
+    def test_size(self):
+        ebps = [processor.request_ebuild_processor(sandbox=False) for _ in range(3)]
+        for ebp in ebps:
+            processor.release_ebuild_processor(ebp)
+        assert len(processor.inactive_ebp_list) == 3
+        processor.configure_processor_pool(size=1)
+        assert processor.inactive_ebp_list == [ebps[2]]
+        assert ebps[0].shutdown and ebps[1].shutdown
+        ebp1 = processor.request_ebuild_processor(sandbox=False)
+        ebp2 = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp1)
+        processor.release_ebuild_processor(ebp2)
+        assert processor.inactive_ebp_list == [ebp1]
+        assert ebp2.shutdown
+
+    def test_prespawn(self):
+        class eclass_cache:
+            eclasses = {'eutils': None, 'multilib': None}
+
+        ebp = processor.request_ebuild_processor(sandbox=False)
+        processor.release_ebuild_processor(ebp)
+        processor.prespawn_ebuild_processors(
+            2, sandbox=False, eclass_cache=eclass_cache,
+            eclasses=('eutils', 'nonexistent', 'multilib'))
+        assert len(processor.inactive_ebp_list) == 2
+        assert not processor.active_ebp_list
+        assert ebp in processor.inactive_ebp_list
+        for x in processor.inactive_ebp_list:
+            assert x.preloaded == ['eutils', 'multilib']
+        # warm up doesn't count as a request
+        assert ebp.requests == 1
+
+
+class TestTransferFile:
+
+    def test_write_payload(self):
+        ebp = processor.EbuildProcessor.__new__(processor.EbuildProcessor)
+        ebp.pid = None
+        written = []
+        ebp.write = lambda s, **kwargs: written.append(s)
+        ebp._transfer_fd = processor._transfer_file()
+        try:
+            ebp._write_payload('gen_metadata', "export FOO='long value'")
+            ebp._write_payload('gen_metadata', 'export A=é')
+            assert written[-1] == 'gen_metadata fd 11'
+            # stale data from larger payloads doesn't linger
+            with open(f'/proc/self/fd/{ebp._transfer_fd}', 'rb') as f:
+                assert f.read() == 'export A=é'.encode()
+            assert os.lseek(ebp._transfer_fd, 0, os.SEEK_CUR) == 0
+        finally:
+            os.close(ebp._transfer_fd)
+
+        # falls back to inline transfers
+        ebp._transfer_fd = None
+        ebp._write_payload('gen_metadata', 'export A=1')
+        assert written[-1] == 'gen_metadata 10\nexport A=1'
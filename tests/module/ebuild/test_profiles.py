@@ -1317,3 +1317,55 @@ class TestOnDiskProfile(profile_mixin, TestCase):
         self.assertNotEqual(p, None)
         self.assertEqual(normpath(p.basepath), normpath(base))
         self.assertEqual(normpath(p.profile), normpath(pjoin(base, '1')))
+
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.mk_profiles(
+            {"package.mask": "dev-util/foo", "use.force": "foo",
+             "make.defaults": 'USE="bar"\nARCH="x86"\n'},
+            {"package.mask": "-dev-util/foo\ndev-util/bar", "use.mask": "baz"},
+        )
+        p = self.get_profile("1", cache_dir=cache_dir)
+        masks = p.masks
+        assert masks == frozenset([atom("dev-util/bar")])
+        assert len(os.listdir(cache_dir)) == 1
+
+        # collapsed settings are pulled from the cache without loading the stack
+        p2 = self.get_profile("1", cache_dir=cache_dir)
+        assert p2.masks == masks
+        assert p2.default_env == p.default_env
+        assert p2._incremental_masks == p._incremental_masks
+        self.assertEqualPayload(p2.forced_use, {atrue: (chunked_data(atrue, (), ('foo',)),)})
+        self.assertEqualPayload(p2.masked_use, {atrue: (chunked_data(atrue, (), ('baz',)),)})
+        assert '_stack' not in vars(p2)
+
+        # changing any profile file invalidates the cache
+        with open(pjoin(self.dir, "0", "package.mask"), "w") as f:
+            f.write("dev-util/foo\ndev-util/confcache\n")
+        p3 = self.get_profile("1", cache_dir=cache_dir)
+        assert p3.masks == frozenset([atom("dev-util/bar"), atom("dev-util/confcache")])
+        assert '_stack' in vars(p3)
+        assert len(os.listdir(cache_dir)) == 1
+
+        # files outside the profile stack don't affect the cache
+        ensure_dirs(pjoin(self.dir, "unrelated"))
+        with open(pjoin(self.dir, "unrelated", "package.mask"), "w") as f:
+            f.write("dev-util/bar\n")
+        with open(pjoin(self.dir, "0", "unrelated"), "w") as f:
+            f.write("foo\n")
+        p4 = self.get_profile("1", cache_dir=cache_dir)
+        assert p4.masks == p3.masks
+        assert '_stack' not in vars(p4)
+
+        # cache files accessible by others aren't trusted
+        cache_file = pjoin(cache_dir, os.listdir(cache_dir)[0])
+        os.chmod(cache_file, 0o644)
+        p5 = self.get_profile("1", cache_dir=cache_dir)
+        assert p5.masks == p3.masks
+        assert '_stack' in vars(p5)
+        assert os.stat(cache_file).st_mode & 0o777 == 0o600
+
+        # different profiles use separate cache files
+        self.get_profile("0", cache_dir=cache_dir).masks
+        assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from unittest import mock
+
+from snakeoil import data_source
+from snakeoil.chksum import get_handlers
+import pytest
+
+from pkgcore.fetch import base, custom, fetchable, prefetch
+from pkgcore.fetch.prefetch import prefetcher
+from pkgcore.operations.format import fetch_base
+
+data = 'asdf' * 1000
+handlers = get_handlers(('size', 'sha512'))
+chksums = {k: v(data_source.data_source(data)) for k, v in handlers.items()}
+
+
+class FakeFetcher(base.fetcher):
+    """Fetcher writing files into a distdir, optionally blocking."""
+
+    def __init__(self, distdir, contents=data):
+        self.distdir = distdir
+        self.contents = contents
+        self.fetched = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch(self, target):
+        self.release.wait()
+        self.fetched.append(target.filename)
+        path = os.path.join(self.distdir, target.filename)
+        with open(path, 'w') as f:
+            f.write(self.contents)
+        self._verify(path, target)
+        return path
+
+
+class TestPrefetcher:
+
+    @pytest.fixture(autouse=True)
+    def _setup(self, tmp_path):
+        self.distdir = str(tmp_path)
+        self.fetcher = FakeFetcher(self.distdir)
+        self.files = [
+            fetchable(f'file{i}', uri=(f'http://example.com/file{i}',), chksums=chksums)
+            for i in range(3)]
+
+    def test_fetch(self):
+        with prefetcher(jobs=2) as p:
+            p.add(self.fetcher, self.files)
+            assert self.fetcher.prefetcher is p
+            for f in self.files:
+                assert p.wait(self.fetcher, f) == os.path.join(self.distdir, f.filename)
+        assert sorted(self.fetcher.fetched) == ['file0', 'file1', 'file2']
+        assert self.fetcher.prefetcher is None
+
+    def test_done(self):
+        self.fetcher.release.clear()
+        with prefetcher(jobs=1) as p:
+            p.add(self.fetcher, self.files[:1])
+            assert not p.done(self.fetcher, self.files)
+            self.fetcher.release.set()
+            p.wait(self.fetcher, self.files[0])
+            # unqueued fetchables don't hold anything up
+            assert p.done(self.fetcher, self.files)
+
+    def test_skipped(self):
+        nouri = fetchable('nouri', chksums=chksums)
+        with prefetcher() as p:
+            p.add(self.fetcher, self.files + self.files[:1] + [nouri])
+            p.wait_all(self.fetcher, self.files)
+            assert p.wait(self.fetcher, nouri) is None
+        assert sorted(self.fetcher.fetched) == ['file0', 'file1', 'file2']
+
+    def test_failure(self):
+        self.fetcher.contents = 'bad'
+        with prefetcher() as p:
+            p.add(self.fetcher, self.files[:1])
+            assert p.wait(self.fetcher, self.files[0]) is None
+
+    def test_shutdown(self):
+        self.fetcher.release.clear()
+        p = prefetcher(jobs=1)
+        p.add(self.fetcher, self.files)
+        threading.Timer(0.1, self.fetcher.release.set).start()
+        p.shutdown()
+        # queued fetches that hadn't started are cancelled
+        assert len(self.fetcher.fetched) < len(self.files)
+        assert p.wait(self.fetcher, self.files[0]) is None
+
+    def test_shutdown_running(self):
+        # running fetches are aborted instead of being waited on
+        fetcher = custom.fetcher(
+            self.distdir, 'touch ${DISTDIR}/${FILE}.started; exec sleep 30',
+            userpriv=False)
+        p = prefetcher(jobs=1)
+        p.add(fetcher, self.files[:1])
+        future = p._pending[(self.distdir, 'file0')][1]
+        started = os.path.join(self.distdir, 'file0.started')
+        for _ in range(100):
+            if os.path.exists(started):
+                break
+            time.sleep(0.05)
+        start = time.time()
+        p.shutdown(wait=False)
+        assert future.result(timeout=10) is None
+        assert time.time() - start < 10
+        assert not fetcher._spawned
+
+        # fetchers that can't abort are reported as being waited on
+        self.fetcher.release.clear()
+        p = prefetcher(jobs=1)
+        p.add(self.fetcher, self.files[:1])
+        future = p._pending[(self.distdir, 'file0')][1]
+        while not future.running():
+            time.sleep(0.01)
+        with mock.patch.object(prefetch.logger, 'warning') as warning:
+            p.shutdown(wait=False)
+        warning.assert_called_once_with('waiting for %s to finish fetching', 'file0')
+        self.fetcher.release.set()
+
+    def test_fetch_op(self):
+        op = fetch_base(None, None, self.files, self.fetcher)
+        self.fetcher.release.clear()
+        with prefetcher() as p:
+            p.add(self.fetcher, self.files)
+            self.fetcher.release.set()
+            assert op.fetch_one(self.files[0], None)
+            # the prefetched file is reused
+            assert self.fetcher.fetched.count('file0') == 1
+            assert os.path.join(self.distdir, 'file0') in op.verified_files
@@ -0,0 +1,76 @@
+import os
+
+from pkgcore.operations import regen
+
+
+class UnpicklableError(Exception):
+
+    def __reduce__(self):
+        raise TypeError('not picklable')
+
+
+class fake_pkg:
+
+    def __init__(self, cpvstr, exc=None):
+        self.cpvstr = cpvstr
+        self.exc = exc
+
+    @property
+    def keywords(self):
+        if self.exc is not None:
+            raise self.exc
+        return (str(os.getpid()),)
+
+
+class fake_cache:
+
+    autocommits = True
+    readonly = False
+
+    def commit(self, force=False):
+        pass
+
+
+class fake_repo:
+
+    cache = fake_cache()
+
+
+class TestRegenRepository:
+
+    def pkgs(self):
+        return [
+            fake_pkg('cat/pkg-1'),
+            fake_pkg('cat/pkg-2', ValueError('bad pkg')),
+            fake_pkg('cat/pkg-3', UnpicklableError('unpicklable')),
+            fake_pkg('cat/pkg-4'),
+        ]
+
+    def check_errors(self, errors):
+        errors = sorted(errors, key=lambda x: x[0].cpvstr)
+        assert [pkg.cpvstr for pkg, e in errors] == ['cat/pkg-2', 'cat/pkg-3']
+        assert str(errors[0][1]) == 'bad pkg'
+        assert str(errors[1][1]) == 'unpicklable'
+
+    def test_threads(self):
+        self.check_errors(regen.regen_repository(
+            fake_repo(), self.pkgs(), observer=None, threads=2))
+
+    def test_processes(self):
+        pkgs = self.pkgs()
+        errors = list(regen.regen_repository(
+            fake_repo(), pkgs, observer=None, processes=2))
+        self.check_errors(errors)
+        # errors map back to the parent's pkg objects
+        assert all(any(pkg is x for x in pkgs) for pkg, e in errors)
+        assert not regen._worker_state
+
+    def test_processes_unshareable_cache(self):
+        repo = fake_repo()
+        repo.cache = fake_cache()
+        repo.cache.autocommits = False
+        # falls back to threads, so raw exceptions come through unaltered
+        errors = sorted(
+            regen.regen_repository(repo, self.pkgs(), observer=None, processes=2),
+            key=lambda x: x[0].cpvstr)
+        assert isinstance(errors[1][1], UnpicklableError)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+
+from snakeoil import data_source
+from snakeoil.chksum import get_handlers
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+
+from pkgcore.fetch import custom, fetchable
+from pkgcore.operations import scheduler
+from pkgcore.test.misc import FakePkg
+
+
+class fake_op:
+
+    def __init__(self, cpv, rdepend='', desc='add'):
+        self.pkg = FakePkg(cpv, data={'RDEPEND': rdepend})
+        self.desc = desc
+
+
+class TestOpGraph(TestCase):
+
+    def test_graph(self):
+        ops = [
+            fake_op('dev-libs/a-1'),
+            fake_op('dev-libs/b-1'),
+            fake_op('dev-libs/c-1', '>=dev-libs/a-1 || ( dev-libs/b dev-libs/d )'),
+            fake_op('dev-libs/d-1', 'dev-libs/c'),
+            fake_op('dev-libs/a-1', desc='remove'),
+            fake_op('dev-libs/e-1'),
+        ]
+        self.assertEqual(
+            scheduler.op_graph(ops),
+            [set(), set(), {0, 1}, {2}, {0, 1, 2, 3}, {4}])
+
+
+class TestBuildScheduler(TestCase):
+
+    ops = [
+        fake_op('dev-libs/a-1'),
+        fake_op('dev-libs/b-1'),
+        fake_op('dev-libs/c-1', 'dev-libs/a'),
+        fake_op('dev-libs/d-1', 'dev-libs/c dev-libs/b'),
+        fake_op('dev-libs/e-1'),
+    ]
+
+    def run_scheduler(self, **kwargs):
+        merged = []
+
+        def build(op):
+            return (op.pkg.cpvstr, os.getpid())
+
+        def merge(op, result):
+            # builds happen in children
+            self.assertNotEqual(result[1], os.getpid())
+            # deps are always merged first
+            for dep in ('a', 'b', 'c'):
+                if dep in str(op.pkg.rdepend):
+                    self.assertIn(f'dev-libs/{dep}-1', merged)
+            merged.append(result[0])
+            return True
+
+        s = scheduler.build_scheduler(self.ops, build, merge, **kwargs)
+        return s.run(), merged
+
+    def test_run(self):
+        for jobs in (1, 3):
+            failed, merged = self.run_scheduler(jobs=jobs)
+            self.assertEqual(failed, [])
+            self.assertEqual(sorted(merged), sorted(x.pkg.cpvstr for x in self.ops))
+
+    def test_failures(self):
+        s = scheduler.build_scheduler(
+            self.ops, lambda op: None if op.pkg.package == 'c' else (), lambda op, r: True,
+            jobs=2)
+        failed = s.run(ignore_failures=True)
+        self.assertEqual([x.pkg.package for x in failed], ['c', 'd'])
+
+        merged = []
+        s = scheduler.build_scheduler(
+            self.ops, lambda op: (), lambda op, r: merged.append(op) or op.pkg.package != 'a',
+            jobs=2)
+        failed = s.run()
+        self.assertIn('a', [x.pkg.package for x in failed])
+        self.assertIn('c', [x.pkg.package for x in failed])
+        self.assertIn('d', [x.pkg.package for x in failed])
+
+    def test_deferred(self):
+        merged = []
+
+        def prepare(op):
+            # e-1 can't start until everything else was merged
+            return op.pkg.package != 'e' or len(merged) == len(self.ops) - 1
+
+        s = scheduler.build_scheduler(
+            self.ops, lambda op: (), lambda op, r: merged.append(op.pkg.package) or True,
+            jobs=2, prepare=prepare)
+        s.poll_interval = 0.01
+        self.assertEqual(s.run(), [])
+        self.assertEqual(merged[-1], 'e')
+        self.assertEqual(sorted(merged), ['a', 'b', 'c', 'd', 'e'])
+
+    def test_overlapping_fetchables(self):
+        data = 'asdf' * 100
+        handlers = get_handlers(('size', 'sha512'))
+        chksums = {k: v(data_source.data_source(data)) for k, v in handlers.items()}
+        shared = fetchable('shared', uri=('http://example.com/shared',), chksums=chksums)
+        with tempfile.TemporaryDirectory() as distdir:
+            # the fetch command notes if another fetch of the file is in progress
+            busy = '${DISTDIR}/${FILE}.busy'
+            fetcher = custom.fetcher(
+                distdir, f'{{ mkdir {busy} || touch ${{DISTDIR}}/overlap; }}; '
+                f'sleep 0.2; printf {data} > ${{DISTDIR}}/${{FILE}}; rmdir {busy}',
+                userpriv=False)
+
+            def build(op):
+                return fetcher.fetch(shared)
+
+            ops = [fake_op(f'dev-libs/{x}-1') for x in 'abc']
+            s = scheduler.build_scheduler(ops, build, lambda op, r: r is not None, jobs=3)
+            self.assertEqual(s.run(), [])
+            self.assertFalse(os.path.exists(pjoin(distdir, 'overlap')))
@@ -4,6 +4,7 @@ from functools import partial
 from pkgcore.repository.multiplex import tree
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values
+from pkgcore.util.packages import sort_key
 from snakeoil.test import TestCase
 
 rev_sorted = partial(sorted, reverse=True)
@@ -61,6 +62,22 @@ class TestMultiplex(TestCase):
             list(x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)),
             rev_sorted(self.tree1_list + self.tree2_list))
 
+    def test_key_sorting(self):
+        t1 = SimpleTree({"dev-util": {"diffball": ["1.9", "1.10"]}})
+        t2 = SimpleTree({"dev-util": {"diffball": ["1.2", "1.10_p1"]}, "app-misc": {"foo": ["1"]}})
+        ctree = self.kls(t1, t2)
+        expected = [
+            "app-misc/foo-1", "dev-util/diffball-1.2", "dev-util/diffball-1.9",
+            "dev-util/diffball-1.10", "dev-util/diffball-1.10_p1"]
+        self.assertEqual(
+            [x.cpvstr for x in ctree.itermatch(
+                packages.AlwaysTrue, sorter=partial(sorted, key=sort_key))],
+            expected)
+        self.assertEqual(
+            [x.cpvstr for x in ctree.itermatch(
+                packages.AlwaysTrue, sorter=partial(sorted, key=sort_key, reverse=True))],
+            expected[::-1])
+
     def test_install(self):
         raise Exception()
     test_install.todo = "need to implement tests for multiplexing down repo_ops"
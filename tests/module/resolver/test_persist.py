@@ -0,0 +1,97 @@
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test import TestCase
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import upgrade_resolver
+from pkgcore.resolver import persist
+from pkgcore.test import malleable_obj
+
+from .test_plan import mk_repo
+
+
+class TestPlanCache(TempDirMixin, TestCase):
+
+    pkgs = {
+        'dev-libs/lib-1': '', 'dev-libs/lib-2': '', 'dev-libs/dep-1': '',
+        'app-misc/a-1': 'dev-libs/lib', 'app-misc/b-1': '!dev-libs/dep dev-libs/lib'}
+
+    def mk_resolver(self, pkgs=None):
+        if pkgs is None:
+            pkgs = self.pkgs
+        repo = mk_repo(pkgs)
+        vdb = mk_repo({'dev-libs/lib-1': ''}, livefs=True, repo_id='vdb')
+        return upgrade_resolver([vdb], [repo])
+
+    @staticmethod
+    def ops(resolver):
+        return [str(x) for x in resolver.state.iter_ops(True)]
+
+    def test_reuse(self):
+        cache = persist.plan_cache(pjoin(self.dir, 'cache', 'plan'))
+        targets = [atom('app-misc/a')]
+        resolver = self.mk_resolver()
+        self.assertEqual(cache.load(resolver, 'fp', targets), None)
+        self.assertEqual(resolver.add_atoms(targets), ())
+        self.assertTrue(cache.save(resolver, 'fp', targets))
+
+        new = self.mk_resolver()
+        self.assertEqual(cache.load(new, 'fp', targets), [])
+        self.assertEqual(self.ops(new), self.ops(resolver))
+        self.assertEqual(len(new.state.plan), len(resolver.state.plan))
+
+        # mismatching fingerprints or dropped targets aren't reused
+        self.assertEqual(cache.load(self.mk_resolver(), 'fp2', targets), None)
+        self.assertEqual(cache.load(self.mk_resolver(), 'fp', [atom('app-misc/b')]), None)
+
+        # new targets are resolved on top of the saved plan
+        targets.append(atom('app-misc/b'))
+        new = self.mk_resolver()
+        self.assertEqual(cache.load(new, 'fp', targets), [targets[1]])
+        self.assertEqual(new.add_atoms([targets[1]]), ())
+        full = self.mk_resolver()
+        self.assertEqual(full.add_atoms(targets), ())
+        self.assertEqual(sorted(self.ops(new)), sorted(self.ops(full)))
+
+        # packages that disappeared invalidate the plan
+        pkgs = dict(self.pkgs)
+        del pkgs['dev-libs/lib-2']
+        new = self.mk_resolver(pkgs)
+        self.assertEqual(cache.load(new, 'fp', targets), None)
+        self.assertFalse(new.state.plan)
+
+    def test_untrusted(self):
+        cache = persist.plan_cache(pjoin(self.dir, 'plan'))
+        targets = [atom('app-misc/a')]
+        resolver = self.mk_resolver()
+        self.assertEqual(resolver.add_atoms(targets), ())
+        self.assertTrue(cache.save(resolver, 'fp', targets))
+        self.assertEqual(os.stat(cache.path).st_mode & 0o777, 0o600)
+        self.assertEqual(cache.load(self.mk_resolver(), 'fp', targets), [])
+        # plans accessible by others are ignored
+        os.chmod(cache.path, 0o644)
+        self.assertEqual(cache.load(self.mk_resolver(), 'fp', targets), None)
+
+    def test_signatures(self):
+        os.mkdir(pjoin(self.dir, 'cat'))
+        sig = persist.repo_signature(mk_repo({}))
+        self.assertEqual(sig, persist.repo_signature(mk_repo({})))
+
+        repo = malleable_obj(repo_id='repo', location=self.dir, cache=())
+        os.makedirs(pjoin(self.dir, 'cat', 'pkg'))
+        ebuild = pjoin(self.dir, 'cat', 'pkg', 'pkg-1.ebuild')
+        with open(ebuild, 'w') as f:
+            f.write('EAPI=7\n')
+        sig = persist.repo_signature(repo)
+        self.assertEqual(sig, persist.repo_signature(repo))
+        # new versions in existing package dirs change the signature
+        with open(pjoin(self.dir, 'cat', 'pkg', 'pkg-2.ebuild'), 'w') as f:
+            f.write('EAPI=7\n')
+        os.utime(pjoin(self.dir, 'cat', 'pkg'), ns=(0, 0))
+        new_sig = persist.repo_signature(repo)
+        self.assertNotEqual(sig, new_sig)
+        # as do in-place ebuild edits
+        os.utime(ebuild, ns=(0, 0))
+        self.assertNotEqual(new_sig, persist.repo_signature(repo))
@@ -1,5 +1,7 @@
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 from pkgcore.restrictions import restriction
+from pkgcore.test.misc import FakePkg
 from snakeoil.test import TestCase
 
 from .test_choice_point import fake_package
@@ -60,3 +62,27 @@ class SlotTesting(TestCase):
         self.assertFalse([], c.fill_slotting(p2))
         c.remove_slotting(p)
         c.remove_slotting(p2)
+
+    def test_slotted(self):
+        c = PigeonHoledSlots()
+        pkgs = [FakePkg(f'sys-kernel/linux-{x}', slot=x) for x in ('1', '2', '3')]
+        for pkg in pkgs:
+            self.assertEqual([], c.fill_slotting(pkg))
+        self.assertIdentical(c.get_conflicting_slot(pkgs[1]), pkgs[1])
+        self.assertIdentical(
+            c.get_conflicting_slot(FakePkg('sys-kernel/linux-4', slot='4')), None)
+        self.assertEqual(c.find_atom_matches(atom('sys-kernel/linux:2')), [pkgs[1]])
+        self.assertEqual(c.find_atom_matches(atom('>=sys-kernel/linux-2')), pkgs[1:])
+
+        # slotted blockers only apply to their slot
+        blocker = atom('!sys-kernel/linux:4')
+        self.assertEqual([], c.add_limiter(blocker))
+        self.assertIn(blocker, c)
+        self.assertEqual([blocker], c.fill_slotting(FakePkg('sys-kernel/linux-4', slot='4')))
+        c.remove_limiter(blocker)
+        self.assertNotIn(blocker, c)
+        self.assertEqual(c.add_limiter(atom('!<sys-kernel/linux-3')), pkgs[:2])
+
+        for pkg in pkgs:
+            c.remove_slotting(pkg)
+        self.assertFalse(c.slot_dict)
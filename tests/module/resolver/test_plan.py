@@ -1,20 +1,28 @@
+from unittest import mock
+
 from snakeoil.currying import post_curry
 from snakeoil.test import TestCase
 
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import upgrade_resolver
+from pkgcore.repository.util import SimpleTree
 from pkgcore.resolver import plan
 from pkgcore.test.misc import FakePkg
 
 
 class TestPkgSorting(TestCase):
 
-    def check_it(self, sorter, vers, expected, iter_sort_target=False):
+    def check_it(self, sorter, vers, expected, iter_sort_target=False, fullver=False):
         pkgs = [FakePkg(f"d-b/a-{x}") for x in vers]
         if iter_sort_target:
             pkgs = [[x, []] for x in pkgs]
         pkgs = list(sorter(pkgs))
         if iter_sort_target:
             pkgs = [x[0] for x in pkgs]
-        self.assertEqual([int(x.fullver) for x in pkgs], expected)
+        if fullver:
+            self.assertEqual([x.fullver for x in pkgs], expected)
+        else:
+            self.assertEqual([int(x.fullver) for x in pkgs], expected)
 
     test_highest_iter_sort = post_curry(check_it, plan.highest_iter_sort,
         [7,9,3,2], [9,7,3,2], True)
@@ -27,3 +35,118 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+    def test_sort_key_versions(self):
+        self.check_it(plan.pkg_sort_highest, ["1.10", "1.9", "1.10_p1", "1.2"],
+            ["1.10_p1", "1.10", "1.9", "1.2"], fullver=True)
+
+
+def mk_repo(pkgs, livefs=False, repo_id='gentoo'):
+    d = {}
+    for cpv in pkgs:
+        pkg = FakePkg(cpv)
+        d.setdefault(pkg.category, {}).setdefault(pkg.package, []).append(pkg.fullver)
+    def pkg_klass(cat, pkg, ver):
+        cpv = f'{cat}/{pkg}-{ver}'
+        return FakePkg(cpv, repo=repo, data={'RDEPEND': pkgs[cpv]})
+    repo = SimpleTree(d, pkg_klass=pkg_klass, livefs=livefs, repo_id=repo_id)
+    return repo
+
+
+class TestCandidatesCache(TestCase):
+
+    def test_candidates(self):
+        repo = mk_repo({
+            'dev-libs/lib-1': '', 'dev-libs/lib-2': '',
+            'app-misc/a-1': 'dev-libs/lib', 'app-misc/b-1': 'dev-libs/lib app-misc/a'})
+        vdb = mk_repo({'dev-libs/lib-1': ''}, livefs=True, repo_id='vdb')
+        resolver = upgrade_resolver([vdb], [repo])
+        vdb_lib = list(resolver.candidates(atom('dev-libs/lib:0'), resolver.livefs_dbs))
+        self.assertEqual([x.cpvstr for x in vdb_lib], ['dev-libs/lib-1'])
+
+        self.assertEqual(resolver.add_atoms([atom('app-misc/b'), atom('app-misc/a')]), ())
+        stats = resolver.candidates_stats
+        self.assertTrue(stats['misses'])
+
+        a = atom('app-misc/a')
+        matches = resolver.candidates(a, resolver.default_dbs)
+        self.assertIdentical(matches, resolver.candidates(a, resolver.default_dbs))
+        self.assertEqual(resolver.candidates_stats['hits'], stats['hits'] + 2)
+
+        # vdb lookups follow the replaced vdb pkgs
+        self.assertEqual(list(resolver.candidates(atom('dev-libs/lib:0'), resolver.livefs_dbs)), [])
+        resolver.reset()
+        hits = resolver.candidates_stats['hits']
+        self.assertEqual(
+            list(resolver.candidates(atom('dev-libs/lib:0'), resolver.livefs_dbs)), vdb_lib)
+        self.assertEqual(resolver.candidates_stats['hits'], hits + 1)
+
+        resolver.free_caches()
+        self.assertEqual(resolver.candidates_stats['size'], 0)
+
+
+class TestSpeculativeResolution(TestCase):
+
+    pkgs = {
+        'dev-libs/lib-0': '', 'dev-libs/lib-1': '', 'dev-libs/lib-2': 'dev-libs/missing',
+        'dev-libs/lib-3': 'dev-libs/missing',
+        'dev-libs/dep-0': '', 'dev-libs/dep-1': '', 'dev-libs/dep-2': '',
+        'dev-libs/bad-1': 'dev-libs/missing', 'dev-libs/bad-2': 'dev-libs/missing',
+        'dev-libs/bad-3': 'dev-libs/missing',
+        'app-misc/a-1': 'dev-libs/lib', 'app-misc/a-2': 'dev-libs/lib app-misc/b',
+        'app-misc/b-1': 'dev-libs/dep', 'app-misc/b-2': '>=dev-libs/lib-5'}
+
+    def resolve(self, targets, **kwds):
+        resolver = upgrade_resolver([], [mk_repo(self.pkgs)], **kwds)
+        ret = resolver.add_atoms([atom(x) for x in targets])
+        return ret, [x.pkg.cpvstr for x in resolver.state.iter_ops()]
+
+    def test_matches_sequential(self):
+        for targets in (['app-misc/a'], ['app-misc/b', 'app-misc/a'], ['dev-libs/lib']):
+            sequential = self.resolve(targets)
+            self.assertEqual(sequential[0], ())
+            for jobs in (2, 3):
+                self.assertEqual(
+                    self.resolve(targets, speculative_jobs=jobs), sequential)
+
+    def test_forked(self):
+        calls = []
+        pids = {}
+        fork_choice = plan.merge_plan._fork_choice
+        reap_choice = plan.merge_plan._reap_choice
+        kill_choice = plan.merge_plan._kill_choice
+
+        def fork(resolver, atom, stack, choices, depth, pkg):
+            calls.append(('fork', pkg.cpvstr))
+            pid, fd = fork_choice(resolver, atom, stack, choices, depth, pkg)
+            pids[pid] = pkg.cpvstr
+            return pid, fd
+
+        def reap(pid, fd):
+            calls.append(('reap', pids[pid]))
+            return reap_choice(pid, fd)
+
+        def kill(pid, fd):
+            calls.append(('kill', pids[pid]))
+            return kill_choice(pid, fd)
+
+        with mock.patch.object(plan.merge_plan, '_fork_choice', fork), \
+                mock.patch.object(plan.merge_plan, '_reap_choice', staticmethod(reap)), \
+                mock.patch.object(plan.merge_plan, '_kill_choice', staticmethod(kill)):
+            # the first package works out, nothing is forked
+            self.assertEqual(self.resolve(['dev-libs/dep'], speculative_jobs=3)[0], ())
+            self.assertEqual(calls, [])
+
+            # once lib-3 fails the rest are tried in parallel, with the
+            # children after the first viable one being killed
+            self.assertEqual(self.resolve(['dev-libs/lib'], speculative_jobs=3)[0], ())
+            self.assertEqual(calls, [
+                ('fork', 'dev-libs/lib-2'), ('fork', 'dev-libs/lib-1'),
+                ('fork', 'dev-libs/lib-0'), ('reap', 'dev-libs/lib-2'),
+                ('reap', 'dev-libs/lib-1'), ('kill', 'dev-libs/lib-0')])
+
+    def test_failure(self):
+        for target in ('>=dev-libs/lib-2', 'dev-libs/bad'):
+            ret, _ = self.resolve([target], speculative_jobs=2)
+            self.assertTrue(ret)
+            self.assertEqual(ret[0], self.resolve([target])[0][0])
@@ -0,0 +1,62 @@
+from io import StringIO
+import json
+
+from snakeoil.test import TestCase
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import upgrade_resolver
+from pkgcore.resolver.profile import resolver_profiler
+
+from .test_plan import mk_repo
+
+
+class fake_clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class TestResolverProfiler(TestCase):
+
+    def test_timing(self):
+        profiler = resolver_profiler(clock=fake_clock())
+        profiler.enter('a')
+        profiler.enter('b')
+        profiler.exit('b')
+        profiler.enter('c')
+        profiler.exit('c', failed=True)
+        profiler.exit('a')
+        self.assertEqual(profiler.total_time, 5.0)
+        self.assertEqual(profiler.atoms['a'].time, 5.0)
+        self.assertEqual(profiler.atoms['a'].self_time, 3.0)
+        self.assertEqual(profiler.atoms['c'].failures, 1)
+        f = StringIO()
+        profiler.write(f, 'flamegraph')
+        self.assertEqual(
+            f.getvalue().splitlines(), ['a 3000000', 'a;b 1000000', 'a;c 1000000'])
+        self.assertRaises(ValueError, profiler.write, f, 'foo')
+
+    def test_resolution(self):
+        repo = mk_repo({
+            'dev-libs/lib-1': '', 'dev-libs/lib-2': 'dev-libs/missing',
+            'app-misc/a-1': 'dev-libs/lib'})
+        profiler = resolver_profiler()
+        resolver = upgrade_resolver([], [repo], profiler=profiler)
+        self.assertEqual(resolver.add_atoms([atom('app-misc/a')]), ())
+        profiler.add_cache_stats('candidates', resolver.candidates_stats)
+
+        f = StringIO()
+        profiler.write(f)
+        data = json.loads(f.getvalue())
+        self.assertEqual(data['atoms']['app-misc/a']['calls'], 1)
+        self.assertEqual(data['atoms']['dev-libs/missing']['failures'], 1)
+        self.assertEqual(data['atoms']['dev-libs/lib']['itermatch'], 1)
+        self.assertEqual(data['atoms']['dev-libs/lib']['backtracks'], 1)
+        self.assertEqual(data['backtracks']['count'], 1)
+        self.assertIn('candidates', data['caches'])
+        self.assertIn('ratio', data['caches']['candidates'])
+        self.assertFalse(profiler._timers)
@@ -0,0 +1,97 @@
+from itertools import product
+import pickle
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import VersionedCPV
+from pkgcore.restrictions import packages, values
+from pkgcore.restrictions.compiler import compile_restriction
+
+
+class CountingPkg:
+
+    def __init__(self, cpv, **attrs):
+        self._cpv = VersionedCPV(cpv)
+        self._attrs = attrs
+        self.pulled = []
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        self.pulled.append(attr)
+        if attr in self._attrs:
+            return self._attrs[attr]
+        return getattr(self._cpv, attr)
+
+
+def P(attr, val, **kwds):
+    return packages.PackageRestriction(attr, values.StrExactMatch(val), **kwds)
+
+
+class TestCompileRestriction:
+
+    def test_equivalence(self):
+        restricts = [
+            P('category', 'dev-util'),
+            P('package', 'foo', negate=True),
+            packages.AndRestriction(P('category', 'dev-util'), P('package', 'foo')),
+            packages.AndRestriction(
+                P('slot', '1'), P('category', 'dev-util'), negate=True),
+            packages.OrRestriction(P('package', 'bar'), P('slot', '0')),
+            packages.OrRestriction(
+                P('package', 'bar'), P('slot', '0'), negate=True),
+            packages.OrRestriction(
+                packages.AndRestriction(P('category', 'dev-util'), P('package', 'bar')),
+                packages.AndRestriction(
+                    P('slot', '1'), packages.PackageRestriction(
+                        'package', values.StrGlobMatch('fo')))),
+            packages.AndRestriction(),
+            packages.OrRestriction(),
+            packages.AndRestriction(packages.AlwaysTrue, P('missing', 'x')),
+            packages.AndRestriction(
+                P('missing', 'x', negate=True), atom('>=dev-util/foo-1')),
+            packages.PackageRestrictionMulti(
+                ('category', 'package'), values.AnyMatch(values.StrExactMatch('foo'))),
+        ]
+        pkgs = [
+            CountingPkg(cpv, slot=slot) for cpv, slot in
+            product(('dev-util/foo-1', 'dev-util/bar-2', 'app-misc/foo-0'), ('0', '1'))]
+        for r, pkg in product(restricts, pkgs):
+            assert bool(compile_restriction(r)(pkg)) == bool(r.match(pkg)), \
+                f'{r} mismatched for {pkg._cpv}'
+
+    def test_cached(self):
+        r = packages.AndRestriction(P('category', 'dev-util'), P('package', 'foo'))
+        f = compile_restriction(r)
+        assert f is not r.match
+        assert compile_restriction(r) is f
+        # compiled functions aren't pickled
+        r2 = pickle.loads(pickle.dumps(r))
+        assert r2 == r
+        assert getattr(r2, '_compiled', None) is None
+
+    def test_unfinalized(self):
+        r = packages.AndRestriction(P('category', 'dev-util'), finalize=False)
+        assert compile_restriction(r) == r.match
+
+    def test_ordering(self):
+        r = packages.AndRestriction(
+            P('slot', '0'), P('package', 'foo'), P('category', 'dev-util'))
+        pkg = CountingPkg('dev-util/bar-1', slot='0')
+        assert not compile_restriction(r)(pkg)
+        # rejected without pulling metadata
+        assert pkg.pulled == ['package']
+
+    def test_version_before_metadata(self):
+        r = packages.AndRestriction(P('slot', '0'), atom('>=dev-util/foo-2'))
+        pkg = CountingPkg('dev-util/foo-1', slot='0')
+        assert not compile_restriction(r)(pkg)
+        assert 'slot' not in pkg.pulled
+
+    def test_attrs_pulled_once(self):
+        r = packages.OrRestriction(
+            packages.AndRestriction(P('category', 'dev-util'), P('slot', '1')),
+            packages.AndRestriction(P('category', 'dev-util'), P('slot', '0')),
+        )
+        pkg = CountingPkg('dev-util/foo-1', slot='0')
+        assert compile_restriction(r)(pkg)
+        assert sorted(pkg.pulled) == ['category', 'slot']
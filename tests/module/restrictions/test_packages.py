@@ -2,7 +2,7 @@ from snakeoil.mappings import AttrAccessible
 from snakeoil.test import mk_cpy_loadable_testcase
 
 from pkgcore import log
-from pkgcore.restrictions import packages, values
+from pkgcore.restrictions import packages, restriction, values
 from pkgcore.test import (
     silence_logging, TestRestriction, TestCase, malleable_obj, callback_logger)
 
@@ -184,6 +184,32 @@ class native_PackageRestrictionMultiTest(TestCase):
         o.force_False(pkg)
         self.assertEqual(l, [(False, pkg, ('asdf.far', 'repo'), [2,1],)])
 
+    def test_cost(self):
+        o = self.kls(("category", "fullver"), values.AlwaysTrue)
+        self.assertEqual(o.cost, restriction.COST_STRING + restriction.COST_VERSION)
+
+
+class CostTest(TestCase):
+
+    def test_attrs(self):
+        pr = packages.PackageRestriction
+        cat = pr("category", values.AlwaysTrue)
+        ver = pr("fullver", values.AlwaysTrue)
+        slot = pr("slot", values.AlwaysTrue)
+        env = pr("environment", values.AlwaysTrue)
+        self.assertEqual(cat.cost, restriction.COST_STRING)
+        self.assertEqual(ver.cost, restriction.COST_VERSION)
+        self.assertEqual(slot.cost, restriction.COST_METADATA)
+        self.assertEqual(env.cost, restriction.COST_REGEN)
+        self.assertTrue(cat.cost < ver.cost < slot.cost < env.cost)
+
+    def test_nested(self):
+        cat = packages.PackageRestriction("category", values.AlwaysTrue)
+        slot = packages.PackageRestriction("slot", values.AlwaysTrue)
+        self.assertEqual(packages.AndRestriction(cat, slot).cost, cat.cost + slot.cost)
+        self.assertEqual(restriction.Negate(slot).cost, slot.cost)
+        self.assertEqual(packages.AlwaysTrue.cost, 0)
+
 
 class ConditionalTest(TestCase):
 
@@ -1,6 +1,7 @@
 from functools import partial
+import pickle
 
-from pkgcore.restrictions import restriction
+from pkgcore.restrictions import packages, restriction, values
 from pkgcore.test import TestRestriction
 
 
@@ -69,6 +70,11 @@ class AlwaysBoolTest(TestRestriction):
         self.assertEqual(false_r, self.bool_kls(False))
         self.assertNotEqual(true_r, false_r)
 
+    def test_pickle(self):
+        # the shared instances are preserved
+        for r in (packages.AlwaysTrue, packages.AlwaysFalse, values.AlwaysTrue):
+            self.assertIdentical(pickle.loads(pickle.dumps(r)), r)
+
 
 class NoneMatch(restriction.base):
 
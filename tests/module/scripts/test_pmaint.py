@@ -7,6 +7,7 @@ from snakeoil.test import TestCase
 
 from pkgcore.config import basics
 from pkgcore.config.hint import ConfigHint, configurable
+from pkgcore.ebuild import processor
 from pkgcore.ebuild.cpv import CPV
 from pkgcore.operations.repo import install, uninstall, replace, operations
 from pkgcore.repository import util, syncable
@@ -253,3 +254,20 @@ class TestRegen(TestCase, ArgParseMixin):
             'fake', '--threads', '2', domain=make_domain())
         self.assertTrue(isinstance(options.repos[0], util.SimpleTree))
         self.assertEqual(options.threads, 2)
+
+    def test_parser_jobs(self):
+        options = self.parse('fake', '--jobs', '4', domain=make_domain())
+        self.assertEqual(options.jobs, 4)
+        options = self.parse('fake', domain=make_domain())
+        self.assertEqual(options.jobs, None)
+
+    def test_processor_pool(self):
+        limits = processor._pool_limits.copy()
+        try:
+            self.assertOut(
+                ['skipping repo fake: cache disabled'],
+                'fake', '--ebd-pool-size', '2', '--ebd-max-requests', '50',
+                domain=make_domain())
+            self.assertEqual(processor._pool_limits, {'size': 2, 'max_requests': 50})
+        finally:
+            processor._pool_limits.update(limits)
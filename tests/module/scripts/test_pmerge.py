@@ -1,11 +1,20 @@
+import os
+from types import SimpleNamespace
+
 import pytest
+from snakeoil.osutils import pjoin
 
+from pkgcore.ebuild import ebd
 from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.resolver import upgrade_resolver
 from pkgcore.repository.util import SimpleTree
+from pkgcore.resolver import persist
 from pkgcore.scripts import pmerge
 from pkgcore.util.parserestrict import parse_match
 from pkgcore.test.misc import FakePkg, FakeRepo
 
+from ..resolver.test_plan import mk_repo
+
 
 # TODO: make repo objs into configurable fixtures
 class TestTargetParsing:
@@ -87,3 +96,111 @@ class TestTargetParsing:
         assert a[0].key == 'foo/bar'
         assert a[0].match(atom('foo/bar:0'))
         assert not a[0].match(atom('foo/bar:2'))
+
+
+class FakeBuildOp(ebd.ebd):
+    """Build op sharing ebd's builddir handling without running any phases."""
+
+    def __init__(self, pkg, builddir):
+        self.pkg = pkg
+        self.builddir = builddir
+        self.observer = None
+        self.clean_needed = False
+        self._stage_state = set()
+
+    def start(self):
+        os.makedirs(pjoin(self.builddir, 'image'))
+        self.clean_needed = True
+        self._stage_state.add('start')
+
+    def install(self):
+        self.start()
+        self._stage_state.add('install')
+        return True
+
+    def __set_stage_state__(self, stages):
+        self._stage_state = set(stages)
+
+    def finalize(self):
+        assert self._stage_state == {'start', 'install'}
+        assert os.path.isdir(pjoin(self.builddir, 'image'))
+        return self.pkg
+
+
+class FakeDomain:
+
+    def __init__(self, builddir):
+        self.builddir = builddir
+        self.installed = []
+
+    def pkg_operations(self, pkg, observer=None):
+        def run_if_supported(name, *args, or_return=None, **kwargs):
+            if name == 'build':
+                return FakeBuildOp(pkg, pjoin(self.builddir, pkg.cpvstr))
+            return or_return
+        return SimpleNamespace(run_if_supported=run_if_supported)
+
+    def install_pkg(self, pkg, observer):
+        assert os.path.isdir(pjoin(self.builddir, pkg.cpvstr, 'image'))
+        self.installed.append(pkg.cpvstr)
+        return SimpleNamespace(finish=lambda: True)
+
+
+class FakeOut:
+
+    bold = reset = ''
+
+    def write(self, *args, **kwargs):
+        pass
+
+    error = write
+
+    def flush(self):
+        pass
+
+
+class TestParallelMerge:
+
+    def test_builddir_cleanup(self, tmp_path):
+        domain = FakeDomain(str(tmp_path))
+        ops = [SimpleNamespace(pkg=FakePkg(f'dev-util/{x}-1'), desc='add') for x in 'ab']
+        options = SimpleNamespace(
+            jobs=2, load_average=None, ignore_failures=False, oneshot=True)
+        ret = pmerge.parallel_merge(
+            FakeOut(), domain, ops, [], options, None, None, None, None)
+        assert ret == 0
+        assert sorted(domain.installed) == ['dev-util/a-1', 'dev-util/b-1']
+        # builddirs created by the workers are removed after merging
+        assert os.listdir(str(tmp_path)) == []
+
+
+class TestResolveOnPlan:
+
+    pkgs = {
+        'dev-libs/lib-1': '', 'dev-libs/lib-2': '',
+        'app-misc/a-1': 'dev-libs/lib', 'app-misc/b-1': '<dev-libs/lib-2'}
+
+    def mk_resolver(self):
+        vdb = mk_repo({}, livefs=True, repo_id='vdb')
+        return upgrade_resolver([vdb], [mk_repo(self.pkgs)])
+
+    def test_conflicting_targets(self, tmp_path):
+        cache = persist.plan_cache(str(tmp_path / 'plan'))
+        targets = [atom('app-misc/a')]
+        resolver = self.mk_resolver()
+        assert resolver.add_atoms(targets) == ()
+        assert cache.save(resolver, 'fp', targets)
+
+        # the replayed plan fixes dev-libs/lib-2 which app-misc/b can't use,
+        # while resolving it first allows app-misc/a to use dev-libs/lib-1
+        targets.insert(0, atom('app-misc/b'))
+        resolver = self.mk_resolver()
+        remaining = cache.load(resolver, 'fp', targets)
+        assert remaining == [targets[0]]
+        assert resolver.add_atoms(remaining) != ()
+
+        resolver = self.mk_resolver()
+        remaining = cache.load(resolver, 'fp', targets)
+        assert pmerge.resolve_on_plan(FakeOut(), resolver, remaining, targets) == ()
+        pkgs = sorted(op.pkg.cpvstr for op in resolver.state.iter_ops(True))
+        assert pkgs == ['app-misc/a-1', 'app-misc/b-1', 'dev-libs/lib-1']
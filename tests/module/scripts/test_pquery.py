@@ -1,9 +1,18 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
 from pkgcore.config import basics
 from pkgcore.config.hint import ConfigHint, configurable
 from pkgcore.ebuild import atom
+from pkgcore.ebuild.repository import ProvidesRepo
 from pkgcore.repository import util
+from pkgcore.repository.util import RepositoryGroup
 from pkgcore.scripts import pquery
 from pkgcore.test.scripts.helpers import ArgParseMixin
+from pkgcore.vdb import ondisk
+from snakeoil.osutils import pjoin
 from snakeoil.test import TestCase
 
 
@@ -72,3 +81,33 @@ class CommandlineTest(TestCase, ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
+
+    def test_owns(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for cpv, contents in (('cat/a-1', 'dir /usr\ndir /usr/lib'), ('cat/b-1', 'dir /usr')):
+            path = pjoin(tmpdir, 'vdb', cpv)
+            os.makedirs(path)
+            for k, v in (('SLOT', '0'), ('CONTENTS', contents)):
+                with open(pjoin(path, k), 'w') as f:
+                    f.write(f'{v}\n')
+        vdb = ondisk.tree(pjoin(tmpdir, 'vdb'), cache_location=pjoin(tmpdir, 'cache'))
+
+        class InstalledDomain(FakeDomain):
+            # installed repos include package.provided, as for ebuild domains
+            def __init__(self, repos, vdb):
+                super().__init__(repos, RepositoryGroup(vdb + [ProvidesRepo(pkgs=[])]))
+
+        config = basics.HardCodedConfigSection({
+            'class': InstalledDomain,
+            'repos': [basics.HardCodedConfigSection({'class': fake_repo})],
+            'vdb': [basics.HardCodedConfigSection({'class': configurable(typename='repo')(lambda: vdb)})],
+            'default': True,
+        })
+        # the ownership index is used instead of scanning pkg contents
+        with mock.patch.object(
+                ondisk.tree, 'file_owners', autospec=True,
+                side_effect=ondisk.tree.file_owners) as file_owners:
+            self.assertOut(['cat/a-1'], '--owns', '/usr/lib', test_domain=config)
+            file_owners.assert_called_with(vdb, '/usr/lib')
+        self.assertOut(['cat/a-1'], '--owns-re', 'lib$', test_domain=config)
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from pkgcore.util import cachefiles
+
+
+class TestCacheFiles:
+
+    def test_fingerprint(self):
+        assert (
+            cachefiles.fingerprint({'a': frozenset('abc')}, [1]) ==
+            cachefiles.fingerprint({'a': frozenset('cba')}, (1,)))
+        assert cachefiles.fingerprint('a') != cachefiles.fingerprint('b')
+
+    def test_path_signature(self, tmp_path):
+        paths = [str(tmp_path), str(tmp_path / 'missing')]
+        sig = cachefiles.path_signature(paths)
+        assert sig[1] == (paths[1], None)
+        assert sig == cachefiles.path_signature(paths)
+        (tmp_path / 'missing').write_text('data')
+        assert sig != cachefiles.path_signature(paths)
+
+    def test_tree_paths(self, tmp_path):
+        for path in ('cat/pkg/pkg-1.ebuild', 'cat/pkg/metadata.xml',
+                     'eclass/foo.eclass', 'other/pkg/pkg-1.ebuild', '.git/HEAD'):
+            path = tmp_path / path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text('')
+        root = str(tmp_path)
+        paths = [os.path.relpath(x, root) for x in cachefiles.tree_paths(root)]
+        assert paths == [
+            '.', 'cat', 'cat/pkg', 'cat/pkg/pkg-1.ebuild', 'eclass',
+            'other', 'other/pkg', 'other/pkg/pkg-1.ebuild', 'eclass/foo.eclass']
+        # the root is skipped for explicit categories
+        paths = [os.path.relpath(x, root) for x in cachefiles.tree_paths(root, ['cat'])]
+        assert paths == ['cat', 'cat/pkg', 'cat/pkg/pkg-1.ebuild', 'eclass/foo.eclass']
+
+    def test_private(self, tmp_path):
+        path = str(tmp_path / 'cache' / 'data')
+        cachefiles.write_private(path, b'data')
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        with cachefiles.open_private(path) as f:
+            assert f.read() == b'data'
+        os.chmod(path, 0o640)
+        with pytest.raises(PermissionError):
+            cachefiles.open_private(path)
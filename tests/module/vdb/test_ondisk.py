@@ -0,0 +1,183 @@
+import os
+
+import pytest
+
+from pkgcore.ebuild.cpv import VersionedCPV
+from pkgcore.vdb import ondisk
+from pkgcore.vdb.index import MetadataIndex, OwnersIndex
+
+
+def mk_pkg(vdb, cpv, **data):
+    category, pf = cpv.split('/')
+    path = vdb.join(category, pf)
+    path.ensure(dir=True)
+    for k, v in data.items():
+        path.join(k).write(f'{v}\n')
+    return str(path)
+
+
+class TestMetadataIndex:
+
+    def test_roundtrip(self, tmpdir):
+        path = str(tmpdir.join('cache', 'index'))
+        index = MetadataIndex(path, '/var/db/pkg')
+        assert index.packages('cat', 1) is None
+        index.set_packages('cat', 1, ['a-1', 'b-1'])
+        index.set_metadata('cat', 'a-1', 2, {'SLOT': '0', 'USE': None})
+        index.save()
+
+        index = MetadataIndex(path, '/var/db/pkg')
+        assert index.packages('cat', 1) == ['a-1', 'b-1']
+        assert index.packages('cat', 3) is None
+        assert index.metadata('cat', 'a-1', 2) == {'SLOT': '0', 'USE': None}
+        assert index.metadata('cat', 'a-1', 3) is None
+        # entries for packages no longer listed are dropped
+        index.set_packages('cat', 3, ['b-1'])
+        assert index.metadata('cat', 'a-1', 2) is None
+
+        # indexes for other locations are ignored
+        assert MetadataIndex(path, '/other').packages('cat', 1) is None
+
+    def test_corrupt(self, tmpdir):
+        path = tmpdir.join('index')
+        path.write('{garbage')
+        index = MetadataIndex(str(path), '/var/db/pkg')
+        assert index.packages('cat', 1) is None
+        index.set_packages('cat', 1, [])
+        index.save()
+        assert MetadataIndex(str(path), '/var/db/pkg').packages('cat', 1) == []
+
+    def test_unwritable(self, tmpdir):
+        index = MetadataIndex('/dev/null/index', '/var/db/pkg')
+        index.set_packages('cat', 1, [])
+        # failures are ignored
+        index.save()
+
+
+class TestOwnersIndex:
+
+    def test_lookup(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        path = str(tmpdir.join('cache', 'owners'))
+        mk_pkg(vdb, 'cat/a-1', CONTENTS=(
+            'dir /usr\nobj /usr/bin/a d41d8cd98f00b204e9800998ecf8427e 1\n'
+            'sym /usr/bin/with space -> a 1'))
+        mk_pkg(vdb, 'cat/b-1', CONTENTS=(
+            'dir /usr\nobj /usr/bin/b d41d8cd98f00b204e9800998ecf8427e 1'))
+        mk_pkg(vdb, 'cat/c-1')
+
+        index = OwnersIndex(path, str(vdb))
+        assert index.owners('/usr') == ('cat/a-1', 'cat/b-1')
+        assert index.owners('/usr/bin/a') == ('cat/a-1',)
+        assert index.owners('/usr/bin/with space') == ('cat/a-1',)
+        assert index.owners('/usr/bin') == ()
+        assert index.owners('/') == ()
+        assert index.owners('/zzz') == ()
+        assert sorted(index.iter_owners(lambda x: x.startswith('/usr/bin/'))) == [
+            ('/usr/bin/a', 'cat/a-1'), ('/usr/bin/b', 'cat/b-1'),
+            ('/usr/bin/with space', 'cat/a-1')]
+        assert os.path.exists(path)
+
+        # changed pkgs are reindexed on load, others are reused
+        mk_pkg(vdb, 'cat/c-1', CONTENTS='obj /usr/bin/a d41d8cd98f00b204e9800998ecf8427e 1')
+        os.utime(str(vdb.join('cat', 'c-1')), ns=(1, 1))
+        vdb.join('cat', 'b-1').remove()
+        index = OwnersIndex(path, str(vdb))
+        assert index.owners('/usr/bin/a') == ('cat/a-1', 'cat/c-1')
+        assert index.owners('/usr/bin/b') == ()
+        assert index.owners('/usr') == ('cat/a-1',)
+
+    def test_unwritable(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        mk_pkg(vdb, 'cat/a-1', CONTENTS='dir /usr')
+        index = OwnersIndex('/dev/null/owners', str(vdb))
+        assert index.owners('/usr') == ('cat/a-1',)
+        assert list(index.iter_owners(bool)) == [('/usr', 'cat/a-1')]
+
+
+class TestIndexedTree:
+
+    def test_metadata(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        cache = str(tmpdir.join('cache'))
+        path = mk_pkg(vdb, 'cat/pkg-1', SLOT='1', USE='a b', EAPI='7', repository='gentoo')
+
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        pkg = repo.match(VersionedCPV('cat/pkg-1').versioned_atom)[0]
+        assert pkg.slot == '1'
+        assert pkg.use == frozenset(['a', 'b'])
+        assert pkg.source_repository == 'gentoo'
+        repo._index.save()
+        assert os.path.exists(os.path.join(cache, 'index'))
+
+        # later runs pull indexed keys from the index
+        st = os.stat(path)
+        os.unlink(os.path.join(path, 'SLOT'))
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        pkg = repo.match(VersionedCPV('cat/pkg-1').versioned_atom)[0]
+        assert pkg.slot == '1'
+        assert str(pkg.eapi) == '7'
+        repo._index.save()
+
+        # directory changes invalidate entries
+        with open(os.path.join(path, 'SLOT'), 'w') as f:
+            f.write('2\n')
+        os.utime(path, ns=(1, 1))
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        pkg = repo.match(VersionedCPV('cat/pkg-1').versioned_atom)[0]
+        assert pkg.slot == '2'
+
+    def test_listing(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        cache = str(tmpdir.join('cache'))
+        mk_pkg(vdb, 'cat/pkg-1', SLOT='0')
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        assert [x.cpvstr for x in repo] == ['cat/pkg-1']
+        repo._index.save()
+
+        mk_pkg(vdb, 'cat/pkg-2', SLOT='0')
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        assert sorted(x.cpvstr for x in repo) == ['cat/pkg-1', 'cat/pkg-2']
+
+    def test_update_index(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        cache = str(tmpdir.join('cache'))
+        mk_pkg(vdb, 'cat/pkg-1', SLOT='0')
+        repo = ondisk.tree(str(vdb), cache_location=cache)
+        pkg = list(repo)[0]
+
+        repo._update_index(pkg)
+        index = MetadataIndex(os.path.join(cache, 'index'), str(vdb))
+        mtime = os.stat(str(vdb.join('cat', 'pkg-1'))).st_mtime_ns
+        assert index.metadata('cat', 'pkg-1', mtime)['SLOT'] == '0'
+
+        repo._update_index(pkg, removed=True)
+        index = MetadataIndex(os.path.join(cache, 'index'), str(vdb))
+        assert index.metadata('cat', 'pkg-1', mtime) is None
+
+    def test_disabled(self, tmpdir):
+        repo = ondisk.tree(str(tmpdir.mkdir('vdb')), disable_cache=True)
+        assert repo._index is None
+        assert repo._owners is None
+
+    @pytest.mark.parametrize('disable_cache', (False, True))
+    def test_file_owners(self, tmpdir, disable_cache):
+        vdb = tmpdir.mkdir('vdb')
+        mk_pkg(vdb, 'cat/a-1', SLOT='0', CONTENTS='dir /usr\ndir /usr/lib')
+        mk_pkg(vdb, 'cat/b-1', SLOT='0', CONTENTS='dir /usr')
+        repo = ondisk.tree(
+            str(vdb), cache_location=str(tmpdir.join('cache')), disable_cache=disable_cache)
+        assert sorted(repo.file_owners('/usr/')) == ['cat/a-1', 'cat/b-1']
+        assert repo.file_owners('/usr/lib') == ('cat/a-1',)
+        assert sorted(repo.iter_file_owners(lambda x: x.endswith('lib'))) == [
+            ('/usr/lib', 'cat/a-1')]
+
+    def test_update_owners(self, tmpdir):
+        vdb = tmpdir.mkdir('vdb')
+        mk_pkg(vdb, 'cat/a-1', SLOT='0', CONTENTS='dir /usr')
+        repo = ondisk.tree(str(vdb), cache_location=str(tmpdir.join('cache')))
+        assert repo.file_owners('/usr') == ('cat/a-1',)
+        mk_pkg(vdb, 'cat/b-1', SLOT='0', CONTENTS='dir /usr')
+        repo._update_index(VersionedCPV('cat/b-1'))
+        assert repo.file_owners('/usr') == ('cat/a-1', 'cat/b-1')